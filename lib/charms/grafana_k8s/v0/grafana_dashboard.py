@@ -175,6 +175,7 @@ It will be returned in the format of:
 The consuming charm should decompress the dashboard.
 """
 
+import base64
 import hashlib
 import json
 import logging
@@ -183,10 +184,9 @@ import os
 import platform
 import re
 import subprocess
-import tempfile
 import uuid
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import yaml
 from ops.charm import (
@@ -210,6 +210,11 @@ from ops.framework import (
 from ops.model import Relation
 from cosl import LZMABase64
 
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+
 # The unique Charmhub library identifier, never change it
 LIBID = "c49eb9c7dfef40c7b6235ebd67010a3f"
 
@@ -218,8 +223,10 @@ LIBAPI = 0
 
 # Increment this PATCH version before using `charmcraft publish-lib` or reset
 # to 0 if you are raising the major API version
-
-LIBPATCH = 37
+#
+# Forked from the published LIBPATCH 37 with the performance changes of this charm, see
+# CONTRIBUTING.md. `charmcraft fetch-lib` would revert them until they are upstreamed.
+LIBPATCH = 38
 
 logger = logging.getLogger(__name__)
 
@@ -228,6 +235,10 @@ DEFAULT_RELATION_NAME = "grafana-dashboard"
 DEFAULT_PEER_NAME = "grafana"
 RELATION_INTERFACE_NAME = "grafana_dashboard"
 
+# LZMA preset used to compress dashboards. Compared with the preset 3 of LZMABase64, it is
+# about twice as fast and uses a much smaller dictionary, for a few percent larger output.
+DASHBOARD_LZMA_PRESET = 0
+
 TOPOLOGY_TEMPLATE_DROPDOWNS = [  # type: ignore
     {
         "allValue": ".*",
@@ -457,6 +468,45 @@ class InvalidDirectoryPathError(Exception):
         super().__init__(self.message)
 
 
+def _compress_dashboard(content: Union[str, bytes]) -> str:
+    """LZMA-compress and base64-encode a dashboard for relation data and stored state.
+
+    This is `LZMABase64.compress` at a faster preset. Every preset produces a standard xz
+    stream, and decompression does not depend on the preset, so `LZMABase64.decompress` on
+    either side of the relation reads it, including in earlier versions of this library.
+
+    The output differs from `LZMABase64.compress`, so it must not be used where an id is derived
+    from it, such as the "prog:" dashboard ids, which would otherwise change on upgrade.
+    """
+    if not isinstance(content, bytes):
+        content = content.encode("utf-8")
+    return base64.b64encode(lzma.compress(content, preset=DASHBOARD_LZMA_PRESET)).decode("utf-8")
+
+
+def _json_loads(content: str) -> Any:
+    """Parse a dashboard, with orjson if it is available.
+
+    Anything orjson rejects, such as integers beyond 64 bits, is parsed again by `json`, which
+    either reads it or raises the usual `json.JSONDecodeError`.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(content)
+
+
+def _json_dumps(obj: Any) -> str:
+    """Serialize a dashboard, with orjson if it is available, and `json` otherwise."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode("utf-8")
+        except orjson.JSONEncodeError:
+            pass
+    return json.dumps(obj)
+
+
 def _resolve_dir_against_charm_path(charm: CharmBase, *path_elements: str) -> str:
     """Resolve the provided path items against the directory of the main file.
 
@@ -544,9 +594,63 @@ def _validate_relation_by_interface_and_direction(
         raise Exception("Unexpected RelationDirection: {}".format(expected_relation_role))
 
 
+# Grab values from inside of [], and the same for any offsets
+_RANGE_RE = re.compile(r"\[(?P<value>.*?)\]")
+_OFFSET_RE = re.compile(r"offset\s+(?P<value>-?\s*[$\w]+)")
+
+
 class CharmedDashboard:
     """A helper class for handling dashboards on the requirer (Grafana) side."""
 
+    @classmethod
+    def _render(cls, content: str, template: dict, transformer: "CosTool") -> str:
+        """Render a dashboard template for Grafana in a single pass.
+
+        The dashboard is parsed once, given its alternative uid if it has none, templated and
+        injected with the Juju topology of the template, then serialized once.
+
+        Args:
+            content: dashboard content as a string
+            template: the template the content comes from
+            transformer: a 'CosTool' instance
+        Returns:
+            the rendered dashboard content.
+        """
+        dict_content = _json_loads(content)
+
+        if not dict_content.get("uid", None) and "dashboard_alt_uid" in template:
+            dict_content["uid"] = template["dashboard_alt_uid"]
+
+        panels = cls._walk_panels(dict_content)
+        cls._convert_dict_fields(dict_content, panels, template.get("inject_dropdowns", True))
+
+        topology = template.get("juju_topology", {})
+        if topology:
+            cls._inject_panel_labels(panels, topology, transformer)
+
+        return _json_dumps(dict_content)
+
+    @classmethod
+    def _walk_panels(cls, dict_content: dict) -> List[dict]:
+        """Return every panel of a dashboard, including the panels nested in rows.
+
+        Collapsed rows hold their panels in the row panel itself, and dashboards from before
+        Grafana 5 hold them in a top-level `rows` list.
+        """
+        containers = [dict_content]
+        containers.extend(row for row in dict_content.get("rows") or [] if isinstance(row, dict))
+
+        panels = []
+        while containers:
+            container = containers.pop(0)
+            for panel in container.get("panels") or []:
+                if not isinstance(panel, dict):
+                    continue
+                panels.append(panel)
+                if panel.get("type") == "row":
+                    containers.append(panel)
+        return panels
+
     @classmethod
     def _convert_dashboard_fields(cls, content: str, inject_dropdowns: bool = True) -> str:
         """Make sure values are present for Juju topology.
@@ -555,6 +659,20 @@ class CharmedDashboard:
         a variable for Prometheus.
         """
         dict_content = json.loads(content)
+        cls._convert_dict_fields(dict_content, cls._walk_panels(dict_content), inject_dropdowns)
+        return json.dumps(dict_content)
+
+    @classmethod
+    def _convert_dict_fields(
+        cls, dict_content: dict, panels: List[dict], inject_dropdowns: bool = True
+    ) -> None:
+        """Insert the Juju topology and datasource variables into a parsed dashboard.
+
+        Args:
+            dict_content: the parsed dashboard, updated in place
+            panels: every panel of the dashboard, as returned by `_walk_panels`
+            inject_dropdowns: whether to insert the Juju topology variables
+        """
         datasources = {}
         existing_templates = False
 
@@ -590,12 +708,11 @@ class CharmedDashboard:
                 if d not in dict_content["templating"]["list"]:
                     dict_content["templating"]["list"].insert(0, d)
 
-        dict_content = cls._replace_template_fields(dict_content, datasources, existing_templates)
-        return json.dumps(dict_content)
+        cls._replace_template_fields(dict_content, panels, datasources, existing_templates)
 
     @classmethod
-    def _replace_template_fields(  # noqa: C901
-        cls, dict_content: dict, datasources: dict, existing_templates: bool
+    def _replace_template_fields(
+        cls, dict_content: dict, panels: List[dict], datasources: dict, existing_templates: bool
     ) -> dict:
         """Make templated fields get cleaned up afterwards.
 
@@ -605,28 +722,11 @@ class CharmedDashboard:
         used_replacements = []  # type: List[str]
 
         # If any existing datasources match types we know, or we didn't find
-        # any templating variables at all, template them.
+        # any templating variables at all, template them, including panels nested under rows.
         if datasources or not existing_templates:
-            panels = dict_content.get("panels", {})
-            if panels:
-                dict_content["panels"] = cls._template_panels(
-                    panels, replacements, used_replacements, existing_templates, datasources
-                )
-
-            # Find panels nested under rows
-            rows = dict_content.get("rows", {})
-            if rows:
-                for row_idx, row in enumerate(rows):
-                    if "panels" in row.keys():
-                        rows[row_idx]["panels"] = cls._template_panels(
-                            row["panels"],
-                            replacements,
-                            used_replacements,
-                            existing_templates,
-                            datasources,
-                        )
-
-                dict_content["rows"] = rows
+            cls._template_panels(
+                panels, replacements, used_replacements, existing_templates, datasources
+            )
 
         # Finally, go back and pop off the templates we stubbed out
         deletions = []
@@ -642,12 +742,12 @@ class CharmedDashboard:
     @classmethod
     def _template_panels(
         cls,
-        panels: dict,
+        panels: List[dict],
         replacements: dict,
         used_replacements: list,
         existing_templates: bool,
         datasources: dict,
-    ) -> dict:
+    ) -> List[dict]:
         """Iterate through a `panels` object and template it appropriately."""
         # Go through all the panels. If they have a datasource set, AND it's one
         # that we can convert to ${lokids} or ${prometheusds}, by stripping off the
@@ -768,10 +868,20 @@ class CharmedDashboard:
             dashboard content with replaced values.
         """
         dict_content = json.loads(content)
+        cls._inject_panel_labels(cls._walk_panels(dict_content), topology, transformer)
+        return json.dumps(dict_content)
 
-        if "panels" not in dict_content.keys():
-            return json.dumps(dict_content)
+    @classmethod
+    def _inject_panel_labels(
+        cls, panels: List[dict], topology: dict, transformer: "CosTool"
+    ) -> None:
+        """Inject Juju topology into the expressions of parsed panels, in place.
 
+        Args:
+            panels: panels as returned by `_walk_panels`
+            topology: a dict containing topology values
+            transformer: a 'CosTool' instance
+        """
         # Go through all the panels and inject topology labels
         # Panels may have more than one 'target' where the expressions live, so that must be
         # accounted for. Additionally, `promql-transform` does not necessarily gracefully handle
@@ -779,18 +889,15 @@ class CharmedDashboard:
         #
         # It is not a certainty that the `datasource` field will necessarily reflect the type, so
         # operate on all fields.
-        panels = dict_content["panels"]
         topology_with_prefix = {"juju_{}".format(k): v for k, v in topology.items()}
 
-        # We need to use an index so we can insert the changed element back later
-        for panel_idx, panel in enumerate(panels):
-            if not isinstance(panel, dict):
-                continue
-
-            # Use the index to insert it back in the same location
-            panels[panel_idx] = cls._modify_panel(panel, topology_with_prefix, transformer)
-
-        return json.dumps(dict_content)
+        # Collect the expressions of every panel first, so that they are all transformed in one
+        # batch per query type instead of one cos-tool call per panel target
+        cls._transform_targets(
+            [target for panel in panels for target in cls._panel_targets(panel)],
+            topology_with_prefix,
+            transformer,
+        )
 
     @classmethod
     def _modify_panel(cls, panel: dict, topology: dict, transformer: "CosTool") -> dict:
@@ -803,92 +910,170 @@ class CharmedDashboard:
         Returns:
             the panel with injected values
         """
-        if "targets" not in panel.keys():
-            return panel
+        cls._transform_targets(cls._panel_targets(panel), topology, transformer)
+        return panel
+
+    @classmethod
+    def _panel_targets(cls, panel: dict) -> List[dict]:
+        """Return the targets of a panel which have an expression cos-tool can transform.
 
-        # Pre-compile a regular expression to grab values from inside of []
-        range_re = re.compile(r"\[(?P<value>.*?)\]")
-        # Do the same for any offsets
-        offset_re = re.compile(r"offset\s+(?P<value>-?\s*[$\w]+)")
+        Each returned item references the target to update, the query type, the expression with
+        Grafana variables in ranges and offsets replaced by placeholders, and the values which
+        were taken out, to be put back in order once the expression is transformed.
+
+        Args:
+            panel: a dashboard panel as a dict
+        Returns:
+            a list of dicts, one for each target with an expression
+        """
+        if "targets" not in panel.keys() or "datasource" not in panel.keys():
+            return []
 
         known_datasources = {"${prometheusds}": "promql", "${lokids}": "logql"}
 
-        targets = panel["targets"]
+        if isinstance(panel["datasource"], str):
+            if panel["datasource"] not in known_datasources:
+                return []
+            querytype = known_datasources[panel["datasource"]]
+        elif isinstance(panel["datasource"], dict):
+            if panel["datasource"]["uid"] not in known_datasources:
+                return []
+            querytype = known_datasources[panel["datasource"]["uid"]]
+        else:
+            logger.error("Unknown datasource format: skipping")
+            return []
 
-        # We need to use an index so we can insert the changed element back later
-        for idx, target in enumerate(targets):
+        panel_targets = []
+        for target in panel["targets"]:
             # If there's no expression, we don't need to do anything
             if "expr" not in target.keys():
                 continue
             expr = target["expr"]
 
-            if "datasource" not in panel.keys():
-                continue
-
-            if isinstance(panel["datasource"], str):
-                if panel["datasource"] not in known_datasources:
-                    continue
-                querytype = known_datasources[panel["datasource"]]
-            elif isinstance(panel["datasource"], dict):
-                if panel["datasource"]["uid"] not in known_datasources:
-                    continue
-                querytype = known_datasources[panel["datasource"]["uid"]]
-            else:
-                logger.error("Unknown datasource format: skipping")
-                continue
-
             # Capture all values inside `[]` into a list which we'll iterate over later to
             # put them back in-order. Then apply the regex again and replace everything with
             # `[5y]` so promql/parser will take it.
             #
             # Then do it again for offsets
-            range_values = [m.group("value") for m in range_re.finditer(expr)]
-            expr = range_re.sub(r"[5y]", expr)
+            range_values = [m.group("value") for m in _RANGE_RE.finditer(expr)]
+            expr = _RANGE_RE.sub(r"[5y]", expr)
 
-            offset_values = [m.group("value") for m in offset_re.finditer(expr)]
-            expr = offset_re.sub(r"offset 5y", expr)
-            # Retrieve the new expression (which may be unchanged if there were no label
+            offset_values = [m.group("value") for m in _OFFSET_RE.finditer(expr)]
+            expr = _OFFSET_RE.sub(r"offset 5y", expr)
+
+            panel_targets.append(
+                {
+                    "target": target,
+                    "querytype": querytype,
+                    "expr": expr,
+                    "range_values": range_values,
+                    "offset_values": offset_values,
+                }
+            )
+        return panel_targets
+
+    @classmethod
+    def _transform_targets(
+        cls, panel_targets: List[dict], topology: dict, transformer: "CosTool"
+    ) -> None:
+        """Inject Juju topology into the expressions of panel targets, in one batch per type.
+
+        Args:
+            panel_targets: targets as returned by `_panel_targets`
+            topology: a dict containing topology values
+            transformer: a 'CosTool' instance
+        """
+        for querytype in {t["querytype"] for t in panel_targets}:
+            batch = [t for t in panel_targets if t["querytype"] == querytype]
+            # Retrieve the new expressions (which may be unchanged if there were no label
             # matchers in the expression, or if tt was unable to be parsed like logql. It's
             # virtually impossible to tell from any datasource "name" in a panel what the
             # actual type is without re-implementing a complete dashboard parser, but no
             # harm will some from passing invalid promql -- we'll just get the original back.
             #
-            replacement = transformer.inject_label_matchers(expr, topology, querytype)
+            replacements = transformer.inject_label_matchers_batch(
+                [t["expr"] for t in batch], topology, querytype
+            )
 
-            if replacement == target["expr"]:
-                # promql-transform caught an error. Move on
-                continue
+            for panel_target, replacement in zip(batch, replacements):
+                target = panel_target["target"]
+                if replacement == target["expr"]:
+                    # promql-transform caught an error. Move on
+                    continue
 
-            # Go back and substitute values in [] which were pulled out
-            # Enumerate with an index... again. The same regex is ok, since it will still match
-            # `[(.*?)]`, which includes `[5y]`, our placeholder
-            for i, match in enumerate(range_re.finditer(replacement)):
-                # Replace one-by-one, starting from the left. We build the string back with
-                # `str.replace(string_to_replace, replacement_value, count)`. Limit the count
-                # to one, since we are going through one-by-one through the list we saved earlier
-                # in `range_values`.
-                replacement = replacement.replace(
-                    "[{}]".format(match.group("value")),
-                    "[{}]".format(range_values[i]),
-                    1,
-                )
+                # Go back and substitute values in [] which were pulled out
+                # Enumerate with an index... again. The same regex is ok, since it will still
+                # match `[(.*?)]`, which includes `[5y]`, our placeholder
+                for i, match in enumerate(_RANGE_RE.finditer(replacement)):
+                    # Replace one-by-one, starting from the left. We build the string back with
+                    # `str.replace(string_to_replace, replacement_value, count)`. Limit the count
+                    # to one, since we are going through one-by-one through the list we saved
+                    # earlier in `range_values`.
+                    replacement = replacement.replace(
+                        "[{}]".format(match.group("value")),
+                        "[{}]".format(panel_target["range_values"][i]),
+                        1,
+                    )
 
-            for i, match in enumerate(offset_re.finditer(replacement)):
-                # Replace one-by-one, starting from the left. We build the string back with
-                # `str.replace(string_to_replace, replacement_value, count)`. Limit the count
-                # to one, since we are going through one-by-one through the list we saved earlier
-                # in `range_values`.
-                replacement = replacement.replace(
-                    "offset {}".format(match.group("value")),
-                    "offset {}".format(offset_values[i]),
-                    1,
-                )
+                for i, match in enumerate(_OFFSET_RE.finditer(replacement)):
+                    # Same as above, for the values saved in `offset_values`
+                    replacement = replacement.replace(
+                        "offset {}".format(match.group("value")),
+                        "offset {}".format(panel_target["offset_values"][i]),
+                        1,
+                    )
 
-            # Use the index to insert it back in the same location
-            targets[idx]["expr"] = replacement
+                target["expr"] = replacement
 
-        panel["targets"] = targets
-        return panel
+
+def _render_cache_key(template: dict, injector: Optional[str] = None) -> str:
+    """Return a key of everything a dashboard template is rendered from on the consumer side.
+
+    The content is hashed in its compressed form, so that the key can be computed without
+    decompressing the template. The key also holds the version of this library, which does the
+    rendering, and the label matcher injector, which is the cos-tool binary if any, as the
+    expressions are left unchanged without it.
+    """
+    return json.dumps(
+        [
+            "{}.{}".format(LIBAPI, LIBPATCH),
+            injector,
+            hashlib.sha256(template.get("content", "").encode("utf-8")).hexdigest(),
+            template.get("inject_dropdowns", True),
+            template.get("juju_topology", {}),
+            template.get("dashboard_alt_uid"),
+        ],
+        sort_keys=True,
+    )
+
+
+def _set_dashboards_data(databag, templates: dict, force: bool = False) -> bool:
+    """Publish dashboard templates to a relation databag, unless it already holds them.
+
+    The published data carries a random uuid, so that a write always reaches the other side of
+    the relation. Comparing the serialized data would then never skip a write, so the templates
+    are compared instead. Every relation-set wakes the remote units with a relation-changed hook.
+
+    Args:
+        databag: the relation data of the application
+        templates: the dashboard templates to publish
+        force: write the templates even if they are already published
+
+    Returns:
+        True if the dashboards were written.
+    """
+    if not force:
+        try:
+            published = json.loads(databag.get("dashboards", "{}"))
+        except json.JSONDecodeError:
+            published = {}
+        if published.get("templates") == templates:
+            return False
+
+    # It's completely ridiculous to add a UUID, but if we don't have some
+    # pseudo-random value, this never makes it across 'juju set-state'
+    databag["dashboards"] = json.dumps({"templates": templates, "uuid": str(uuid.uuid4())})
+    return True
 
 
 def _type_convert_stored(obj):
@@ -1039,8 +1224,9 @@ class GrafanaDashboardProvider(Object):
         self._relation_name = relation_name
         self._dashboards_path = dashboards_path
 
-        # No peer relation bucket we can rely on providers, keep StoredState here, too
-        self._stored.set_default(dashboard_templates={})  # type: ignore
+        # No peer relation bucket we can rely on providers, keep StoredState here, too. The
+        # index holds the size, mtime and hashes of scanned files, to skip unchanged ones.
+        self._stored.set_default(dashboard_templates={}, dashboard_index={})  # type: ignore
 
         self.framework.observe(self._charm.on.leader_elected, self._update_all_dashboards_from_dir)
         self.framework.observe(self._charm.on.upgrade_charm, self._update_all_dashboards_from_dir)
@@ -1069,6 +1255,8 @@ class GrafanaDashboardProvider(Object):
         # that the stored state is there when this unit becomes leader.
         stored_dashboard_templates: Any = self._stored.dashboard_templates  # pyright: ignore
 
+        # The id is taken from the encoded dashboard, so it is compressed with the preset of
+        # LZMABase64 rather than the dashboard preset, which would change the id on upgrade
         encoded_dashboard = LZMABase64.compress(content)
 
         # Use as id the first chars of the encoded dashboard, so that
@@ -1103,43 +1291,79 @@ class GrafanaDashboardProvider(Object):
         """Trigger the re-evaluation of the data on all relations."""
         if self._charm.unit.is_leader():
             for dashboard_relation in self._charm.model.relations[self._relation_name]:
-                self._upset_dashboards_on_relation(dashboard_relation)
+                self._upset_dashboards_on_relation(dashboard_relation, force=True)
 
     def _update_all_dashboards_from_dir(
         self, _: Optional[HookEvent] = None, inject_dropdowns: bool = True
     ) -> None:
-        """Scans the built-in dashboards and updates relations with changes."""
+        """Scans the built-in dashboards and updates relations with changes.
+
+        Files are only read and compressed again if their size, mtime or content changed since
+        they were last scanned, as recorded in an index kept with the stored dashboards. Stored
+        state and relation data are only written if the resulting dashboards differ.
+        """
         # Update of storage must be done irrespective of leadership, so
         # that the stored state is there when this unit becomes leader.
-
-        # Ensure we do not leave outdated dashboards by removing from stored all
-        # the encoded dashboards that start with "file/".
         if self._dashboards_path:
             stored_dashboard_templates: Any = self._stored.dashboard_templates  # pyright: ignore
-
-            for dashboard_id in list(stored_dashboard_templates.keys()):
-                if dashboard_id.startswith("file:"):
-                    del stored_dashboard_templates[dashboard_id]
+            index = _type_convert_stored(self._stored.dashboard_index)  # pyright: ignore
 
             # Path.glob uses fnmatch on the backend, which is pretty limited, so use a
             # custom function for the filter
             def _is_dashboard(p: Path) -> bool:
                 return p.is_file() and p.name.endswith((".json", ".json.tmpl", ".tmpl"))
 
+            dashboards = {}
+            new_index = {}
             for path in filter(_is_dashboard, Path(self._dashboards_path).glob("*")):
-                # path = Path(path)
                 id = "file:{}".format(path.stem)
-                stored_dashboard_templates[id] = self._content_to_dashboard_object(
-                    LZMABase64.compress(path.read_bytes()), inject_dropdowns
+                content, new_index[str(path)] = self._scan_dashboard_file(
+                    path, index.get(str(path), {}), stored_dashboard_templates.get(id)
                 )
-                stored_dashboard_templates[id]["dashboard_alt_uid"] = self._generate_alt_uid(id)
-
-            self._stored.dashboard_templates = stored_dashboard_templates
+                dashboards[id] = self._content_to_dashboard_object(content, inject_dropdowns)
+                dashboards[id]["dashboard_alt_uid"] = self._generate_alt_uid(id)
+
+            # Ensure we do not leave outdated dashboards by replacing all the stored
+            # dashboards that start with "file:", but only if anything changed.
+            current = {
+                dashboard_id: _type_convert_stored(dashboard)
+                for dashboard_id, dashboard in stored_dashboard_templates.items()
+                if dashboard_id.startswith("file:")
+            }
+            if current != dashboards:
+                for dashboard_id in current:
+                    del stored_dashboard_templates[dashboard_id]
+                for dashboard_id, dashboard in dashboards.items():
+                    stored_dashboard_templates[dashboard_id] = dashboard
+            if index != new_index:
+                self._stored.dashboard_index = new_index
 
             if self._charm.unit.is_leader():
                 for dashboard_relation in self._charm.model.relations[self._relation_name]:
                     self._upset_dashboards_on_relation(dashboard_relation)
 
+    @staticmethod
+    def _scan_dashboard_file(path: Path, entry: dict, stored: Any) -> Tuple[str, dict]:
+        """Return the compressed content of a dashboard file, and its new index entry.
+
+        The stored content is reused while the file is unchanged, as long as it is the content
+        the index entry was recorded for.
+        """
+        stat = path.stat()
+        content = stored["content"] if stored else None
+        if content is None or entry.get("encoded") != hashlib.sha256(content.encode()).hexdigest():
+            entry = {}
+
+        if (entry.get("size"), entry.get("mtime_ns")) != (stat.st_size, stat.st_mtime_ns):
+            data = path.read_bytes()
+            sha256 = hashlib.sha256(data).hexdigest()
+            if entry.get("sha256") != sha256:
+                content = _compress_dashboard(data)
+            entry = {"sha256": sha256, "encoded": hashlib.sha256(content.encode()).hexdigest()}
+
+        entry.update({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+        return content, entry  # type: ignore
+
     def _generate_alt_uid(self, key: str) -> str:
         """Generate alternative uid for dashboards.
 
@@ -1214,16 +1438,13 @@ class GrafanaDashboardProvider(Object):
                     valid=valid, errors=errors
                 )
 
-    def _upset_dashboards_on_relation(self, relation: Relation) -> None:
-        """Update the dashboards in the relation data bucket."""
-        # It's completely ridiculous to add a UUID, but if we don't have some
-        # pseudo-random value, this never makes it across 'juju set-state'
-        stored_data = {
-            "templates": _type_convert_stored(self._stored.dashboard_templates),  # pyright: ignore
-            "uuid": str(uuid.uuid4()),
-        }
-
-        relation.data[self._charm.app]["dashboards"] = json.dumps(stored_data)
+    def _upset_dashboards_on_relation(self, relation: Relation, force: bool = False) -> None:
+        """Update the dashboards in the relation data bucket, if they changed or if forced."""
+        _set_dashboards_data(
+            relation.data[self._charm.app],
+            _type_convert_stored(self._stored.dashboard_templates),  # pyright: ignore
+            force=force,
+        )
 
     def _content_to_dashboard_object(self, content: str, inject_dropdowns: bool = True) -> Dict:
         return {
@@ -1425,27 +1646,31 @@ class GrafanaDashboardConsumer(Object):
         rendered_dashboards = []
         relation_has_invalid_dashboards = False
 
+        # Dashboards already rendered for this relation, by the key stored when they were
+        # rendered, so that unchanged templates skip decompressing and rendering again.
+        injector = self._tranformer._tool_version() if self._tranformer.path else None
+        render_cache = {
+            dashboard["render_key"]: dashboard["content"]
+            for dashboard in self._get_stored_dashboards(relation.id)
+            if dashboard.get("valid") and dashboard.get("content") and dashboard.get("render_key")
+        }
+
         for _, (fname, template) in enumerate(templates.items()):
-            content = None
+            render_key = _render_cache_key(template, injector)
+            content = render_cache.get(render_key)
             error = None
-            topology = template.get("juju_topology", {})
-            try:
-                content = LZMABase64.decompress(template["content"])
-                inject_dropdowns = template.get("inject_dropdowns", True)
-                content = self._manage_dashboard_uid(content, template)
-                content = CharmedDashboard._convert_dashboard_fields(content, inject_dropdowns)
-
-                if topology:
-                    content = CharmedDashboard._inject_labels(content, topology, self._tranformer)
-
-                content = LZMABase64.compress(content)
-            except lzma.LZMAError as e:
-                error = str(e)
-                relation_has_invalid_dashboards = True
-            except json.JSONDecodeError as e:
-                error = str(e.msg)
-                logger.warning("Invalid JSON in Grafana dashboard: {}".format(fname))
-                continue
+            if content is None:
+                try:
+                    content = LZMABase64.decompress(template["content"])
+                    content = CharmedDashboard._render(content, template, self._tranformer)
+                    content = _compress_dashboard(content)
+                except lzma.LZMAError as e:
+                    error = str(e)
+                    relation_has_invalid_dashboards = True
+                except json.JSONDecodeError as e:
+                    error = str(e.msg)
+                    logger.warning("Invalid JSON in Grafana dashboard: {}".format(fname))
+                    continue
 
             # Prepend the relation name and ID to the dashboard ID to avoid clashes with
             # multiple relations with apps from the same charm, or having dashboards with
@@ -1458,6 +1683,7 @@ class GrafanaDashboardConsumer(Object):
                     "template": template,
                     "valid": (error is None),
                     "error": error,
+                    "render_key": render_key,
                 }
             )
 
@@ -1665,15 +1891,11 @@ class GrafanaDashboardAggregator(Object):
 
     def _update_remote_grafana(self, _: Optional[RelationEvent] = None) -> None:
         """Push dashboards to the downstream Grafana relation."""
-        # It's still ridiculous to add a UUID here, but needed
-        stored_data = {
-            "templates": _type_convert_stored(self._stored.dashboard_templates),  # pyright: ignore
-            "uuid": str(uuid.uuid4()),
-        }
+        templates = _type_convert_stored(self._stored.dashboard_templates)  # pyright: ignore
 
         if self._charm.unit.is_leader():
             for grafana_relation in self.model.relations[self._grafana_relation]:
-                grafana_relation.data[self._charm.app]["dashboards"] = json.dumps(stored_data)
+                _set_dashboards_data(grafana_relation.data[self._charm.app], templates)
 
     def remove_dashboards(self, event: RelationBrokenEvent) -> None:
         """Remove a dashboard if the relation is broken."""
@@ -1687,14 +1909,11 @@ class GrafanaDashboardAggregator(Object):
         for id in app_ids:
             del self._stored.dashboard_templates[id]  # type: ignore
 
-        stored_data = {
-            "templates": _type_convert_stored(self._stored.dashboard_templates),  # pyright: ignore
-            "uuid": str(uuid.uuid4()),
-        }
+        templates = _type_convert_stored(self._stored.dashboard_templates)  # pyright: ignore
 
         if self._charm.unit.is_leader():
             for grafana_relation in self.model.relations[self._grafana_relation]:
-                grafana_relation.data[self._charm.app]["dashboards"] = json.dumps(stored_data)
+                _set_dashboards_data(grafana_relation.data[self._charm.app], templates)
 
     # Yes, this has a fair amount of branching. It's not that complex, though
     def _strip_existing_datasources(self, dash: dict) -> dict:  # noqa: C901
@@ -1818,6 +2037,7 @@ class GrafanaDashboardAggregator(Object):
 
             from jinja2 import DebugUndefined, Template
 
+            # Compressed with the preset of LZMABase64, as the id is taken from the output
             content = LZMABase64.compress(
                 Template(dash, undefined=DebugUndefined).render(datasource=r"${prometheusds}")  # type: ignore
             )
@@ -1858,7 +2078,7 @@ class GrafanaDashboardAggregator(Object):
                 if event.app.name in path.name:  # type: ignore
                     id = "file:{}".format(path.stem)
                     builtins[id] = self._content_to_dashboard_object(
-                        LZMABase64.compress(path.read_bytes()), event
+                        _compress_dashboard(path.read_bytes()), event
                     )
 
         return builtins
@@ -1883,6 +2103,10 @@ class GrafanaDashboardAggregator(Object):
         }
 
 
+# cos-tool reads files by path, so content to validate is piped to it through stdin
+_STDIN_PATH = "/dev/stdin"
+
+
 class CosTool:
     """Uses cos-tool to inject label matchers into alert rule expressions and validate rules."""
 
@@ -1898,16 +2122,19 @@ class CosTool:
         if self._disabled:
             return None
         if not self._path:
-            self._path = self._get_tool_path()
+            # Stored on the class, so that every instance in this dispatch shares the lookup
+            type(self)._path = self._get_tool_path()
             if not self._path:
                 logger.debug("Skipping injection of juju topology as label matchers")
-                self._disabled = True
+                type(self)._disabled = True
         return self._path
 
     def apply_label_matchers(self, rules: dict, type: str) -> dict:
         """Will apply label matchers to the expression of all alerts in all supplied groups."""
         if not self.path:
             return rules
+        # Rules sharing the same topology are transformed together in one batch
+        batches = {}  # type: Dict[Tuple[Tuple[str, str], ...], List[dict]]
         for group in rules["groups"]:
             rules_in_group = group.get("rules", [])
             for rule in rules_in_group:
@@ -1924,7 +2151,14 @@ class CosTool:
                     if label in rule["labels"]:
                         topology[label] = rule["labels"][label]
 
-                rule["expr"] = self.inject_label_matchers(rule["expr"], topology, type)
+                batches.setdefault(tuple(topology.items()), []).append(rule)
+
+        for topology_items, batch in batches.items():
+            expressions = self.inject_label_matchers_batch(
+                [rule["expr"] for rule in batch], dict(topology_items), type
+            )
+            for rule, expression in zip(batch, expressions):
+                rule["expr"] = expression
         return rules
 
     def validate_alert_rules(self, rules: dict) -> Tuple[bool, str]:
@@ -1933,33 +2167,29 @@ class CosTool:
             logger.debug("`cos-tool` unavailable. Not validating alert correctness.")
             return True, ""
 
-        with tempfile.TemporaryDirectory() as tmpdir:
-            rule_path = Path(tmpdir + "/validate_rule.yaml")
-
-            # Smash "our" rules format into what upstream actually uses, which is more like:
-            #
-            # groups:
-            #   - name: foo
-            #     rules:
-            #       - alert: SomeAlert
-            #         expr: up
-            #       - alert: OtherAlert
-            #         expr: up
-            transformed_rules = {"groups": []}  # type: ignore
-            for rule in rules["groups"]:
-                transformed = {"name": str(uuid.uuid4()), "rules": [rule]}
-                transformed_rules["groups"].append(transformed)
-
-            rule_path.write_text(yaml.dump(transformed_rules))
-
-            args = [str(self.path), "validate", str(rule_path)]
-            # noinspection PyBroadException
-            try:
-                self._exec(args)
-                return True, ""
-            except subprocess.CalledProcessError as e:
-                logger.debug("Validating the rules failed: %s", e.output)
-                return False, ", ".join([line for line in e.output if "error validating" in line])
+        # Smash "our" rules format into what upstream actually uses, which is more like:
+        #
+        # groups:
+        #   - name: foo
+        #     rules:
+        #       - alert: SomeAlert
+        #         expr: up
+        #       - alert: OtherAlert
+        #         expr: up
+        transformed_rules = {"groups": []}  # type: ignore
+        for rule in rules["groups"]:
+            transformed = {"name": str(uuid.uuid4()), "rules": [rule]}
+            transformed_rules["groups"].append(transformed)
+
+        # The rules are piped to cos-tool, rather than written to a temporary file
+        args = [str(self.path), "validate", _STDIN_PATH]
+        # noinspection PyBroadException
+        try:
+            self._exec(args, stdin=yaml.dump(transformed_rules))
+            return True, ""
+        except subprocess.CalledProcessError as e:
+            logger.debug("Validating the rules failed: %s", e.output)
+            return False, ", ".join([line for line in e.output if "error validating" in line])
 
     def inject_label_matchers(self, expression: str, topology: dict, type: str) -> str:
         """Add label matchers to an expression."""
@@ -1988,6 +2218,28 @@ class CosTool:
             logger.debug('Applying the expression failed: "%s", falling back to the original', e)
             return expression
 
+    def inject_label_matchers_batch(
+        self, expressions: List[str], topology: dict, type: str
+    ) -> List[str]:
+        """Add label matchers to a list of expressions, returning them in the same order.
+
+        `cos-tool transform` takes a single expression per invocation, so each distinct
+        expression is transformed once and the result reused for its duplicates. Dashboards and
+        rule files commonly repeat the same expression across panels and rules.
+        """
+        if not topology or not self.path:
+            return list(expressions)
+        transformed = {}  # type: Dict[str, str]
+        for expression in expressions:
+            if expression not in transformed:
+                transformed[expression] = self.inject_label_matchers(expression, topology, type)
+        return [transformed[expression] for expression in expressions]
+
+    def _tool_version(self) -> str:
+        """Identify the cos-tool binary, so that results of another binary are not reused."""
+        stat = Path(str(self.path)).stat()
+        return "{}-{}".format(stat.st_size, stat.st_mtime_ns)
+
     def _get_tool_path(self) -> Optional[Path]:
         arch = platform.machine()
         arch = "amd64" if arch == "x86_64" else arch
@@ -2002,7 +2254,12 @@ class CosTool:
             logger.debug('Could not locate cos-tool at: "{}"'.format(res))
         return None
 
-    def _exec(self, cmd) -> str:
-        result = subprocess.run(cmd, check=True, stdout=subprocess.PIPE)
+    def _exec(self, cmd, stdin: Optional[str] = None) -> str:
+        result = subprocess.run(
+            cmd,
+            check=True,
+            input=stdin.encode("utf-8") if stdin is not None else None,
+            stdout=subprocess.PIPE,
+        )
         output = result.stdout.decode("utf-8").strip()
         return output
@@ -508,7 +508,6 @@ import platform
 import re
 import socket
 import subprocess
-import tempfile
 import typing
 from copy import deepcopy
 from gzip import GzipFile
@@ -546,7 +545,10 @@ LIBAPI = 1
 
 # Increment this PATCH version before using `charmcraft publish-lib` or reset
 # to 0 if you are raising the major API version
-LIBPATCH = 13
+#
+# Forked from the published LIBPATCH 13 with the performance changes of this charm, see
+# CONTRIBUTING.md. `charmcraft fetch-lib` would revert them until they are upstreamed.
+LIBPATCH = 14
 
 PYDEPS = ["cosl"]
 
@@ -2660,6 +2662,10 @@ class LogForwarder(ConsumerBase):
         return endpoints
 
 
+# cos-tool reads files by path, so content to validate is piped to it through stdin
+_STDIN_PATH = "/dev/stdin"
+
+
 class CosTool:
     """Uses cos-tool to inject label matchers into alert rule expressions and validate rules."""
 
@@ -2675,16 +2681,19 @@ class CosTool:
         if self._disabled:
             return None
         if not self._path:
-            self._path = self._get_tool_path()
+            # Stored on the class, so that every instance in this dispatch shares the lookup
+            type(self)._path = self._get_tool_path()
             if not self._path:
                 logger.debug("Skipping injection of juju topology as label matchers")
-                self._disabled = True
+                type(self)._disabled = True
         return self._path
 
     def apply_label_matchers(self, rules) -> dict:
         """Will apply label matchers to the expression of all alerts in all supplied groups."""
         if not self.path:
             return rules
+        # Rules sharing the same topology are transformed together in one batch
+        batches = {}  # type: Dict[Tuple[Tuple[str, str], ...], List[dict]]
         for group in rules["groups"]:
             rules_in_group = group.get("rules", [])
             for rule in rules_in_group:
@@ -2701,7 +2710,14 @@ class CosTool:
                     if label in rule["labels"]:
                         topology[label] = rule["labels"][label]
 
-                rule["expr"] = self.inject_label_matchers(rule["expr"], topology)
+                batches.setdefault(tuple(topology.items()), []).append(rule)
+
+        for topology_items, batch in batches.items():
+            expressions = self.inject_label_matchers_batch(
+                [rule["expr"] for rule in batch], dict(topology_items)
+            )
+            for rule, expression in zip(batch, expressions):
+                rule["expr"] = expression
         return rules
 
     def validate_alert_rules(self, rules: dict) -> Tuple[bool, str]:
@@ -2710,31 +2726,28 @@ class CosTool:
             logger.debug("`cos-tool` unavailable. Not validating alert correctness.")
             return True, ""
 
-        with tempfile.TemporaryDirectory() as tmpdir:
-            rule_path = Path(tmpdir + "/validate_rule.yaml")
-
-            # Smash "our" rules format into what upstream actually uses, which is more like:
-            #
-            # groups:
-            #   - name: foo
-            #     rules:
-            #       - alert: SomeAlert
-            #         expr: up
-            #       - alert: OtherAlert
-            #         expr: up
-            transformed_rules = {"groups": []}  # type: ignore
-            for rule in rules["groups"]:
-                transformed_rules["groups"].append(rule)
-
-            rule_path.write_text(yaml.dump(transformed_rules))
-            args = [str(self.path), "--format", "logql", "validate", str(rule_path)]
-            # noinspection PyBroadException
-            try:
-                self._exec(args)
-                return True, ""
-            except subprocess.CalledProcessError as e:
-                logger.debug("Validating the rules failed: %s", e.output)
-                return False, ", ".join([line for line in e.output if "error validating" in line])
+        # Smash "our" rules format into what upstream actually uses, which is more like:
+        #
+        # groups:
+        #   - name: foo
+        #     rules:
+        #       - alert: SomeAlert
+        #         expr: up
+        #       - alert: OtherAlert
+        #         expr: up
+        transformed_rules = {"groups": []}  # type: ignore
+        for rule in rules["groups"]:
+            transformed_rules["groups"].append(rule)
+
+        # The rules are piped to cos-tool, rather than written to a temporary file
+        args = [str(self.path), "--format", "logql", "validate", _STDIN_PATH]
+        # noinspection PyBroadException
+        try:
+            self._exec(args, stdin=yaml.dump(transformed_rules))
+            return True, ""
+        except subprocess.CalledProcessError as e:
+            logger.debug("Validating the rules failed: %s", e.output)
+            return False, ", ".join([line for line in e.output if "error validating" in line])
 
     def inject_label_matchers(self, expression, topology) -> str:
         """Add label matchers to an expression."""
@@ -2743,6 +2756,7 @@ class CosTool:
         if not self.path:
             logger.debug("`cos-tool` unavailable. Leaving expression unchanged: %s", expression)
             return expression
+
         args = [str(self.path), "--format", "logql", "transform"]
         args.extend(
             ["--label-matcher={}={}".format(key, value) for key, value in topology.items()]
@@ -2751,11 +2765,26 @@ class CosTool:
         args.extend(["{}".format(expression)])
         # noinspection PyBroadException
         try:
-            return self._exec(args)
+            transformed = self._exec(args)
         except subprocess.CalledProcessError as e:
             logger.debug('Applying the expression failed: "%s", falling back to the original', e)
             print('Applying the expression failed: "{}", falling back to the original'.format(e))
             return expression
+        return transformed
+
+    def inject_label_matchers_batch(self, expressions: List[str], topology: dict) -> List[str]:
+        """Add label matchers to a list of expressions, returning them in the same order.
+
+        `cos-tool transform` takes a single expression per invocation, so each distinct
+        expression is transformed once and the result reused for its duplicates.
+        """
+        if not topology or not self.path:
+            return list(expressions)
+        transformed = {}  # type: Dict[str, str]
+        for expression in expressions:
+            if expression not in transformed:
+                transformed[expression] = self.inject_label_matchers(expression, topology)
+        return [transformed[expression] for expression in expressions]
 
     def _get_tool_path(self) -> Optional[Path]:
         arch = platform.processor()
@@ -2771,8 +2800,13 @@ class CosTool:
             logger.debug('Could not locate cos-tool at: "{}"'.format(res))
         return None
 
-    def _exec(self, cmd) -> str:
-        result = subprocess.run(cmd, check=True, stdout=subprocess.PIPE)
+    def _exec(self, cmd, stdin: Optional[str] = None) -> str:
+        result = subprocess.run(
+            cmd,
+            check=True,
+            input=stdin.encode("utf-8") if stdin is not None else None,
+            stdout=subprocess.PIPE,
+        )
         output = result.stdout.decode("utf-8").strip()
         return output
 
@@ -322,7 +322,6 @@ of Metrics provider charms hold eponymous information.
 
 """  # noqa: W505
 
-import copy
 import hashlib
 import ipaddress
 import json
@@ -332,14 +331,14 @@ import platform
 import re
 import socket
 import subprocess
-import tempfile
+import threading
 from collections import defaultdict
 from pathlib import Path
 from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 from urllib.parse import urlparse
 
 import yaml
-from cosl import JujuTopology
+from cosl import JujuTopology, LZMABase64
 from cosl.rules import AlertRules
 from ops.charm import CharmBase, RelationRole
 from ops.framework import (
@@ -362,7 +361,10 @@ LIBAPI = 0
 
 # Increment this PATCH version before using `charmcraft publish-lib` or reset
 # to 0 if you are raising the major API version
-LIBPATCH = 47
+#
+# Forked from the published LIBPATCH 47 with the performance changes of this charm, see
+# CONTRIBUTING.md. `charmcraft fetch-lib` would revert them until they are upstreamed.
+LIBPATCH = 48
 
 PYDEPS = ["cosl"]
 
@@ -399,6 +401,24 @@ RELATION_INTERFACE_NAME = "prometheus_scrape"
 
 DEFAULT_ALERT_RULES_RELATIVE_PATH = "./src/prometheus_alert_rules"
 
+# Compact encoding of the large relation data values, negotiated between both sides: the
+# consumer lists the encodings it reads under ENCODINGS_KEY in its application data, and a
+# provider which opted in then sends the value of a key such as "alert_rules" LZMA-compressed
+# and base64-encoded under "alert_rules_z" instead. Providers fall back to plain JSON for
+# consumers which do not list the encoding.
+ENCODINGS_KEY = "supported_encodings"
+COMPRESSED_ENCODING = "lzma-base64-v1"
+COMPRESSED_KEY_SUFFIX = "_z"
+
+# Seconds to wait for the FQDN of the host, used as unit address when the bind address is not
+# a valid IP address, before falling back to the hostname
+FQDN_LOOKUP_TIMEOUT = 5.0
+_fqdn = None  # type: Optional[str]
+
+
+# A wildcard scrape target, expanded into a job per unit, such as "*:8080"
+_WILDCARD_TARGET_RE = re.compile(r"\*(?:(:\d+))?")
+
 
 class PrometheusConfig:
     """A namespace for utility functions for manipulating the prometheus config dict."""
@@ -476,7 +496,17 @@ class PrometheusConfig:
                 must be constructed.
             topology: optional arg for adding topology labels to scrape targets.
         """
-        # hosts = self._relation_hosts(relation)
+        # Everything which only depends on the unit is computed once, instead of once per job
+        topology_labels = topology.label_matcher_dict if topology else {}
+        units = [
+            (
+                unit_hostname,
+                unit_path,
+                "-" + unit_name.split("/")[-1],
+                {**topology_labels, "juju_unit": unit_name},
+            )
+            for unit_name, (unit_hostname, unit_path) in hosts.items()
+        ]
 
         modified_scrape_jobs = []
         for job in scrape_jobs:
@@ -488,32 +518,28 @@ class PrometheusConfig:
             # into a static_config per target
             non_wildcard_static_configs = []
 
+            job_name = job.get("job_name", "unnamed-job")
+            metrics_path = job.get("metrics_path") or "/metrics"
+            relabel_configs = job.get("relabel_configs", [])
+
             for static_config in static_configs:
                 targets = static_config.get("targets")
                 if not targets:
                     continue
 
-                # All non-wildcard targets remain in the same static_config
-                non_wildcard_targets = []
-
                 # All wildcard targets are extracted to a job per unit. If multiple wildcard
                 # targets are specified, they remain in the same static_config (per unit).
+                # All non-wildcard targets remain in the same static_config.
                 wildcard_targets = []
-
+                non_wildcard_targets = []
                 for target in targets:
-                    match = re.compile(r"\*(?:(:\d+))?").match(target)
-                    if match:
-                        # This is a wildcard target.
-                        # Need to expand into separate jobs and remove it from this job here
+                    if _WILDCARD_TARGET_RE.match(target):
                         wildcard_targets.append(target)
                     else:
-                        # This is not a wildcard target. Copy it over into its own static_config.
                         non_wildcard_targets.append(target)
 
-                # All non-wildcard targets remain in the same static_config
                 if non_wildcard_targets:
-                    non_wildcard_static_config = static_config.copy()
-                    non_wildcard_static_config["targets"] = non_wildcard_targets
+                    non_wildcard_static_config = {**static_config, "targets": non_wildcard_targets}
 
                     if topology:
                         # When non-wildcard targets (aka fully qualified hostnames) are specified,
@@ -521,52 +547,52 @@ class PrometheusConfig:
                         # for such a target. Therefore labeling with Juju topology, excluding the
                         # unit name.
                         non_wildcard_static_config["labels"] = {
-                            **topology.label_matcher_dict,
-                            **non_wildcard_static_config.get("labels", {}),
+                            **topology_labels,
+                            **static_config.get("labels", {}),
                         }
 
                     non_wildcard_static_configs.append(non_wildcard_static_config)
 
-                # Extract wildcard targets into individual jobs
-                if wildcard_targets:
-                    for unit_name, (unit_hostname, unit_path) in hosts.items():
-                        modified_job = job.copy()
-                        modified_job["static_configs"] = [static_config.copy()]
-                        modified_static_config = modified_job["static_configs"][0]
-                        modified_static_config["targets"] = [
-                            target.replace("*", unit_hostname) for target in wildcard_targets
-                        ]
+                if not wildcard_targets:
+                    continue
 
-                        unit_num = unit_name.split("/")[-1]
-                        job_name = modified_job.get("job_name", "unnamed-job") + "-" + unit_num
-                        modified_job["job_name"] = job_name
-                        modified_job["metrics_path"] = unit_path + (
-                            job.get("metrics_path") or "/metrics"
-                        )
+                # Extract wildcard targets into individual jobs, built in one pass over the units
+                static_config_labels = static_config.get("labels", {})
+                for unit_hostname, unit_path, unit_suffix, unit_labels in units:
+                    modified_static_config = {
+                        **static_config,
+                        "targets": [
+                            target.replace("*", unit_hostname) for target in wildcard_targets
+                        ],
+                    }
+                    modified_job = {
+                        **job,
+                        "static_configs": [modified_static_config],
+                        "job_name": job_name + unit_suffix,
+                        "metrics_path": unit_path + metrics_path,
+                    }
 
-                        if topology:
-                            # Add topology labels
-                            modified_static_config["labels"] = {
-                                **topology.label_matcher_dict,
-                                **{"juju_unit": unit_name},
-                                **modified_static_config.get("labels", {}),
-                            }
+                    if topology:
+                        # Add topology labels
+                        modified_static_config["labels"] = {**unit_labels, **static_config_labels}
 
-                            # Instance relabeling for topology should be last in order.
-                            modified_job["relabel_configs"] = modified_job.get(
-                                "relabel_configs", []
-                            ) + [PrometheusConfig.topology_relabel_config_wildcard]
+                        # Instance relabeling for topology should be last in order.
+                        modified_job["relabel_configs"] = relabel_configs + [
+                            PrometheusConfig.topology_relabel_config_wildcard
+                        ]
 
-                        modified_scrape_jobs.append(modified_job)
+                    modified_scrape_jobs.append(modified_job)
 
             if non_wildcard_static_configs:
-                modified_job = job.copy()
-                modified_job["static_configs"] = non_wildcard_static_configs
-                modified_job["metrics_path"] = modified_job.get("metrics_path") or "/metrics"
+                modified_job = {
+                    **job,
+                    "static_configs": non_wildcard_static_configs,
+                    "metrics_path": metrics_path,
+                }
 
                 if topology:
                     # Instance relabeling for topology should be last in order.
-                    modified_job["relabel_configs"] = modified_job.get("relabel_configs", []) + [
+                    modified_job["relabel_configs"] = relabel_configs + [
                         PrometheusConfig.topology_relabel_config
                     ]
 
@@ -714,6 +740,78 @@ class MetricsEndpointProviderEvents(ObjectEvents):
     invalid_scrape_job = EventSource(InvalidScrapeJobEvent)
 
 
+def _update_databag(databag, data: Dict[str, str]) -> bool:
+    """Write values to a relation databag, skipping the keys which already hold them.
+
+    Every relation-set wakes the remote units with a relation-changed hook, so values are
+    compared with the content of the databag first, whatever the version of ops in use. As in
+    Juju, a missing key is the same as an empty value.
+
+    Args:
+        databag: the relation data of a unit or application
+        data: the values to write, by key
+
+    Returns:
+        True if anything was written.
+    """
+    changes = {key: value for key, value in data.items() if databag.get(key, "") != value}
+    if changes:
+        databag.update(changes)
+    return bool(changes)
+
+
+def _encoded_relation_data(data: Dict[str, str], compress: bool) -> Dict[str, str]:
+    """Encode values for a relation databag, either as plain JSON or compressed.
+
+    The key of the other encoding is emptied, which removes it from the databag, so that the
+    other side never reads a stale value.
+
+    Values are not split into chunks over several keys. Juju limits the size of the whole
+    databag rather than of each value, so chunking would not let more data through, while
+    ops already passes relation data to relation-set through a file rather than the command
+    line. Compression is what keeps large scrape jobs and alert rules within the limit.
+    """
+    encoded = {}
+    for key, value in data.items():
+        compressed_key = key + COMPRESSED_KEY_SUFFIX
+        if compress:
+            encoded.update({key: "", compressed_key: LZMABase64.compress(value)})
+        else:
+            encoded.update({key: value, compressed_key: ""})
+    return encoded
+
+
+def _decoded_relation_value(databag, key: str, default: str) -> str:
+    """Read a relation data value which may have been sent compressed."""
+    compressed = databag.get(key + COMPRESSED_KEY_SUFFIX)
+    if compressed:
+        return LZMABase64.decompress(compressed)
+    return databag.get(key, default)
+
+
+def _get_fqdn() -> str:
+    """Return the FQDN of the host, looked up at most once per process.
+
+    `socket.getfqdn` blocks on DNS, which can take seconds with slow resolvers, so the lookup
+    runs in a background thread for at most `FQDN_LOOKUP_TIMEOUT` seconds. If it does not
+    complete in time, the hostname is used instead.
+    """
+    global _fqdn
+    if _fqdn is None:
+        result = []  # type: List[str]
+        lookup = threading.Thread(target=lambda: result.append(socket.getfqdn()), daemon=True)
+        lookup.start()
+        lookup.join(FQDN_LOOKUP_TIMEOUT)
+        if result:
+            _fqdn = result[0]
+        else:
+            logger.warning(
+                "FQDN lookup timed out after %ss, using the hostname", FQDN_LOOKUP_TIMEOUT
+            )
+            _fqdn = socket.gethostname()
+    return _fqdn
+
+
 def _type_convert_stored(obj):
     """Convert Stored* to their appropriate types, recursively."""
     if isinstance(obj, StoredList):
@@ -859,6 +957,7 @@ class MetricsEndpointConsumer(Object):
     """A Prometheus based Monitoring service."""
 
     on = MonitoringEvents()  # pyright: ignore
+    _stored = StoredState()
 
     def __init__(self, charm: CharmBase, relation_name: str = DEFAULT_RELATION_NAME):
         """A Prometheus based Monitoring service.
@@ -890,11 +989,19 @@ class MetricsEndpointConsumer(Object):
         self._charm = charm
         self._relation_name = relation_name
         self._tool = CosTool(self._charm)
+        # Serialized scrape jobs and alert rules of each relation, by relation id, along with a
+        # digest of the relation data they were computed from, kept across hooks
+        self._stored.set_default(relation_jobs={}, relation_alerts={})
         events = self._charm.on[relation_name]
         self.framework.observe(events.relation_changed, self._on_metrics_provider_relation_changed)
         self.framework.observe(
             events.relation_departed, self._on_metrics_provider_relation_departed
         )
+        # Providers only send compressed data once they see it is supported, so it is advertised
+        # as early as possible, and again once a new version of this library is running
+        self.framework.observe(events.relation_joined, self._advertise_encodings)
+        self.framework.observe(self._charm.on.leader_elected, self._advertise_encodings)
+        self.framework.observe(self._charm.on.upgrade_charm, self._advertise_encodings)
 
     def _on_metrics_provider_relation_changed(self, event):
         """Handle changes with related metrics providers.
@@ -910,8 +1017,19 @@ class MetricsEndpointConsumer(Object):
         """
         rel_id = event.relation.id
 
+        self._advertise_encodings()
+
         self.on.targets_changed.emit(relation_id=rel_id)
 
+    def _advertise_encodings(self, _=None):
+        """List the encodings of relation data this consumer reads, in every relation."""
+        if not self._charm.unit.is_leader():
+            return
+        for relation in self._charm.model.relations[self._relation_name]:
+            _update_databag(
+                relation.data[self._charm.app], {ENCODINGS_KEY: json.dumps([COMPRESSED_ENCODING])}
+            )
+
     def _on_metrics_provider_relation_departed(self, event):
         """Update job config when a metrics provider departs.
 
@@ -930,32 +1048,77 @@ class MetricsEndpointConsumer(Object):
     def jobs(self) -> list:
         """Fetch the list of scrape jobs.
 
+        The jobs of each relation, and the result of their validation, are kept serialized in
+        stored state across hooks, along with a digest of the relation data they were computed
+        from. Only the relations whose data changed since are computed and validated again.
+        The jobs are deserialized anew on each call, so that callers may change them.
+
         Returns:
             A list consisting of all the static scrape configurations
             for each related `MetricsEndpointProvider` that has specified
             its scrape targets.
         """
         scrape_jobs = []
+        stored = self._stored.relation_jobs  # pyright: ignore
+        relation_ids = set()
 
         for relation in self._charm.model.relations[self._relation_name]:
-            static_scrape_jobs = self._static_scrape_config(relation)
-            if static_scrape_jobs:
-                # Duplicate job names will cause validate_scrape_jobs to fail.
-                # Therefore we need to dedupe here and after all jobs are collected.
-                static_scrape_jobs = _dedupe_job_names(static_scrape_jobs)
-                try:
-                    self._tool.validate_scrape_jobs(static_scrape_jobs)
-                except subprocess.CalledProcessError as e:
-                    if self._charm.unit.is_leader():
-                        data = json.loads(relation.data[self._charm.app].get("event", "{}"))
-                        data["scrape_job_errors"] = str(e)
-                        relation.data[self._charm.app]["event"] = json.dumps(data)
-                else:
-                    scrape_jobs.extend(static_scrape_jobs)
+            key = str(relation.id)
+            relation_ids.add(key)
+            digest = self._relation_digest(relation)
+            entry = stored.get(key)
+            if not entry or entry["digest"] != digest:
+                entry = self._relation_jobs(relation, digest)
+                stored[key] = entry
+
+            if entry["error"] is None:
+                scrape_jobs.extend(json.loads(entry["jobs"]))
+            elif self._charm.unit.is_leader():
+                data = json.loads(relation.data[self._charm.app].get("event", "{}"))
+                data["scrape_job_errors"] = entry["error"]
+                _update_databag(relation.data[self._charm.app], {"event": json.dumps(data)})
+
+        # Departed relations are dropped along the way
+        for key in set(stored.keys()) - relation_ids:
+            del stored[key]
+
+        return _dedupe_job_names(scrape_jobs)
+
+    def _relation_jobs(self, relation: Relation, digest: str) -> dict:
+        """Compute and validate the scrape jobs of a relation.
+
+        Args:
+            relation: the relation with a metrics provider
+            digest: the digest of the relation data, as returned by `_relation_digest`
+
+        Returns:
+            A dict with the digest, the serialized deduplicated jobs of the relation, and the
+            validation error, which is None if the jobs are valid.
+        """
+        static_scrape_jobs = self._static_scrape_config(relation)
+        error = None
+        if static_scrape_jobs:
+            # Duplicate job names will cause validate_scrape_jobs to fail.
+            # Therefore we need to dedupe here and after all jobs are collected.
+            static_scrape_jobs = _dedupe_job_names(static_scrape_jobs)
+            try:
+                self._tool.validate_scrape_jobs(static_scrape_jobs)
+            except subprocess.CalledProcessError as e:
+                error = str(e)
+        return {"digest": digest, "jobs": json.dumps(static_scrape_jobs), "error": error}
 
-        scrape_jobs = _dedupe_job_names(scrape_jobs)
+    def _relation_digest(self, relation: Relation) -> str:
+        """Return a hash of everything the scrape jobs of a relation are computed from.
 
-        return scrape_jobs
+        That is the application and unit data of the remote side of the relation, and the
+        cos-tool binary which validates the jobs.
+        """
+        units = {unit.name: dict(relation.data[unit]) for unit in relation.units}
+        app_data = dict(relation.data[relation.app]) if relation.app else {}
+        tool = self._tool._tool_version() if self._tool.path else None
+        return hashlib.sha256(
+            json.dumps([app_data, units, tool], sort_keys=True).encode()
+        ).hexdigest()
 
     @property
     def alerts(self) -> dict:
@@ -995,57 +1158,124 @@ class MetricsEndpointConsumer(Object):
             container.push(path, rules, make_dirs=True)
         ```
 
+        The alert rules of each relation, once labeled and validated, are kept serialized in
+        stored state across hooks, along with a digest of the relation data they come from, and
+        only the relations whose data changed since are processed again. The rules are
+        deserialized anew on each call, so that callers may change them. `alerts_digest`
+        changes whenever the returned alerts do, so that callers may skip rewriting the rule
+        files while it stays the same.
+
         Returns:
             A dictionary mapping the Juju topology identifier of the source charm to
             its list of alert rule groups.
         """
-        alerts = {}  # type: Dict[str, dict] # mapping b/w juju identifiers and alert rule files
+        return {
+            identifier: json.loads(alert_rules)
+            for identifier, alert_rules in self._collect_alerts().items()
+        }
+
+    @property
+    def alerts_digest(self) -> str:
+        """A hash of the alerts returned by `alerts`, which changes whenever they do."""
+        alerts = self._collect_alerts()
+        return hashlib.sha256(json.dumps(alerts, sort_keys=True).encode()).hexdigest()
+
+    def _collect_alerts(self) -> Dict[str, str]:
+        """Return the serialized alert rules of all relations, reusing those kept in stored state.
+
+        Only the relations whose data changed since their rules were stored are processed again.
+        """
+        alerts = {}  # type: Dict[str, str] # mapping b/w juju identifiers and alert rule files
+        stored = self._stored.relation_alerts  # pyright: ignore
+        relation_ids = set()
         for relation in self._charm.model.relations[self._relation_name]:
             if not relation.units or not relation.app:
                 continue
 
-            alert_rules = json.loads(relation.data[relation.app].get("alert_rules", "{}"))
-            if not alert_rules:
-                continue
+            key = str(relation.id)
+            relation_ids.add(key)
+            digest = self._relation_alerts_digest(relation)
+            entry = stored.get(key)
+            if not entry or entry["digest"] != digest:
+                entry = self._relation_alerts(relation, digest)
+                stored[key] = entry
 
-            alert_rules = self._inject_alert_expr_labels(alert_rules)
+            if entry["error"] is not None:
+                if self._charm.unit.is_leader():
+                    data = json.loads(relation.data[self._charm.app].get("event", "{}"))
+                    data["errors"] = entry["error"]
+                    _update_databag(relation.data[self._charm.app], {"event": json.dumps(data)})
+            elif entry["identifier"]:
+                alerts[entry["identifier"]] = entry["alert_rules"]
 
-            identifier, topology = self._get_identifier_by_alert_rules(alert_rules)
-            if not topology:
-                try:
-                    scrape_metadata = json.loads(relation.data[relation.app]["scrape_metadata"])
-                    identifier = JujuTopology.from_dict(scrape_metadata).identifier
-
-                except KeyError as e:
-                    logger.debug(
-                        "Relation %s has no 'scrape_metadata': %s",
-                        relation.id,
-                        e,
-                    )
+        # Departed relations are dropped along the way
+        for key in set(stored.keys()) - relation_ids:
+            del stored[key]
 
-            if not identifier:
-                logger.error(
-                    "Alert rules were found but no usable group or identifier was present."
+        return alerts
+
+    def _relation_alerts(self, relation: Relation, digest: str) -> dict:
+        """Label and validate the alert rules of a relation.
+
+        Args:
+            relation: the relation with a metrics provider
+            digest: the digest of the relation data, as returned by `_relation_alerts_digest`
+
+        Returns:
+            A dict with the digest, the identifier of the alert rules and the serialized labeled
+            rules, which are None if the relation has no usable rules, and the validation error,
+            which is None if the rules are valid.
+        """
+        entry = {"digest": digest, "identifier": None, "alert_rules": None, "error": None}
+
+        alert_rules = json.loads(
+            _decoded_relation_value(relation.data[relation.app], "alert_rules", "{}")
+        )
+        if not alert_rules:
+            return entry
+
+        alert_rules = self._inject_alert_expr_labels(alert_rules)
+
+        identifier, topology = self._get_identifier_by_alert_rules(alert_rules)
+        if not topology:
+            try:
+                scrape_metadata = json.loads(relation.data[relation.app]["scrape_metadata"])
+                identifier = JujuTopology.from_dict(scrape_metadata).identifier
+
+            except KeyError as e:
+                logger.debug(
+                    "Relation %s has no 'scrape_metadata': %s",
+                    relation.id,
+                    e,
                 )
-                continue
 
-            # We need to append the relation info to the identifier. This is to allow for cases for there are two
-            # relations which eventually scrape the same application. Issue #551.
-            identifier = f"{identifier}_{relation.name}_{relation.id}"
+        if not identifier:
+            logger.error("Alert rules were found but no usable group or identifier was present.")
+            return entry
 
-            alerts[identifier] = alert_rules
+        # We need to append the relation info to the identifier. This is to allow for cases for there are two
+        # relations which eventually scrape the same application. Issue #551.
+        entry["identifier"] = f"{identifier}_{relation.name}_{relation.id}"
 
-            _, errmsg = self._tool.validate_alert_rules(alert_rules)
-            if errmsg:
-                if alerts[identifier]:
-                    del alerts[identifier]
-                if self._charm.unit.is_leader():
-                    data = json.loads(relation.data[self._charm.app].get("event", "{}"))
-                    data["errors"] = errmsg
-                    relation.data[self._charm.app]["event"] = json.dumps(data)
-                continue
+        _, errmsg = self._tool.validate_alert_rules(alert_rules)
+        if errmsg:
+            entry["error"] = errmsg
+        else:
+            entry["alert_rules"] = json.dumps(alert_rules)
+        return entry
 
-        return alerts
+    def _relation_alerts_digest(self, relation: Relation) -> str:
+        """Return a hash of everything the alert rules of a relation are computed from.
+
+        That is the alert rules and scrape metadata of the remote application, and the
+        cos-tool binary which labels and validates the rules.
+        """
+        app_data = relation.data[relation.app]
+        keys = ["alert_rules", "alert_rules" + COMPRESSED_KEY_SUFFIX, "scrape_metadata"]
+        tool = self._tool._tool_version() if self._tool.path else None
+        return hashlib.sha256(
+            json.dumps([[app_data.get(key) for key in keys], tool]).encode()
+        ).hexdigest()
 
     def _get_identifier_by_alert_rules(
         self, rules: dict
@@ -1104,39 +1334,39 @@ class MetricsEndpointConsumer(Object):
         if "groups" not in rules:
             return rules
 
-        modified_groups = []
+        # Rules sharing the same topology, which usually means all the rules of a relation, are
+        # transformed together in one batch
+        batches = {}  # type: Dict[Tuple[Tuple[str, str], ...], List[dict]]
         for group in rules["groups"]:
-            # Copy off rules, so we don't modify an object we're iterating over
-            rules_copy = group["rules"]
-            for idx, rule in enumerate(rules_copy):
+            for rule in group["rules"]:
                 labels = rule.get("labels")
+                if not labels:
+                    continue
+
+                try:
+                    topology = JujuTopology(
+                        # Don't try to safely get required constructor fields. There's already
+                        # a handler for KeyErrors
+                        model_uuid=labels["juju_model_uuid"],
+                        model=labels["juju_model"],
+                        application=labels["juju_application"],
+                        unit=labels.get("juju_unit", ""),
+                        charm_name=labels.get("juju_charm", ""),
+                    )
+                except KeyError:
+                    # Some required JujuTopology key is missing. Just move on.
+                    continue
+
+                batches.setdefault(tuple(topology.alert_expression_dict.items()), []).append(rule)
+
+        for topology_items, batch in batches.items():
+            expressions = self._tool.inject_label_matchers_batch(
+                [re.sub(r"%%juju_topology%%,?", "", rule["expr"]) for rule in batch],
+                dict(topology_items),
+            )
+            for rule, expression in zip(batch, expressions):
+                rule["expr"] = expression
 
-                if labels:
-                    try:
-                        topology = JujuTopology(
-                            # Don't try to safely get required constructor fields. There's already
-                            # a handler for KeyErrors
-                            model_uuid=labels["juju_model_uuid"],
-                            model=labels["juju_model"],
-                            application=labels["juju_application"],
-                            unit=labels.get("juju_unit", ""),
-                            charm_name=labels.get("juju_charm", ""),
-                        )
-
-                        # Inject topology and put it back in the list
-                        rule["expr"] = self._tool.inject_label_matchers(
-                            re.sub(r"%%juju_topology%%,?", "", rule["expr"]),
-                            topology.alert_expression_dict,
-                        )
-                    except KeyError:
-                        # Some required JujuTopology key is missing. Just move on.
-                        pass
-
-                    group["rules"][idx] = rule
-
-            modified_groups.append(group)
-
-        rules["groups"] = modified_groups
         return rules
 
     def _static_scrape_config(self, relation) -> list:
@@ -1158,7 +1388,9 @@ class MetricsEndpointConsumer(Object):
         if not relation.units:
             return []
 
-        scrape_configs = json.loads(relation.data[relation.app].get("scrape_jobs", "[]"))
+        scrape_configs = json.loads(
+            _decoded_relation_value(relation.data[relation.app], "scrape_jobs", "[]")
+        )
 
         if not scrape_configs:
             return []
@@ -1226,40 +1458,34 @@ def _dedupe_job_names(jobs: List[dict]):
 
     Additionally, fully de-duplicate any identical jobs.
 
+    The hash is taken over the JSON of a job in its own key order, as in earlier versions of
+    this library, so that the names of renamed jobs do not change on upgrade. Jobs are grouped
+    by name in one pass, and only the jobs which are renamed are copied; the others are
+    returned as is.
+
     Args:
         jobs: A list of prometheus scrape jobs
     """
-    jobs_copy = copy.deepcopy(jobs)
-
-    # Convert to a dict with job names as keys
-    # I think this line is O(n^2) but it should be okay given the list sizes
-    jobs_dict = {
-        job["job_name"]: list(filter(lambda x: x["job_name"] == job["job_name"], jobs_copy))
-        for job in jobs_copy
-    }
+    # Group the jobs by name, in the order the names first appear
+    jobs_by_name = defaultdict(list)  # type: Dict[str, List[dict]]
+    for job in jobs:
+        jobs_by_name[job["job_name"]].append(job)
 
-    # If multiple jobs have the same name, convert the name to "name_<hash-of-job>"
-    for key in jobs_dict:
-        if len(jobs_dict[key]) > 1:
-            for job in jobs_dict[key]:
-                job_json = json.dumps(job)
-                hashed = hashlib.sha256(job_json.encode()).hexdigest()
-                job["job_name"] = "{}_{}".format(job["job_name"], hashed)
-    new_jobs = []
-    for key in jobs_dict:
-        new_jobs.extend(list(jobs_dict[key]))
-
-    # Deduplicate jobs which are equal
-    # Again this in O(n^2) but it should be okay
     deduped_jobs = []
-    seen = []
-    for job in new_jobs:
-        job_json = json.dumps(job)
-        hashed = hashlib.sha256(job_json.encode()).hexdigest()
-        if hashed in seen:
+    for name, named_jobs in jobs_by_name.items():
+        if len(named_jobs) == 1:
+            deduped_jobs.append(named_jobs[0])
             continue
-        seen.append(hashed)
-        deduped_jobs.append(job)
+
+        # If multiple jobs have the same name, convert the name to "name_<hash-of-job>". Jobs
+        # which are equal have the same hash, so only the first of them is kept.
+        seen = set()
+        for job in named_jobs:
+            hashed = hashlib.sha256(json.dumps(job).encode()).hexdigest()
+            if hashed in seen:
+                continue
+            seen.add(hashed)
+            deduped_jobs.append(dict(job, job_name="{}_{}".format(name, hashed)))
 
     return deduped_jobs
 
@@ -1299,6 +1525,7 @@ class MetricsEndpointProvider(Object):
     """A metrics endpoint for Prometheus."""
 
     on = MetricsEndpointProviderEvents()  # pyright: ignore
+    _stored = StoredState()
 
     def __init__(
         self,
@@ -1309,6 +1536,7 @@ class MetricsEndpointProvider(Object):
         refresh_event: Optional[Union[BoundEvent, List[BoundEvent]]] = None,
         external_url: str = "",
         lookaside_jobs_callable: Optional[Callable] = None,
+        compress_relation_data: bool = False,
     ):
         """Construct a metrics provider for a Prometheus charm.
 
@@ -1420,6 +1648,9 @@ class MetricsEndpointProvider(Object):
                 should return a `List[Dict]` which is syntactically identical to the
                 `jobs` parameter, but can be updated out of step initialization of
                 this library without disrupting the 'global' job spec.
+            compress_relation_data: an optional flag to send the scrape jobs and alert rules
+                compressed to the consumers which support it. Other consumers still get plain
+                JSON. Defaults to False.
 
         Raises:
             RelationNotFoundError: If there is no relation in the charm's metadata.yaml
@@ -1460,6 +1691,9 @@ class MetricsEndpointProvider(Object):
             )
         self.external_url = external_url
         self._lookaside_jobs = lookaside_jobs_callable
+        self._compress_relation_data = compress_relation_data
+        self._bind_address = None  # type: Optional[str]
+        self._stored.set_default(alert_rules_fingerprint=None, alert_rules="")
 
         events = self._charm.on[self._relation_name]
         self.framework.observe(events.relation_changed, self._on_relation_changed)
@@ -1495,6 +1729,10 @@ class MetricsEndpointProvider(Object):
     def _on_relation_changed(self, event):
         """Check for alert rule messages in the relation data before moving on."""
         if self._charm.unit.is_leader():
+            if self._compress_relation_data:
+                # The consumer may have just listed the encodings it supports
+                self.set_scrape_job_spec()
+
             ev = json.loads(event.relation.data[event.app].get("event", "{}"))
 
             if ev:
@@ -1529,19 +1767,69 @@ class MetricsEndpointProvider(Object):
         if not self._charm.unit.is_leader():
             return
 
+        alert_rules = self._alert_rules()
+
+        for relation in self._charm.model.relations[self._relation_name]:
+            _update_databag(
+                relation.data[self._charm.app],
+                {
+                    "scrape_metadata": json.dumps(self._scrape_metadata),
+                    **_encoded_relation_data(
+                        {
+                            "scrape_jobs": json.dumps(self._scrape_jobs),
+                            # Update relation data with the string representation of the rule
+                            # file. Juju topology is already included in the "scrape_metadata"
+                            # field above. The consumer side of the relation uses this
+                            # information to name the rules file that is written to the
+                            # filesystem.
+                            "alert_rules": alert_rules,
+                        },
+                        compress=self._sends_compressed(relation),
+                    ),
+                },
+            )
+
+    def _sends_compressed(self, relation: Relation) -> bool:
+        """Return True if the data of a relation is to be sent compressed."""
+        if not self._compress_relation_data or not relation.app:
+            return False
+        try:
+            encodings = json.loads(relation.data[relation.app].get(ENCODINGS_KEY, "[]"))
+        except json.JSONDecodeError:
+            return False
+        return COMPRESSED_ENCODING in encodings
+
+    def _alert_rules(self) -> str:
+        """Return the serialized alert rules, rendered again only if their files changed.
+
+        Rendering reads and parses every rule file and injects the Juju topology into each
+        expression, so the result is kept in stored state along with a fingerprint of the rule
+        files and the topology, and reused for as long as the fingerprint does not change.
+        """
+        fingerprint = self._alert_rules_fingerprint()
+        if fingerprint == self._stored.alert_rules_fingerprint:
+            return self._stored.alert_rules  # type: ignore[return-value]
+
         alert_rules = AlertRules(query_type="promql", topology=self.topology)
         alert_rules.add_path(self._alert_rules_path, recursive=True)
-        alert_rules_as_dict = alert_rules.as_dict()
+        self._stored.alert_rules = json.dumps(alert_rules.as_dict())
+        self._stored.alert_rules_fingerprint = fingerprint
+        return self._stored.alert_rules  # type: ignore[return-value]
 
-        for relation in self._charm.model.relations[self._relation_name]:
-            relation.data[self._charm.app]["scrape_metadata"] = json.dumps(self._scrape_metadata)
-            relation.data[self._charm.app]["scrape_jobs"] = json.dumps(self._scrape_jobs)
+    def _alert_rules_fingerprint(self) -> str:
+        """Return a hash of the alert rule files, by relative path, and of the topology."""
+        digest = hashlib.sha256(json.dumps(self.topology.as_dict(), sort_keys=True).encode())
 
-            # Update relation data with the string representation of the rule file.
-            # Juju topology is already included in the "scrape_metadata" field above.
-            # The consumer side of the relation uses this information to name the rules file
-            # that is written to the filesystem.
-            relation.data[self._charm.app]["alert_rules"] = json.dumps(alert_rules_as_dict)
+        path = Path(self._alert_rules_path)
+        if path.is_dir():
+            files = sorted(f for f in path.rglob("*") if f.is_file())
+        else:
+            files = [path] if path.is_file() else []
+
+        for file in files:
+            digest.update(str(file.relative_to(path) if path.is_dir() else file).encode())
+            digest.update(hashlib.sha256(file.read_bytes()).digest())
+        return digest.hexdigest()
 
     def _set_unit_ip(self, _=None):
         """Set unit host address.
@@ -1554,27 +1842,37 @@ class MetricsEndpointProvider(Object):
         event is actually needed.
         """
         for relation in self._charm.model.relations[self._relation_name]:
-            unit_ip = str(self._charm.model.get_binding(relation).network.bind_address)
-
             # TODO store entire url in relation data, instead of only select url parts.
 
             if self.external_url:
                 parsed = urlparse(self.external_url)
                 unit_address = parsed.hostname
                 path = parsed.path
-            elif self._is_valid_unit_address(unit_ip):
-                unit_address = unit_ip
-                path = ""
             else:
-                unit_address = socket.getfqdn()
+                unit_address = self._get_bind_address()
                 path = ""
 
-            relation.data[self._charm.unit]["prometheus_scrape_unit_address"] = unit_address
-            relation.data[self._charm.unit]["prometheus_scrape_unit_path"] = path
-            relation.data[self._charm.unit]["prometheus_scrape_unit_name"] = str(
-                self._charm.model.unit.name
+            _update_databag(
+                relation.data[self._charm.unit],
+                {
+                    "prometheus_scrape_unit_address": unit_address,
+                    "prometheus_scrape_unit_path": path,
+                    "prometheus_scrape_unit_name": str(self._charm.model.unit.name),
+                },
             )
 
+    def _get_bind_address(self) -> str:
+        """Return the address of this unit on the relation endpoint.
+
+        The endpoint binding is the same for all the relations, so it is resolved once per
+        dispatch, along with the FQDN fallback for a bind address which is not a valid IP.
+        """
+        if self._bind_address is None:
+            binding = self._charm.model.get_binding(self._relation_name)
+            unit_ip = str(binding.network.bind_address) if binding else ""
+            self._bind_address = unit_ip if self._is_valid_unit_address(unit_ip) else _get_fqdn()
+        return self._bind_address
+
     def _is_valid_unit_address(self, address: str) -> bool:
         """Validate a unit address.
 
@@ -1681,9 +1979,14 @@ class PrometheusRulesProvider(Object):
 
         logger.info("Updating relation data with rule files from disk")
         for relation in self._charm.model.relations[self._relation_name]:
-            relation.data[self._charm.app]["alert_rules"] = json.dumps(
-                alert_rules_as_dict,
-                sort_keys=True,  # sort, to prevent unnecessary relation_changed events
+            _update_databag(
+                relation.data[self._charm.app],
+                {
+                    "alert_rules": json.dumps(
+                        alert_rules_as_dict,
+                        sort_keys=True,  # sort, to prevent unnecessary relation_changed events
+                    )
+                },
             )
 
 
@@ -1807,7 +2110,20 @@ class MetricsEndpointAggregator(Object):
         self._alert_rules_relation = relation_names.get("alert_rules", "prometheus-rules")
 
         super().__init__(charm, self._prometheus_relation)
-        self._stored.set_default(jobs=[], alert_rules=[])
+        # Scrape jobs are indexed by job name, each serialized once, and the generation changes
+        # whenever a job does so that the joined payload is only rebuilt after a change. The
+        # names of the jobs set through `set_target_job_data` are kept apart, as they have no
+        # target relation to rebuild them from.
+        self._stored.set_default(
+            jobs=[], job_index={}, jobs_generation=0, manual_job_names=[], alert_rules=[]
+        )
+        if self._stored.jobs:  # pyright: ignore
+            # Jobs stored as a list by earlier versions of this library
+            for job in _type_convert_stored(self._stored.jobs):  # pyright: ignore
+                self._stored.job_index[job["job_name"]] = json.dumps(job)  # pyright: ignore
+            self._stored.jobs = []
+            self._stored.jobs_generation += 1  # pyright: ignore
+        self._jobs_payload = None  # type: Optional[Tuple[int, str]]
 
         self._relabel_instance = relabel_instance
         self._resolve_addresses = resolve_addresses
@@ -1815,6 +2131,7 @@ class MetricsEndpointAggregator(Object):
         # manage Prometheus charm relation events
         prometheus_events = self._charm.on[self._prometheus_relation]
         self.framework.observe(prometheus_events.relation_joined, self._set_prometheus_data)
+        self.framework.observe(self._charm.on.leader_elected, self._on_leader_elected)
 
         # manage list of Prometheus scrape jobs from related scrape targets
         target_events = self._charm.on[self._target_relation]
@@ -1838,14 +2155,6 @@ class MetricsEndpointAggregator(Object):
         if not self._charm.unit.is_leader():
             return
 
-        jobs = [] + _type_convert_stored(
-            self._stored.jobs  # pyright: ignore
-        )  # list of scrape jobs, one per relation
-        for relation in self.model.relations[self._target_relation]:
-            targets = self._get_targets(relation)
-            if targets and relation.app:
-                jobs.append(self._static_scrape_job(targets, relation.app.name))
-
         groups = [] + _type_convert_stored(
             self._stored.alert_rules  # pyright: ignore
         )  # list of alert rule groups
@@ -1857,8 +2166,52 @@ class MetricsEndpointAggregator(Object):
                 group = {"name": self.group_name(appname), "rules": rules}
                 groups.append(group)
 
-        event.relation.data[self._charm.app]["scrape_jobs"] = json.dumps(jobs)
-        event.relation.data[self._charm.app]["alert_rules"] = json.dumps({"groups": groups})
+        _update_databag(
+            event.relation.data[self._charm.app],
+            {
+                "scrape_jobs": self._scrape_jobs_payload(),
+                "alert_rules": json.dumps({"groups": groups}),
+            },
+        )
+
+    def _on_leader_elected(self, _):
+        """Rebuild the scrape jobs of a new leader and send them to every Prometheus.
+
+        Relation events seen while not the leader are ignored, so the index of a new leader
+        may be stale. It is only rebuilt here, and used as is by every other event.
+        """
+        self._rebuild_job_index()
+        self._publish_scrape_jobs()
+
+    def _rebuild_job_index(self) -> None:
+        """Rebuilds the index of scrape jobs from the live relations.
+
+        The job of each target relation is built again from its current relation data, so the
+        jobs of applications with no target relation left are dropped. The jobs set through
+        `set_target_job_data` are kept as published to Prometheus by the current or a previous
+        leader, or as indexed by this unit if nothing was published yet.
+        """
+        published = {}  # type: Dict[str, str]
+        for relation in self.model.relations[self._prometheus_relation]:
+            for job in json.loads(relation.data[self._charm.app].get("scrape_jobs", "[]")):
+                published.setdefault(job["job_name"], json.dumps(job))
+        current = published or dict(self._stored.job_index)  # pyright: ignore
+
+        manual_job_names = set(self._stored.manual_job_names)  # pyright: ignore
+        jobs = {name: job for name, job in current.items() if name in manual_job_names}
+        for relation in self.model.relations[self._target_relation]:
+            targets = self._get_targets(relation) if relation.app else None
+            if targets:
+                job = self._static_scrape_job(targets, relation.app.name)
+                jobs[job["job_name"]] = json.dumps(job)
+
+        # Unchanged jobs keep their place, so that the payload sent is the same if none changed
+        index = {name: jobs[name] for name in current if name in jobs}
+        index.update(jobs)
+
+        if index != dict(self._stored.job_index):  # pyright: ignore
+            self._stored.job_index = index
+            self._stored.jobs_generation += 1  # pyright: ignore
 
     def _on_prometheus_targets_changed(self, event):
         """Update scrape jobs in response to scrape target changes.
@@ -1872,7 +2225,7 @@ class MetricsEndpointAggregator(Object):
             return
 
         # new scrape job for the relation that has changed
-        self.set_target_job_data(targets, event.relation.app.name)
+        self._set_target_job_data(targets, event.relation.app.name)
 
     def set_target_job_data(self, targets: dict, app_name: str, **kwargs) -> None:
         """Update scrape jobs in response to scrape target changes.
@@ -1887,21 +2240,45 @@ class MetricsEndpointAggregator(Object):
             app_name: a `str` identifying the application
             kwargs: a `dict` of the extra arguments passed to the function
         """
+        # Recorded on every unit, for a later leader to keep the job when rebuilding its index
+        job_name = kwargs.get("updates", {}).get("job_name", self._job_name(app_name))
+        if job_name not in self._stored.manual_job_names:  # pyright: ignore
+            self._stored.manual_job_names.append(job_name)  # pyright: ignore
+        self._set_target_job_data(targets, app_name, **kwargs)
+
+    def _set_target_job_data(self, targets: dict, app_name: str, **kwargs) -> None:
+        """Indexes the scrape job of an application, and sends the jobs to Prometheus."""
         if not self._charm.unit.is_leader():
             return
 
         # new scrape job for the relation that has changed
-        updated_job = self._static_scrape_job(targets, app_name, **kwargs)
+        self._index_job(self._static_scrape_job(targets, app_name, **kwargs))
+        self._publish_scrape_jobs()
 
-        for relation in self.model.relations[self._prometheus_relation]:
-            jobs = json.loads(relation.data[self._charm.app].get("scrape_jobs", "[]"))
-            # list of scrape jobs that have not changed
-            jobs = [job for job in jobs if updated_job["job_name"] != job["job_name"]]
-            jobs.append(updated_job)
-            relation.data[self._charm.app]["scrape_jobs"] = json.dumps(jobs)
+    def _index_job(self, job: dict) -> None:
+        """Stores a scrape job under its name, replacing the previous one in place.
 
-            if not _type_convert_stored(self._stored.jobs) == jobs:  # pyright: ignore
-                self._stored.jobs = jobs
+        Replacing in place keeps the serialized jobs the same if the job did not actually change.
+        """
+        serialized = json.dumps(job)
+        if self._stored.job_index.get(job["job_name"]) != serialized:  # pyright: ignore
+            self._stored.job_index[job["job_name"]] = serialized  # pyright: ignore
+            self._stored.jobs_generation += 1  # pyright: ignore
+
+    def _scrape_jobs_payload(self) -> str:
+        """Returns the serialized list of indexed scrape jobs, joined once per generation."""
+        generation = self._stored.jobs_generation
+        if self._jobs_payload is None or self._jobs_payload[0] != generation:
+            jobs = self._stored.job_index.values()  # pyright: ignore
+            self._jobs_payload = (generation, "[" + ", ".join(jobs) + "]")  # pyright: ignore
+        return self._jobs_payload[1]
+
+    def _publish_scrape_jobs(self) -> None:
+        """Sends the indexed scrape jobs to every Prometheus relation."""
+        for relation in self.model.relations[self._prometheus_relation]:
+            _update_databag(
+                relation.data[self._charm.app], {"scrape_jobs": self._scrape_jobs_payload()}
+            )
 
     def _on_prometheus_targets_departed(self, event):
         """Remove scrape jobs when a target departs.
@@ -1923,37 +2300,31 @@ class MetricsEndpointAggregator(Object):
         For NRPE, the job name is calculated from an ID sent via the NRPE relation, and is
         sufficient to uniquely identify the target.
         """
+        if not unit_name and job_name in self._stored.manual_job_names:  # pyright: ignore
+            self._stored.manual_job_names.remove(job_name)  # pyright: ignore
+
         if not self._charm.unit.is_leader():
             return
 
-        for relation in self.model.relations[self._prometheus_relation]:
-            jobs = json.loads(relation.data[self._charm.app].get("scrape_jobs", "[]"))
-            if not jobs:
-                continue
-
-            changed_job = [j for j in jobs if j.get("job_name") == job_name]
-            if not changed_job:
-                continue
-            changed_job = changed_job[0]
-
-            # list of scrape jobs that have not changed
-            jobs = [job for job in jobs if job.get("job_name") != job_name]
-
-            # list of scrape jobs for units of the same application that still exist
-            configs_kept = [
-                config
-                for config in changed_job["static_configs"]  # type: ignore
-                if config.get("labels", {}).get("juju_unit") != unit_name
-            ]
-
-            if configs_kept:
-                changed_job["static_configs"] = configs_kept  # type: ignore
-                jobs.append(changed_job)
+        serialized = self._stored.job_index.get(job_name)  # pyright: ignore
+        if serialized is None:
+            return
+        changed_job = json.loads(serialized)
 
-            relation.data[self._charm.app]["scrape_jobs"] = json.dumps(jobs)
+        # list of scrape jobs for units of the same application that still exist
+        configs_kept = [
+            config
+            for config in changed_job["static_configs"]
+            if config.get("labels", {}).get("juju_unit") != unit_name
+        ]
 
-            if not _type_convert_stored(self._stored.jobs) == jobs:  # pyright: ignore
-                self._stored.jobs = jobs
+        if configs_kept:
+            changed_job["static_configs"] = configs_kept
+            self._index_job(changed_job)
+        else:
+            del self._stored.job_index[job_name]  # pyright: ignore
+            self._stored.jobs_generation += 1  # pyright: ignore
+        self._publish_scrape_jobs()
 
     def _job_name(self, appname) -> str:
         """Construct a scrape job name.
@@ -2122,14 +2493,19 @@ class MetricsEndpointAggregator(Object):
             alert_rules = json.loads(relation.data[self._charm.app].get("alert_rules", "{}"))
             groups = alert_rules.get("groups", [])
             # list of alert rule groups that have not changed
+            # Rules already in the group keep their place, so that the serialized rules stay the
+            # same if no rule actually changed
             for group in groups:
                 if group["name"] == updated_group["name"]:
-                    group["rules"] = [r for r in group["rules"] if r not in updated_group["rules"]]
-                    group["rules"].extend(updated_group["rules"])
+                    group["rules"].extend(
+                        r for r in updated_group["rules"] if r not in group["rules"]
+                    )
 
             if updated_group["name"] not in [g["name"] for g in groups]:
                 groups.append(updated_group)
-            relation.data[self._charm.app]["alert_rules"] = json.dumps({"groups": groups})
+            _update_databag(
+                relation.data[self._charm.app], {"alert_rules": json.dumps({"groups": groups})}
+            )
 
             if not _type_convert_stored(self._stored.alert_rules) == groups:  # pyright: ignore
                 self._stored.alert_rules = groups
@@ -2177,8 +2553,9 @@ class MetricsEndpointAggregator(Object):
                 changed_group["rules"] = rules_kept  # type: ignore
                 groups.append(changed_group)
 
-            relation.data[self._charm.app]["alert_rules"] = (
-                json.dumps({"groups": groups}) if groups else "{}"
+            _update_databag(
+                relation.data[self._charm.app],
+                {"alert_rules": json.dumps({"groups": groups}) if groups else "{}"},
             )
 
             if not _type_convert_stored(self._stored.alert_rules) == groups:  # pyright: ignore
@@ -2254,6 +2631,10 @@ class MetricsEndpointAggregator(Object):
         return labeled_rules
 
 
+# cos-tool reads files by path, so content to validate is piped to it through stdin
+_STDIN_PATH = "/dev/stdin"
+
+
 class CosTool:
     """Uses cos-tool to inject label matchers into alert rule expressions and validate rules."""
 
@@ -2269,16 +2650,19 @@ class CosTool:
         if self._disabled:
             return None
         if not self._path:
-            self._path = self._get_tool_path()
+            # Stored on the class, so that every instance in this dispatch shares the lookup
+            type(self)._path = self._get_tool_path()
             if not self._path:
                 logger.debug("Skipping injection of juju topology as label matchers")
-                self._disabled = True
+                type(self)._disabled = True
         return self._path
 
     def apply_label_matchers(self, rules) -> dict:
         """Will apply label matchers to the expression of all alerts in all supplied groups."""
         if not self.path:
             return rules
+        # Rules sharing the same topology are transformed together in one batch
+        batches = {}  # type: Dict[Tuple[Tuple[str, str], ...], List[dict]]
         for group in rules["groups"]:
             rules_in_group = group.get("rules", [])
             for rule in rules_in_group:
@@ -2295,7 +2679,14 @@ class CosTool:
                     if label in rule["labels"]:
                         topology[label] = rule["labels"][label]
 
-                rule["expr"] = self.inject_label_matchers(rule["expr"], topology)
+                batches.setdefault(tuple(topology.items()), []).append(rule)
+
+        for topology_items, batch in batches.items():
+            expressions = self.inject_label_matchers_batch(
+                [rule["expr"] for rule in batch], dict(topology_items)
+            )
+            for rule, expression in zip(batch, expressions):
+                rule["expr"] = expression
         return rules
 
     def validate_alert_rules(self, rules: dict) -> Tuple[bool, str]:
@@ -2304,24 +2695,21 @@ class CosTool:
             logger.debug("`cos-tool` unavailable. Not validating alert correctness.")
             return True, ""
 
-        with tempfile.TemporaryDirectory() as tmpdir:
-            rule_path = Path(tmpdir + "/validate_rule.yaml")
-            rule_path.write_text(yaml.dump(rules))
-
-            args = [str(self.path), "validate", str(rule_path)]
-            # noinspection PyBroadException
-            try:
-                self._exec(args)
-                return True, ""
-            except subprocess.CalledProcessError as e:
-                logger.debug("Validating the rules failed: %s", e.output)
-                return False, ", ".join(
-                    [
-                        line
-                        for line in e.output.decode("utf8").splitlines()
-                        if "error validating" in line
-                    ]
-                )
+        # The rules are piped to cos-tool, rather than written to a temporary file
+        args = [str(self.path), "validate", _STDIN_PATH]
+        # noinspection PyBroadException
+        try:
+            self._exec(args, stdin=yaml.dump(rules))
+            return True, ""
+        except subprocess.CalledProcessError as e:
+            logger.debug("Validating the rules failed: %s", e.output)
+            return False, ", ".join(
+                [
+                    line
+                    for line in e.output.decode("utf8").splitlines()
+                    if "error validating" in line
+                ]
+            )
 
     def validate_scrape_jobs(self, jobs: list) -> bool:
         """Validate scrape jobs using cos-tool."""
@@ -2329,14 +2717,13 @@ class CosTool:
             logger.debug("`cos-tool` unavailable. Not validating scrape jobs.")
             return True
         conf = {"scrape_configs": jobs}
-        with tempfile.NamedTemporaryFile() as tmpfile:
-            with open(tmpfile.name, "w") as f:
-                f.write(yaml.safe_dump(conf))
-            try:
-                self._exec([str(self.path), "validate-config", tmpfile.name])
-            except subprocess.CalledProcessError as e:
-                logger.error("Validating scrape jobs failed: {}".format(e.output))
-                raise
+        try:
+            self._exec(
+                [str(self.path), "validate-config", _STDIN_PATH], stdin=yaml.safe_dump(conf)
+            )
+        except subprocess.CalledProcessError as e:
+            logger.error("Validating scrape jobs failed: {}".format(e.output))
+            raise
         return True
 
     def inject_label_matchers(self, expression, topology) -> str:
@@ -2346,6 +2733,7 @@ class CosTool:
         if not self.path:
             logger.debug("`cos-tool` unavailable. Leaving expression unchanged: %s", expression)
             return expression
+
         args = [str(self.path), "transform"]
         args.extend(
             ["--label-matcher={}={}".format(key, value) for key, value in topology.items()]
@@ -2354,10 +2742,30 @@ class CosTool:
         args.extend(["{}".format(expression)])
         # noinspection PyBroadException
         try:
-            return self._exec(args)
+            transformed = self._exec(args)
         except subprocess.CalledProcessError as e:
             logger.debug('Applying the expression failed: "%s", falling back to the original', e)
             return expression
+        return transformed
+
+    def inject_label_matchers_batch(self, expressions: List[str], topology: dict) -> List[str]:
+        """Add label matchers to a list of expressions, returning them in the same order.
+
+        `cos-tool transform` takes a single expression per invocation, so each distinct
+        expression is transformed once and the result reused for its duplicates.
+        """
+        if not topology or not self.path:
+            return list(expressions)
+        transformed = {}  # type: Dict[str, str]
+        for expression in expressions:
+            if expression not in transformed:
+                transformed[expression] = self.inject_label_matchers(expression, topology)
+        return [transformed[expression] for expression in expressions]
+
+    def _tool_version(self) -> str:
+        """Identify the cos-tool binary, so that results of another binary are not reused."""
+        stat = Path(str(self.path)).stat()
+        return "{}-{}".format(stat.st_size, stat.st_mtime_ns)
 
     def _get_tool_path(self) -> Optional[Path]:
         arch = platform.machine()
@@ -2373,6 +2781,12 @@ class CosTool:
             logger.debug('Could not locate cos-tool at: "{}"'.format(res))
         return None
 
-    def _exec(self, cmd) -> str:
-        result = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    def _exec(self, cmd, stdin: Optional[str] = None) -> str:
+        result = subprocess.run(
+            cmd,
+            check=True,
+            input=stdin.encode("utf-8") if stdin is not None else None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
         return result.stdout.decode("utf-8").strip()
@@ -3,8 +3,9 @@
 
 
 import tempfile
+from datetime import datetime, timezone
 from pathlib import Path
-from subprocess import check_call
+from subprocess import check_call, check_output
 
 from jinja2 import Template
 
@@ -95,3 +96,11 @@ def gen_certs(service_name: str, namespace: str, webhook_service: str):
             file.unlink()
 
     return ret_certs
+
+
+def get_certificate_expiry(cert: str) -> datetime:
+    """Return the notAfter date of a PEM encoded certificate, as an aware UTC datetime."""
+    output = check_output(["openssl", "x509", "-noout", "-enddate"], input=cert.encode("utf-8"))
+    # Output looks like "notAfter=Oct 19 10:00:00 2027 GMT"
+    not_after = output.decode("utf-8").strip().split("=", 1)[1]
+    return datetime.strptime(not_after, "%b %d %H:%M:%S %Y %Z").replace(tzinfo=timezone.utc)
@@ -9,36 +9,40 @@ https://github.com/canonical/pvcviewer-operator/
 
 import logging
 import tempfile
-from base64 import b64encode
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
 
 import lightkube
-from charmed_kubeflow_chisme.components import ContainerFileTemplate
-from charmed_kubeflow_chisme.components.charm_reconciler import CharmReconciler
-from charmed_kubeflow_chisme.components.kubernetes_component import KubernetesComponent
-from charmed_kubeflow_chisme.components.leadership_gate_component import LeadershipGateComponent
+from charmed_kubeflow_chisme.components import LazyContainerFileTemplate
 from charmed_kubeflow_chisme.kubernetes import create_charm_default_labels
 from charms.grafana_k8s.v0.grafana_dashboard import GrafanaDashboardProvider
 from charms.loki_k8s.v1.loki_push_api import LogForwarder
 from charms.observability_libs.v1.kubernetes_service_patch import KubernetesServicePatch
 from charms.prometheus_k8s.v0.prometheus_scrape import MetricsEndpointProvider
+from lightkube.core.exceptions import ApiError, ConfigError
 from lightkube.models.core_v1 import ServicePort
 from lightkube.resources.admissionregistration_v1 import (
     MutatingWebhookConfiguration,
     ValidatingWebhookConfiguration,
 )
 from lightkube.resources.apiextensions_v1 import CustomResourceDefinition
-from lightkube.resources.core_v1 import Service, ServiceAccount
+from lightkube.resources.core_v1 import Pod, Service, ServiceAccount
 from lightkube.resources.rbac_authorization_v1 import (
     ClusterRole,
     ClusterRoleBinding,
     Role,
     RoleBinding,
 )
+from lightkube.utils.quantity import parse_quantity
 from ops import main
 from ops.charm import CharmBase
-from ops.framework import StoredState
 
-from certs import gen_certs
+from charm_metrics import METRICS_FILE as CHARM_METRICS_FILE
+from charm_metrics import CharmMetrics, TimedCharmReconciler
+from components.alert_rules_component import SloAlertRulesComponent, SloAlertRulesInputs
+from components.certificates_component import WebhookCertificatesComponent
+from components.kubernetes_component import PvcViewerKubernetesComponent
 from components.pebble_component import PvcViewerInputs, PvcViewerPebbleService
 from components.service_mesh_component import ServiceMeshComponent
 
@@ -48,16 +52,26 @@ CERTS_FOLDER = "/tmp/k8s-webhook-server/serving-certs"
 PORT = 443
 WEBHOOK_PORT = 9443
 METRICS_PORT = 8080
+# Served from the workload container by a Pebble service, with the metrics of the charm itself,
+# if the workload image ships python3
+CHARM_METRICS_PORT = 8082
+CHARM_METRICS_DIR = "/tmp/charm-metrics"
 K8S_RESOURCE_FILES = [
     "src/templates/auth_manifests.yaml.j2",
     "src/templates/crd_manifests.yaml.j2",
     "src/templates/webhook_manifests.yaml.j2",
 ]
 
+STATIC_ALERT_RULES_DIR = "src/prometheus_alert_rules"
+SLO_ALERT_RULES_TEMPLATE = "src/templates/slo_alert_rules.rules.j2"
+SLO_ALERT_RULES_FILE = "KubeflowPvcviewerOperatorSLOs.rules"
+# Rules sent by MetricsEndpointProvider, gathered from the static rules and the SLO rules
+# rendered from the charm config, in the unit state directory, as Juju replaces the charm
+# directory on upgrade
+ALERT_RULES_DIR = "prometheus-alert-rules"
 
-class PvcViewer(CharmBase):
-    _stored = StoredState()
 
+class PvcViewer(CharmBase):
     def __init__(self, *args):
         """Charm for the PVC Viewer CRD controller."""
         super().__init__(*args)
@@ -71,26 +85,42 @@ class PvcViewer(CharmBase):
         self.service_patcher = KubernetesServicePatch(
             self, [webhook_port, metrics_port], service_name=f"{self.model.app.name}"
         )
+        self.charm_metrics = CharmMetrics(
+            self,
+            container_name="pvcviewer-operator",
+            metrics_dir=CHARM_METRICS_DIR,
+            port=CHARM_METRICS_PORT,
+            certificate_expiry_getter=self._get_certificate_expiry,
+            on_serving_changed=lambda: self.prometheus_provider.update_scrape_job_spec(
+                self._get_scrape_jobs()
+            ),
+        )
+        alert_rules_dir = self._get_unit_state_dir() / ALERT_RULES_DIR
         self.prometheus_provider = MetricsEndpointProvider(
             charm=self,
-            jobs=[{"static_configs": [{"targets": [f"*:{METRICS_PORT}"]}]}],
+            alert_rules_path=str(alert_rules_dir),
+            jobs=self._get_scrape_jobs(),
         )
         self.dashboard_provider = GrafanaDashboardProvider(self)
-        self.charm_reconciler = CharmReconciler(self)
-
-        # Generate self-signed certificates and store them
-        self._gen_certs_if_missing()
+        # Records how long each component takes to reconcile
+        self.charm_reconciler = TimedCharmReconciler(self, charm_metrics=self.charm_metrics)
 
-        self.leadership_gate = self.charm_reconciler.add(
-            component=LeadershipGateComponent(
+        # Webhook certificates are generated by the leader and shared with every unit, so that
+        # all replicas behind the webhook Service serve certificates signed by the same CA
+        self.certificates = self.charm_reconciler.add(
+            component=WebhookCertificatesComponent(
                 charm=self,
-                name="leadership-gate",
+                name="webhook-certificates",
+                service_name=self.app.name,
+                namespace=self._namespace,
+                webhook_service=self.app.name,
             ),
             depends_on=[],
         )
 
+        # Kubernetes resources are applied by the leader only, and report Active elsewhere
         self.kubernetes_resources = self.charm_reconciler.add(
-            component=KubernetesComponent(
+            component=PvcViewerKubernetesComponent(
                 charm=self,
                 name="kubernetes:auth-and-crds",
                 resource_templates=K8S_RESOURCE_FILES,
@@ -108,50 +138,66 @@ class PvcViewer(CharmBase):
                 krh_labels=create_charm_default_labels(
                     self.app.name, self.model.name, scope="auth-and-crds"
                 ),
-                context_callable=lambda: {
-                    "app_name": self.app.name,
-                    "namespace": self._namespace,
-                    "cert": f"'{b64encode(self._stored.ca.encode('ascii')).decode('utf-8')}'",
-                    "webhook_service_name": self.app.name,
-                },
-                lightkube_client=lightkube.Client(),
+                context_callable=self._get_kubernetes_resources_context,
+                lightkube_client=self.charm_metrics.instrument_client(lightkube.Client()),
+                # Lets a certificate rotation move on once the new CA bundle is trusted
+                on_applied=lambda: self.certificates.component.ca_bundle_applied(),
+                ca_bundle_getter=lambda: self.certificates.component.ca_bundle,
             ),
-            depends_on=[self.leadership_gate],
+            depends_on=[self.certificates],
         )
 
-        # Create temporary files for the certificate data
-        with tempfile.NamedTemporaryFile(delete=False) as key_file:
-            key_file.write(self._stored.key.encode("utf-8"))
-
-        with tempfile.NamedTemporaryFile(delete=False) as cert_file:
-            cert_file.write(self._stored.cert.encode("utf-8"))
-
-        with tempfile.NamedTemporaryFile(delete=False) as ca_file:
-            ca_file.write(self._stored.ca.encode("utf-8"))
-
         self.service_mesh = self.charm_reconciler.add(
             component=ServiceMeshComponent(charm=self, name="service-mesh"),
-            depends_on=[self.leadership_gate],
+            depends_on=[],
         )
 
-        # Use the temporary file paths as source_template_path
+        self.slo_alert_rules = self.charm_reconciler.add(
+            component=SloAlertRulesComponent(
+                charm=self,
+                name="slo-alert-rules",
+                template_path=SLO_ALERT_RULES_TEMPLATE,
+                static_rules_path=self.charm_dir / STATIC_ALERT_RULES_DIR,
+                destination_dir=alert_rules_dir,
+                rules_file_name=SLO_ALERT_RULES_FILE,
+                # Sends the new rules to Prometheus
+                on_changed=lambda: self.prometheus_provider.set_scrape_job_spec(),
+                inputs_getter=lambda: SloAlertRulesInputs(
+                    webhook_latency_seconds=self.model.config["webhook-latency-slo-seconds"],
+                    webhook_latency_objective=self.model.config["webhook-latency-slo-objective"],
+                    reconcile_error_objective=self.model.config["reconcile-error-slo-objective"],
+                    workqueue_depth_threshold=self.model.config["workqueue-depth-alert-threshold"],
+                    workqueue_unfinished_work_seconds=self.model.config[
+                        "workqueue-unfinished-work-alert-seconds"
+                    ],
+                    rate_limiter_wait_seconds=self.model.config["rate-limiter-wait-alert-seconds"],
+                    memory_limit_bytes=self._get_memory_limit_bytes(),
+                    memory_limit_ratio=self.model.config["memory-alert-limit-ratio"],
+                ),
+            ),
+            depends_on=[],
+        )
+
+        # The controller runs on every unit: controller-runtime elects a single active
+        # reconciler through its Lease, while the webhook server is active on every replica
         self.pebble_service_container = self.charm_reconciler.add(
             component=PvcViewerPebbleService(
                 charm=self,
                 name="pvc-viewer-pebble-service",
                 container_name="pvcviewer-operator",
                 service_name="pvcviewer-operator",
+                certificates=self.certificates.component,
                 files_to_push=[
-                    ContainerFileTemplate(
-                        source_template_path=key_file.name,
+                    LazyContainerFileTemplate(
+                        source_template=lambda: self.certificates.component.key,
                         destination_path=f"{CERTS_FOLDER}/tls.key",
                     ),
-                    ContainerFileTemplate(
-                        source_template_path=cert_file.name,
+                    LazyContainerFileTemplate(
+                        source_template=lambda: self.certificates.component.cert,
                         destination_path=f"{CERTS_FOLDER}/tls.crt",
                     ),
-                    ContainerFileTemplate(
-                        source_template_path=ca_file.name,
+                    LazyContainerFileTemplate(
+                        source_template=lambda: self.certificates.component.ca,
                         destination_path=f"{CERTS_FOLDER}/tls.ca",
                     ),
                 ],
@@ -159,37 +205,66 @@ class PvcViewer(CharmBase):
                     istio_ambient=self.service_mesh.component.is_ambient_mesh_enabled(),
                     gateway_name=self.service_mesh.component.get_gateway_name(),
                     gateway_namespace=self.service_mesh.component.get_gateway_namespace(),
+                    health_check_period=self.model.config["health-check-period"],
+                    health_check_threshold=self.model.config["health-check-threshold"],
                 ),
             ),
-            depends_on=[self.kubernetes_resources, self.service_mesh],
+            depends_on=[self.certificates, self.kubernetes_resources, self.service_mesh],
         )
 
         self.charm_reconciler.install_default_event_handlers()
         self._logging = LogForwarder(charm=self)
 
-    def _gen_certs_if_missing(self) -> None:
-        """Generate certificates if they don't already exist in _stored."""
-        logger.info("Generating certificates if missing.")
-        cert_attributes = ["cert", "ca", "key"]
-        # Generate new certs if any cert attribute is missing
-        for cert_attribute in cert_attributes:
-            try:
-                getattr(self._stored, cert_attribute)
-                logger.info(f"Certificate {cert_attribute} already exists, skipping generation.")
-            except AttributeError:
-                self._gen_certs()
-                return
-
-    def _gen_certs(self):
-        """Refresh the certificates, overwriting all attributes if any attribute is missing."""
-        logger.info("Generating certificates..")
-        certs = gen_certs(
-            service_name=self.app.name,
-            namespace=self._namespace,
-            webhook_service=self.app.name,
-        )
-        for k, v in certs.items():
-            setattr(self._stored, k, v)
+    def _get_kubernetes_resources_context(self) -> dict:
+        """Returns the context used to render the Kubernetes resource templates."""
+        return {
+            "app_name": self.app.name,
+            "namespace": self._namespace,
+            "cert": f"'{self.certificates.component.ca_bundle}'",
+            "webhook_service_name": self.app.name,
+        }
+
+    def _get_certificate_expiry(self) -> Optional[datetime]:
+        """Returns the expiry of the served webhook certificate, or None before it exists."""
+        if self.certificates.component.revision is None:
+            return None
+        return self.certificates.component.expires_at
+
+    def _get_unit_state_dir(self) -> Path:
+        """Returns the unit state directory kept by Juju, or else the temporary directory."""
+        state_dir = self.charm_dir.parent / "state"
+        return state_dir if state_dir.is_dir() else Path(tempfile.gettempdir())
+
+    def _get_memory_limit_bytes(self) -> int:
+        """Returns the memory limit of the workload container, or else the configured one.
+
+        The limit is read from the unit's Pod, as no metric of the workload reports it.
+        """
+        try:
+            client = self.charm_metrics.instrument_client(lightkube.Client())
+            pod = client.get(Pod, name=self.unit.name.replace("/", "-"), namespace=self._namespace)
+        except (ApiError, ConfigError) as e:
+            logger.warning(f"Failed to read the memory limit of the workload container: {e}")
+            return self.model.config["memory-alert-limit-bytes"]
+
+        for container in pod.spec.containers:
+            limits = container.resources.limits if container.resources else None
+            if container.name == "pvcviewer-operator" and limits and "memory" in limits:
+                return int(parse_quantity(limits["memory"]))
+        return self.model.config["memory-alert-limit-bytes"]
+
+    def _get_scrape_jobs(self) -> List[dict]:
+        """Returns the workload's scrape job, and the charm's one while its metrics are served."""
+        jobs = [{"static_configs": [{"targets": [f"*:{METRICS_PORT}"]}]}]
+        if self.charm_metrics.serving:
+            jobs.append(
+                {
+                    "job_name": "charm",
+                    "metrics_path": f"/{CHARM_METRICS_FILE}",
+                    "static_configs": [{"targets": [f"*:{CHARM_METRICS_PORT}"]}],
+                }
+            )
+        return jobs
 
 
 if __name__ == "__main__":
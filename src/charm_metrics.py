@@ -0,0 +1,315 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Metrics about the charm itself, served to Prometheus next to the workload's metrics."""
+
+import inspect
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from charmed_kubeflow_chisme.components.charm_reconciler import CharmReconciler
+from lightkube import Client
+from ops import CharmBase, Container, EventBase, MaintenanceStatus, Object
+from ops.framework import StoredState
+from ops.pebble import APIError, ChangeError, ConnectionError, Layer
+
+logger = logging.getLogger(__name__)
+
+# Served as text/plain, which Prometheus reads as its text format
+METRICS_FILE = "metrics.txt"
+SERVICE_NAME = "charm-metrics"
+# Interpreters looked up in the workload container to run the HTTP server of the metrics file
+PYTHON_PATHS = ["/usr/bin/python3", "/usr/local/bin/python3", "/bin/python3"]
+
+# Label sets kept per metric family, beyond which new ones are dropped, so that the totals kept
+# in stored state stay bounded
+MAX_SERIES_PER_FAMILY = 64
+
+HOOK_DURATION = "pvcviewer_charm_hook_duration_seconds"
+COMPONENT_DURATION = "pvcviewer_charm_component_reconcile_duration_seconds"
+KUBERNETES_REQUESTS = "pvcviewer_charm_kubernetes_api_requests_total"
+KUBERNETES_DURATION = "pvcviewer_charm_kubernetes_api_request_duration_seconds"
+COS_TOOL_INVOCATIONS = "pvcviewer_charm_cos_tool_invocations_total"
+CERTIFICATE_EXPIRY = "pvcviewer_charm_webhook_certificate_expiry_timestamp_seconds"
+
+# Metric families written to the metrics file, as name: (type, help)
+METRIC_FAMILIES = {
+    HOOK_DURATION: ("summary", "Time spent by the charm handling a hook, by hook."),
+    COMPONENT_DURATION: ("summary", "Time spent reconciling a charm component, by component."),
+    KUBERNETES_REQUESTS: ("counter", "Kubernetes API calls made by the charm, by method."),
+    KUBERNETES_DURATION: ("summary", "Latency of the charm's Kubernetes API calls, by method."),
+    COS_TOOL_INVOCATIONS: ("counter", "Times the charm ran cos-tool, by charm library."),
+    CERTIFICATE_EXPIRY: ("gauge", "Expiry of the served webhook certificate, in unix time."),
+}
+
+# Samples by family, then by label set, then by sample name
+Samples = Dict[str, Dict[str, Dict[str, float]]]
+
+
+class CharmMetrics(Object):
+    """Records metrics about the charm itself into a textfile served to Prometheus.
+
+    Durations and counts are recorded in memory during a dispatch, and added to the totals kept
+    in the unit's stored state when the framework commits.  The totals are then written in the
+    Prometheus text format to a metrics file in the workload container, where a Pebble service
+    serves it on the given port, so that the file can be scraped like the workload.  The service
+    runs `python3 -m http.server`, so it is only added if the workload image ships python3, and
+    `serving` tells whether it runs.  `on_serving_changed` is called when that changes, so that
+    the charm only asks Prometheus to scrape the file while it is served.
+
+    Durations are recorded as summaries without quantiles, so that their average over time is
+    rate(<name>_sum) / rate(<name>_count).  A hook that fails is rolled back by Juju along with
+    its metrics, so only hooks that complete are counted.  At most MAX_SERIES_PER_FAMILY label
+    sets are kept for each family.
+    """
+
+    _stored = StoredState()
+
+    def __init__(
+        self,
+        charm: CharmBase,
+        container_name: str,
+        metrics_dir: str,
+        port: int,
+        certificate_expiry_getter: Optional[Callable[[], Optional[datetime]]] = None,
+        on_serving_changed: Optional[Callable[[], None]] = None,
+    ):
+        super().__init__(charm, "charm-metrics")
+        self._charm = charm
+        self._container_name = container_name
+        self._metrics_dir = metrics_dir
+        self._port = port
+        self._certificate_expiry_getter = certificate_expiry_getter
+        self._on_serving_changed = on_serving_changed
+        self._started = time.monotonic()
+        # Samples recorded during this dispatch, as {(family, labels, sample name): value}
+        self._recorded: Dict[Tuple[str, str, str], float] = {}
+        self._stored.set_default(samples={}, serving=False)
+
+        self.framework.observe(self.framework.on.pre_commit, self._on_pre_commit)
+
+    @property
+    def serving(self) -> bool:
+        """Whether the metrics file was served by the workload container at the last commit."""
+        return self._stored.serving
+
+    def count_cos_tool_run(self, library: str):
+        """Counts a run of cos-tool by a charm library, as reported by CharmCosTool."""
+        self.increment(COS_TOOL_INVOCATIONS, library=library)
+
+    def observe_duration(self, family: str, seconds: float, **labels: str):
+        """Records a duration into the _sum and _count samples of a summary."""
+        labels_text = _format_labels(labels)
+        self._add(family, labels_text, f"{family}_sum", seconds)
+        self._add(family, labels_text, f"{family}_count", 1)
+
+    def increment(self, family: str, value: float = 1, **labels: str):
+        """Adds to a counter."""
+        self._add(family, _format_labels(labels), family, value)
+
+    def _add(self, family: str, labels: str, name: str, value: float):
+        key = (family, labels, name)
+        self._recorded[key] = self._recorded.get(key, 0) + value
+
+    def instrument_client(self, client: Client) -> "InstrumentedClient":
+        """Returns the client recording the count and latency of each of its API calls."""
+        return InstrumentedClient(client, self)
+
+    def _on_pre_commit(self, _):
+        """Adds this dispatch to the totals, and writes them to the served metrics file."""
+        hook = os.environ.get("JUJU_DISPATCH_PATH", "unknown").rsplit("/", 1)[-1]
+        self.observe_duration(HOOK_DURATION, time.monotonic() - self._started, hook=hook)
+
+        samples: Samples = {
+            family: {labels: dict(values) for labels, values in series.items()}
+            for family, series in self._stored.samples.items()
+        }
+        for (family, labels, name), value in self._recorded.items():
+            series = samples.setdefault(family, {})
+            if labels not in series and len(series) >= MAX_SERIES_PER_FAMILY:
+                logger.debug(f"Dropping {family}{labels}, over {MAX_SERIES_PER_FAMILY} series.")
+                continue
+            values = series.setdefault(labels, {})
+            values[name] = values.get(name, 0) + value
+        self._recorded = {}
+
+        # The expiry is a gauge, read fresh at each dispatch rather than accumulated
+        samples.pop(CERTIFICATE_EXPIRY, None)
+        expiry = self._certificate_expiry_getter() if self._certificate_expiry_getter else None
+        if expiry is not None:
+            samples[CERTIFICATE_EXPIRY] = {"": {CERTIFICATE_EXPIRY: expiry.timestamp()}}
+        self._stored.samples = samples
+
+        container = self._charm.unit.get_container(self._container_name)
+        if not container.can_connect():
+            logger.info("Workload container not ready, the charm metrics are served later.")
+            return
+        try:
+            container.push(
+                f"{self._metrics_dir}/{METRICS_FILE}", _format_metrics(samples), make_dirs=True
+            )
+            serving = self._ensure_service(container)
+        except (APIError, ChangeError, ConnectionError) as e:
+            logger.warning(f"Failed to serve the charm metrics: {e}")
+            serving = False
+
+        if serving != self._stored.serving:
+            self._stored.serving = serving
+            if self._on_serving_changed:
+                self._on_serving_changed()
+
+    def _ensure_service(self, container: Container) -> bool:
+        """Adds the Pebble service serving the metrics file, and (re)starts it if needed.
+
+        Returns:
+            Whether the service is running, which it cannot without python3 in the container.
+        """
+        python = next((path for path in PYTHON_PATHS if container.exists(path)), None)
+        if python is None:
+            logger.debug("No python3 in the workload container, the charm metrics are not served.")
+            return False
+
+        layer = Layer(
+            {
+                "summary": "charm metrics layer",
+                "description": "Serves the metrics about the charm itself",
+                "services": {
+                    SERVICE_NAME: {
+                        "override": "replace",
+                        "summary": "HTTP server for the charm metrics file",
+                        "command": (
+                            f"{python} -m http.server {self._port} "
+                            f"--directory {self._metrics_dir}"
+                        ),
+                        "startup": "enabled",
+                    }
+                },
+            }
+        )
+        service = container.get_plan().services.get(SERVICE_NAME)
+        if service != layer.services[SERVICE_NAME]:
+            logger.info(f"Serving the charm metrics on port {self._port}.")
+            container.add_layer(SERVICE_NAME, layer, combine=True)
+            container.restart(SERVICE_NAME)
+        elif not container.get_service(SERVICE_NAME).is_running():
+            container.start(SERVICE_NAME)
+        return container.get_service(SERVICE_NAME).is_running()
+
+
+class TimedCharmReconciler(CharmReconciler):
+    """CharmReconciler recording into CharmMetrics how long each component takes to reconcile.
+
+    The loop is the one of CharmReconciler.reconcile, with the configure_charm call of each
+    component timed.
+    """
+
+    def __init__(self, charm: CharmBase, charm_metrics: CharmMetrics, **kwargs):
+        super().__init__(charm, **kwargs)
+        self._charm_metrics = charm_metrics
+
+    def reconcile(self, event: EventBase):
+        """Executes all components that are ready for execution, ordered by their dependencies."""
+        logger.info(f"Starting `execute_components` for event '{event.handle}'")
+
+        for component_graph_item in self._component_graph.component_items.values():
+            component_graph_item.executed = False
+
+        for component_item in self._component_graph.yield_executable_component_items():
+            logger.info(f"Executing component: '{component_item.name}'")
+            self._charm.unit.status = MaintenanceStatus(
+                f"Reconciling charm: executing component {component_item.name}"
+            )
+
+            started = time.monotonic()
+            try:
+                component_item.component.configure_charm(event)
+                logger.info(
+                    f"Execution for component '{component_item.name}' complete.  Component now "
+                    f"has status '{component_item.component.get_status()}'"
+                )
+            except Exception:
+                logger.error(
+                    "execute_components caught unhandled exception when executing "
+                    f"configure_charm for {component_item.name}",
+                    exc_info=True,
+                )
+            finally:
+                self._charm_metrics.observe_duration(
+                    COMPONENT_DURATION, time.monotonic() - started, component=component_item.name
+                )
+
+        logger.info("execute_components execution loop complete.")
+        self._update_charm_status()
+
+
+class InstrumentedClient:
+    """Lightkube client proxy recording the count and latency of each API call into metrics.
+
+    The calls returning a generator, such as list, only send requests while iterated, so they are
+    timed until the generator is exhausted.
+    """
+
+    def __init__(self, client: Client, metrics: CharmMetrics):
+        self._client = client
+        self._metrics = metrics
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._client, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            started = time.monotonic()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception:
+                self._record(name, started, "error")
+                raise
+            if inspect.isgenerator(result):
+                return self._timed_generator(name, started, result)
+            self._record(name, started, "success")
+            return result
+
+        return call
+
+    def _timed_generator(self, method: str, started: float, generator):
+        try:
+            yield from generator
+        except Exception:
+            self._record(method, started, "error")
+            raise
+        self._record(method, started, "success")
+
+    def _record(self, method: str, started: float, result: str):
+        self._metrics.increment(KUBERNETES_REQUESTS, method=method, result=result)
+        self._metrics.observe_duration(
+            KUBERNETES_DURATION, time.monotonic() - started, method=method
+        )
+
+
+def _format_metrics(samples: Samples) -> str:
+    """Returns the samples in the Prometheus text format."""
+    lines = []
+    for family, (metric_type, help_text) in METRIC_FAMILIES.items():
+        if family not in samples:
+            continue
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {metric_type}")
+        for labels, values in sorted(samples[family].items()):
+            lines.extend(
+                f"{name}{labels} {float(value)!r}" for name, value in sorted(values.items())
+            )
+    return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    """Returns the labels in the Prometheus text format, sorted by name."""
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in sorted(labels.items())
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
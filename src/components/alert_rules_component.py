@@ -0,0 +1,128 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+import dataclasses
+import logging
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from charmed_kubeflow_chisme.components import Component
+from jinja2 import Template
+from ops import ActiveStatus, BlockedStatus, StatusBase
+
+logger = logging.getLogger(__name__)
+
+# Buckets of controller_runtime_webhook_latency_seconds, the default Prometheus buckets
+WEBHOOK_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+@dataclasses.dataclass
+class SloAlertRulesInputs:
+    """Defines the thresholds rendered into the SLO alert rules."""
+
+    webhook_latency_seconds: float
+    webhook_latency_objective: float
+    reconcile_error_objective: float
+    workqueue_depth_threshold: int
+    workqueue_unfinished_work_seconds: float
+    rate_limiter_wait_seconds: float
+    memory_limit_bytes: int
+    memory_limit_ratio: float
+
+
+class SloAlertRulesComponent(Component):
+    """Component that gathers the alert rules sent to Prometheus into a runtime directory.
+
+    The directory, which the MetricsEndpointProvider reads the rules from, holds a copy of the
+    static alert rules shipped with the charm and the SLO alert rules rendered from the charm
+    config.  It is kept out of the packaged source directory, so the charm source is never
+    written to.  The SLO rules are removed while the config holds invalid thresholds, so that
+    stale rules are not sent.  Files are only rewritten when their content changes, in which
+    case on_changed is called so that the new rules are sent to Prometheus.
+    """
+
+    def __init__(
+        self,
+        *args,
+        template_path: str,
+        static_rules_path: Path,
+        destination_dir: Path,
+        rules_file_name: str,
+        on_changed: Optional[Callable[[], None]] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self._template_path = template_path
+        self._static_rules_path = static_rules_path
+        self._destination_dir = destination_dir
+        self._rules_file_name = rules_file_name
+        self._on_changed = on_changed
+
+    def _configure_unit(self, event):
+        """Syncs the alert rules directory, without the SLO rules if the config is invalid."""
+        files = {
+            str(path.relative_to(self._static_rules_path)): path.read_text()
+            for path in sorted(self._static_rules_path.rglob("*"))
+            if path.is_file()
+        }
+        inputs: SloAlertRulesInputs = self._inputs_getter()
+        if not self._validate(inputs):
+            files[self._rules_file_name] = Template(Path(self._template_path).read_text()).render(
+                webhook_latency_le=f"{inputs.webhook_latency_seconds:g}",
+                **dataclasses.asdict(inputs),
+            )
+
+        if self._sync_files(files) and self._on_changed is not None:
+            self._on_changed()
+
+    def _sync_files(self, files: Dict[str, str]) -> bool:
+        """Writes the files that changed and removes the others, returning whether any did."""
+        changed = False
+        self._destination_dir.mkdir(parents=True, exist_ok=True)
+        for path in self._destination_dir.rglob("*"):
+            if path.is_file() and str(path.relative_to(self._destination_dir)) not in files:
+                logger.info(f"Removing alert rules {path}.")
+                path.unlink()
+                changed = True
+        for name, content in files.items():
+            path = self._destination_dir / name
+            if path.exists() and path.read_text() == content:
+                continue
+            logger.info(f"Writing alert rules {path}.")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(content)
+            changed = True
+        return changed
+
+    @staticmethod
+    def _validate(inputs: SloAlertRulesInputs) -> List[str]:
+        """Returns the list of config errors, empty if all thresholds are valid."""
+        errors = []
+        if inputs.webhook_latency_seconds not in WEBHOOK_LATENCY_BUCKETS:
+            errors.append(
+                "webhook-latency-slo-seconds must be one of "
+                f"{', '.join(f'{le:g}' for le in WEBHOOK_LATENCY_BUCKETS)}"
+            )
+        for name, objective in [
+            ("webhook-latency-slo-objective", inputs.webhook_latency_objective),
+            ("reconcile-error-slo-objective", inputs.reconcile_error_objective),
+        ]:
+            if not 0 < objective < 1:
+                errors.append(f"{name} must be between 0 and 1")
+        if not 0 < inputs.memory_limit_ratio <= 1:
+            errors.append("memory-alert-limit-ratio must be between 0 and 1")
+        for name, threshold in [
+            ("workqueue-depth-alert-threshold", inputs.workqueue_depth_threshold),
+            ("workqueue-unfinished-work-alert-seconds", inputs.workqueue_unfinished_work_seconds),
+            ("rate-limiter-wait-alert-seconds", inputs.rate_limiter_wait_seconds),
+            ("memory-alert-limit-bytes", inputs.memory_limit_bytes),
+        ]:
+            if threshold <= 0:
+                errors.append(f"{name} must be positive")
+        return errors
+
+    def get_status(self) -> StatusBase:
+        """Returns Blocked if the config holds invalid alert thresholds."""
+        errors = self._validate(self._inputs_getter())
+        if errors:
+            return BlockedStatus(f"Invalid SLO alert config: {'; '.join(errors)}")
+        return ActiveStatus()
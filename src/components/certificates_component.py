@@ -0,0 +1,308 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+import logging
+from base64 import b64encode
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from charmed_kubeflow_chisme.components import Component
+from ops import ActiveStatus, Relation, Secret, StatusBase, WaitingStatus
+
+from certs import gen_certs, get_certificate_expiry
+
+logger = logging.getLogger(__name__)
+
+CERT_ATTRIBUTES = ["cert", "key", "ca"]
+# Secret keys must be at least 3 characters long, so the CA is stored under a longer name
+SECRET_KEYS = {"cert": "cert", "key": "key", "ca": "ca-cert"}
+# CAs trusted by the webhook configurations, which holds both CAs during a rotation
+CA_BUNDLE_SECRET_KEY = "ca-bundle"
+# Certificates generated by a rotation that are not being served yet
+PENDING_SECRET_PREFIX = "pending-"
+CERTS_SECRET_LABEL = "webhook-certificates"
+
+# Peer relation application databag
+SECRET_ID_KEY = "certs-secret-id"
+SECRET_REVISION_KEY = "certs-secret-revision"
+NOT_AFTER_KEY = "certs-not-after"
+CA_BUNDLE_APPLIED_KEY = "ca-bundle-applied-revision"
+# Peer relation unit databag
+PUSHED_REVISION_KEY = "certs-pushed-revision"
+
+# Rotate the serving certificate this long before it expires
+RENEWAL_WINDOW = timedelta(days=30)
+
+
+class WebhookCertificatesComponent(Component):
+    """Component that shares one set of webhook serving certificates across all units.
+
+    The leader generates the certificates once and stores them in an application-owned Juju
+    secret.  The secret id and a revision number are published in the application databag of
+    the peer relation, so every unit reads the same certificates and can detect a change by
+    comparing a single revision number.
+
+    The leader also rotates the certificates before they expire, without any window in which the
+    API server does not trust the certificate served by a unit:
+
+    1. a new CA and certificate are generated and kept aside as pending, while the CA bundle
+       used in the webhook configurations and CRD trusts both the old and the new CA
+    2. once that CA bundle has been applied to the cluster, the pending certificate is promoted
+       and every unit pushes it into its container, where the controller reloads it from disk
+    3. once every unit reports having pushed it, the old CA is dropped from the CA bundle
+    """
+
+    def __init__(
+        self,
+        *args,
+        service_name: str,
+        namespace: str,
+        webhook_service: str,
+        peer_relation_name: str = "pvcviewer-peers",
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+
+        self._service_name = service_name
+        self._namespace = namespace
+        self._webhook_service = webhook_service
+        self._peer_relation_name = peer_relation_name
+
+        # Secret content and derived values, cached for the revision they were read at
+        self._cached_revision: Optional[int] = None
+        self._cached_content: Dict[str, str] = {}
+        self._cached_ca_bundle: Optional[str] = None
+
+        self._events_to_observe = [
+            self._charm.on[self._peer_relation_name].relation_created,
+            self._charm.on[self._peer_relation_name].relation_changed,
+        ]
+
+    def _configure_app_leader(self, event):
+        """Generate the certificates if they do not exist yet, rotating them when needed."""
+        relation = self.model.get_relation(self._peer_relation_name)
+        if relation is None:
+            logger.info("Peer relation not yet available, cannot publish certificates.")
+            return
+
+        if not relation.data[self._charm.app].get(SECRET_ID_KEY):
+            self._create_secret(relation)
+            return
+
+        # A revision created by secret-set may only be reported once the hook that set it
+        # completed, so the published revision is brought up to date on each reconcile
+        secret = self.model.get_secret(id=self._get_app_data(SECRET_ID_KEY))
+        self._publish_revision(relation, secret)
+
+        content = self._get_content()
+        if content.get(f"{PENDING_SECRET_PREFIX}cert"):
+            if self._get_app_data(CA_BUNDLE_APPLIED_KEY) == str(self.revision):
+                self._promote_pending_certificates(relation, content)
+            else:
+                logger.info("Waiting for the CA bundle to be applied before promoting the certs.")
+        elif content[CA_BUNDLE_SECRET_KEY] != content[SECRET_KEYS["ca"]]:
+            if self._all_units_pushed(relation):
+                self._drop_previous_ca(relation, content)
+            else:
+                logger.info("Waiting for all units to serve the new certs to drop the old CA.")
+        elif self.expires_at - datetime.now(timezone.utc) < RENEWAL_WINDOW:
+            self._start_rotation(relation, content)
+
+    def _create_secret(self, relation: Relation):
+        """Create the certificates secret, publishing its id in the peer relation."""
+        app_data = relation.data[self._charm.app]
+        if all(app_data.get(attr) for attr in CERT_ATTRIBUTES):
+            # Certificates shared through the databag by a previous revision of the charm
+            logger.info("Moving certificates from the peer relation into a secret.")
+            certs = {attr: app_data[attr] for attr in CERT_ATTRIBUTES}
+        else:
+            logger.info("Generating certificates..")
+            certs = self._gen_certs()
+
+        content = {SECRET_KEYS[attr]: certs[attr] for attr in CERT_ATTRIBUTES}
+        content[CA_BUNDLE_SECRET_KEY] = certs["ca"]
+        secret = self._charm.app.add_secret(content, label=CERTS_SECRET_LABEL)
+        app_data.update(
+            {
+                SECRET_ID_KEY: secret.id,
+                SECRET_REVISION_KEY: str(secret.get_info().revision),
+                NOT_AFTER_KEY: get_certificate_expiry(certs["cert"]).isoformat(),
+                **{attr: "" for attr in CERT_ATTRIBUTES},
+            }
+        )
+
+    def _start_rotation(self, relation: Relation, content: Dict[str, str]):
+        """Generate new certificates as pending, and trust both the old and new CAs."""
+        logger.info(f"Certificates expire at {self.expires_at}, starting rotation.")
+        certs = self._gen_certs()
+        new_content = dict(content)
+        new_content.update(
+            {
+                f"{PENDING_SECRET_PREFIX}{SECRET_KEYS[attr]}": certs[attr]
+                for attr in CERT_ATTRIBUTES
+            }
+        )
+        new_content[CA_BUNDLE_SECRET_KEY] = content[SECRET_KEYS["ca"]] + certs["ca"]
+        self._set_content(relation, new_content)
+
+    def _promote_pending_certificates(self, relation: Relation, content: Dict[str, str]):
+        """Serve the pending certificates, still trusting the old CA until every unit has them."""
+        logger.info("CA bundle with the new CA has been applied, promoting the new certificates.")
+        new_content = {
+            SECRET_KEYS[attr]: content[f"{PENDING_SECRET_PREFIX}{SECRET_KEYS[attr]}"]
+            for attr in CERT_ATTRIBUTES
+        }
+        new_content[CA_BUNDLE_SECRET_KEY] = content[CA_BUNDLE_SECRET_KEY]
+        self._set_content(
+            relation,
+            new_content,
+            not_after=get_certificate_expiry(new_content[SECRET_KEYS["cert"]]),
+        )
+
+    def _drop_previous_ca(self, relation: Relation, content: Dict[str, str]):
+        """Trust only the current CA, once no unit serves a certificate from the old one."""
+        logger.info("All units serve the new certificates, removing the old CA from the bundle.")
+        new_content = dict(content)
+        new_content[CA_BUNDLE_SECRET_KEY] = content[SECRET_KEYS["ca"]]
+        self._set_content(relation, new_content)
+
+    def _set_content(
+        self, relation: Relation, content: Dict[str, str], not_after: Optional[datetime] = None
+    ):
+        """Update the secret content and publish the new revision to all units."""
+        secret = self.model.get_secret(id=self._get_app_data(SECRET_ID_KEY))
+        secret.set_content(content)
+        if not_after is not None:
+            relation.data[self._charm.app][NOT_AFTER_KEY] = not_after.isoformat()
+        self._cached_content = content
+        self._cached_ca_bundle = None
+        self._cached_revision = self._publish_revision(relation, secret)
+
+    def _publish_revision(self, relation: Relation, secret: Secret) -> int:
+        """Publishes the actual revision of the secret to all units, returning it."""
+        # The owner also tracks a revision, moved to the latest one by a refresh
+        secret.get_content(refresh=True)
+        revision = secret.get_info().revision
+        if self.revision != revision:
+            relation.data[self._charm.app][SECRET_REVISION_KEY] = str(revision)
+        return revision
+
+    def _all_units_pushed(self, relation: Relation) -> bool:
+        """Returns True if every unit pushed the current revision into its container."""
+        revision = str(self.revision)
+        units = set(relation.units) | {self._charm.unit}
+        return all(relation.data[unit].get(PUSHED_REVISION_KEY) == revision for unit in units)
+
+    def _gen_certs(self) -> Dict[str, str]:
+        """Generate a new CA and webhook server certificate."""
+        return gen_certs(
+            service_name=self._service_name,
+            namespace=self._namespace,
+            webhook_service=self._webhook_service,
+        )
+
+    def ca_bundle_applied(self):
+        """Record that the current CA bundle is now used by the cluster's webhook configurations.
+
+        Called by the leader after successfully applying the Kubernetes resources.
+        """
+        relation = self.model.get_relation(self._peer_relation_name)
+        if relation is None or self.revision is None:
+            return
+        relation.data[self._charm.app][CA_BUNDLE_APPLIED_KEY] = str(self.revision)
+
+    def _get_app_data(self, key: str) -> Optional[str]:
+        """Returns a value from the peer relation application databag, or None if missing."""
+        relation = self.model.get_relation(self._peer_relation_name)
+        if relation is None:
+            return None
+        return relation.data[self._charm.app].get(key) or None
+
+    @property
+    def revision(self) -> Optional[int]:
+        """Returns the revision of the certificates secret, or None if not yet published."""
+        revision = self._get_app_data(SECRET_REVISION_KEY)
+        return int(revision) if revision is not None else None
+
+    @property
+    def pushed_revision(self) -> Optional[int]:
+        """Returns the revision this unit last pushed into its container."""
+        relation = self.model.get_relation(self._peer_relation_name)
+        if relation is None:
+            return None
+        revision = relation.data[self._charm.unit].get(PUSHED_REVISION_KEY)
+        return int(revision) if revision else None
+
+    @pushed_revision.setter
+    def pushed_revision(self, revision: int):
+        """Records the revision pushed by this unit, telling the leader it serves it."""
+        relation = self.model.get_relation(self._peer_relation_name)
+        if relation is None:
+            return
+        relation.data[self._charm.unit][PUSHED_REVISION_KEY] = str(revision)
+
+    @property
+    def expires_at(self) -> datetime:
+        """Returns the expiry of the served certificate, parsed once when it was issued."""
+        not_after = self._get_app_data(NOT_AFTER_KEY)
+        if not_after is None:
+            # Published before expiry tracking existed, parse it now and keep it
+            expires_at = get_certificate_expiry(self.cert)
+            if self._charm.unit.is_leader():
+                relation = self.model.get_relation(self._peer_relation_name)
+                relation.data[self._charm.app][NOT_AFTER_KEY] = expires_at.isoformat()
+            return expires_at
+        return datetime.fromisoformat(not_after)
+
+    def _get_content(self) -> Dict[str, str]:
+        """Returns the secret content, reading it only when the published revision changed."""
+        revision = self.revision
+        if revision is None:
+            return {}
+        if revision != self._cached_revision:
+            secret = self.model.get_secret(id=self._get_app_data(SECRET_ID_KEY))
+            # Only read when the revision changed, so always move to the latest revision
+            content = secret.get_content(refresh=True)
+            # Secrets written before CA bundle tracking only trust their own CA
+            content.setdefault(CA_BUNDLE_SECRET_KEY, content[SECRET_KEYS["ca"]])
+            self._cached_content = content
+            self._cached_ca_bundle = None
+            self._cached_revision = revision
+        return self._cached_content
+
+    @property
+    def cert(self) -> Optional[str]:
+        """Returns the webhook server certificate."""
+        return self._get_content().get(SECRET_KEYS["cert"])
+
+    @property
+    def key(self) -> Optional[str]:
+        """Returns the webhook server private key."""
+        return self._get_content().get(SECRET_KEYS["key"])
+
+    @property
+    def ca(self) -> Optional[str]:
+        """Returns the CA certificate that signed the webhook server certificate."""
+        return self._get_content().get(SECRET_KEYS["ca"])
+
+    @property
+    def ca_bundle(self) -> Optional[str]:
+        """Returns the base64 encoded CA bundle, as used in the caBundle of webhook configs.
+
+        During a rotation the bundle holds both the old and the new CA.
+        """
+        bundle = self._get_content().get(CA_BUNDLE_SECRET_KEY)
+        if bundle is None:
+            return None
+        if self._cached_ca_bundle is None:
+            self._cached_ca_bundle = b64encode(bundle.encode("ascii")).decode("utf-8")
+        return self._cached_ca_bundle
+
+    def get_status(self) -> StatusBase:
+        """Returns Active once the shared certificates are available to this unit."""
+        if self.model.get_relation(self._peer_relation_name) is None:
+            return WaitingStatus("Waiting for peer relation")
+
+        if self.revision is None:
+            return WaitingStatus("Waiting for the leader to generate webhook certificates")
+
+        return ActiveStatus()
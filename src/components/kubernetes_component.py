@@ -0,0 +1,148 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Any, Callable, Iterator, List, Optional
+
+import yaml
+from charmed_kubeflow_chisme.components.kubernetes_component import KubernetesComponent
+from charmed_kubeflow_chisme.exceptions import GenericCharmRuntimeError
+from jinja2 import Template
+from lightkube.core.exceptions import ApiError
+from lightkube.types import PatchType
+from ops.framework import StoredState
+
+logger = logging.getLogger(__name__)
+
+CA_BUNDLE_FIELD = "caBundle"
+
+
+class PvcViewerKubernetesComponent(KubernetesComponent):
+    """KubernetesComponent that only sends what changed to the API server.
+
+    The full manifests are applied only when the templates or their context (other than the CA
+    bundle) change, or when resources are missing from the cluster.  A change of the CA bundle
+    alone is sent as a JSON patch of the caBundle fields found in the rendered manifests, so that
+    the large CRD schema is not resent and the API server does not rebuild its OpenAPI spec and
+    validators for it.
+
+    Resources are also kept while other units of the app remain.  The upstream component deletes
+    every resource on any unit's remove event, which with more than one unit would drop the CRD
+    and webhook configurations on a simple scale down.
+    """
+
+    _stored = StoredState()
+
+    def __init__(
+        self,
+        *args,
+        on_applied: Optional[Callable[[], None]] = None,
+        ca_bundle_getter: Optional[Callable[[], str]] = None,
+        ca_bundle_context_key: str = "cert",
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self._on_applied = on_applied
+        self._ca_bundle_getter = ca_bundle_getter
+        self._ca_bundle_context_key = ca_bundle_context_key
+        self._stored.set_default(applied_manifests_hash=None, applied_ca_bundle_hash=None)
+
+    def _configure_app_leader(self, event):
+        """Applies the resources, or only patches the CA bundle if nothing else changed.
+
+        Notifies on_applied once the cluster is up to date.
+        """
+        context = self._context_callable()
+        manifests_hash = self._hash_manifests(context)
+        ca_bundle = self._ca_bundle_getter() if self._ca_bundle_getter else None
+        ca_bundle_hash = _sha256(ca_bundle or "")
+
+        if (
+            manifests_hash != self._stored.applied_manifests_hash
+            or self._get_missing_kubernetes_resources()
+        ):
+            logger.info("Kubernetes manifests changed or missing, applying all resources.")
+            super()._configure_app_leader(event)
+        elif ca_bundle_hash != self._stored.applied_ca_bundle_hash:
+            logger.info("Only the CA bundle changed, patching the caBundle fields.")
+            self._patch_ca_bundle(context, ca_bundle)
+        else:
+            logger.info("Kubernetes resources are up to date, skipping apply.")
+
+        self._stored.applied_manifests_hash = manifests_hash
+        self._stored.applied_ca_bundle_hash = ca_bundle_hash
+        if self._on_applied is not None:
+            self._on_applied()
+
+    def _patch_ca_bundle(self, context: dict, ca_bundle: str):
+        """Sends a JSON patch replacing only the caBundle fields of the rendered resources.
+
+        The resources and the position of their caBundle fields are read from the manifests
+        rendered with the current context, so they follow any change to the templates.
+        """
+        resource_types = {
+            resource_type.__name__: resource_type for resource_type in self._krh_resource_types
+        }
+        for manifest in self._render_manifests(context):
+            paths = list(_find_field_paths(manifest, CA_BUNDLE_FIELD))
+            if not paths:
+                continue
+            resource_type = resource_types[manifest["kind"]]
+            metadata = manifest["metadata"]
+            patch = [{"op": "add", "path": path, "value": ca_bundle} for path in paths]
+            try:
+                self._lightkube_client.patch(
+                    resource_type,
+                    metadata["name"],
+                    obj=patch,
+                    namespace=metadata.get("namespace"),
+                    patch_type=PatchType.JSON,
+                )
+            except ApiError as e:
+                raise GenericCharmRuntimeError(
+                    f"Failed to patch caBundle of {manifest['kind']} {metadata['name']}"
+                ) from e
+
+    def _render_manifests(self, context: dict) -> List[dict]:
+        """Returns the resources rendered from the templates, as plain dicts."""
+        manifests = []
+        for template in self._resource_templates:
+            rendered = Template(Path(template).read_text()).render(**context)
+            manifests.extend(doc for doc in yaml.safe_load_all(rendered) if doc)
+        return manifests
+
+    def _hash_manifests(self, context: dict) -> str:
+        """Returns a hash of the templates and their context, excluding the CA bundle."""
+        context = {k: v for k, v in context.items() if k != self._ca_bundle_context_key}
+        sources = [Path(template).read_text() for template in self._resource_templates]
+        return _sha256(json.dumps([sources, context, self._krh_labels], sort_keys=True))
+
+    def remove(self, event):
+        """Removes all deployed resources, but only when the whole application is removed."""
+        if self._charm.app.planned_units() > 0:
+            logger.info("Application is not being removed, keeping Kubernetes resources.")
+            return
+        super().remove(event)
+
+
+def _find_field_paths(obj: Any, field: str, path: str = "") -> Iterator[str]:
+    """Yields the JSON pointers of every occurrence of a field in a resource."""
+    if isinstance(obj, dict):
+        items = obj.items()
+    elif isinstance(obj, list):
+        items = enumerate(obj)
+    else:
+        return
+    for key, value in items:
+        pointer = f"{path}/{str(key).replace('~', '~0').replace('/', '~1')}"
+        if key == field:
+            yield pointer
+        else:
+            yield from _find_field_paths(value, field, pointer)
+
+
+def _sha256(value: str) -> str:
+    """Returns the hex sha256 digest of a string."""
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
@@ -2,12 +2,20 @@
 # See LICENSE file for licensing details.
 import dataclasses
 import logging
+from typing import List
 
 from charmed_kubeflow_chisme.components.pebble_component import PebbleServiceComponent
-from ops.pebble import Layer
+from ops import ActiveStatus, StatusBase, WaitingStatus
+from ops.pebble import CheckStatus, Layer, ServiceInfo
+
+from components.certificates_component import WebhookCertificatesComponent
 
 logger = logging.getLogger(__name__)
 
+HEALTH_PROBE_PORT = 8081
+ALIVE_CHECK_NAME = "pvcviewer-alive"
+READY_CHECK_NAME = "pvcviewer-ready"
+
 
 @dataclasses.dataclass
 class PvcViewerInputs:
@@ -16,9 +24,15 @@ class PvcViewerInputs:
     gateway_name: str
     gateway_namespace: str
     istio_ambient: bool
+    health_check_period: str
+    health_check_threshold: int
 
 
 class PvcViewerPebbleService(PebbleServiceComponent):
+    def __init__(self, *args, certificates: WebhookCertificatesComponent, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._certificates = certificates
+
     def get_layer(self) -> Layer:
         """Defines and returns Pebble layer configuration
 
@@ -47,7 +61,89 @@ class PvcViewerPebbleService(PebbleServiceComponent):
                             "EXPERIMENTAL_K8S_GATEWAY_NAME": inputs.gateway_name,
                             "EXPERIMENTAL_K8S_GATEWAY_NAMESPACE": inputs.gateway_namespace,
                         },
+                        # Restart the controller when its liveness probe stops answering
+                        "on-check-failure": {ALIVE_CHECK_NAME: "restart"},
                     }
                 },
+                "checks": {
+                    ALIVE_CHECK_NAME: {
+                        "override": "replace",
+                        "level": "alive",
+                        "period": inputs.health_check_period,
+                        "threshold": inputs.health_check_threshold,
+                        "http": {"url": f"http://localhost:{HEALTH_PROBE_PORT}/healthz"},
+                    },
+                    READY_CHECK_NAME: {
+                        "override": "replace",
+                        "level": "ready",
+                        "period": inputs.health_check_period,
+                        "threshold": inputs.health_check_threshold,
+                        "http": {"url": f"http://localhost:{HEALTH_PROBE_PORT}/readyz"},
+                    },
+                },
             }
         )
+
+    def _push_files_to_container(self):
+        """Pushes the certificate files, unless this revision is already in the container.
+
+        The container filesystem does not survive a restart of the workload container, so the
+        files are pushed again if they are missing even when the revision did not change.  The
+        controller watches the files and reloads a rotated certificate without a restart.
+        """
+        revision = self._certificates.revision
+        container = self._charm.unit.get_container(self.container_name)
+        if (
+            revision is not None
+            and revision == self._certificates.pushed_revision
+            and all(container.exists(file.destination_path) for file in self._files_to_push)
+        ):
+            logger.info(f"Certificates revision {revision} already pushed, skipping.")
+            return
+
+        super()._push_files_to_container()
+        self._certificates.pushed_revision = revision
+
+    def _update_layer(self):
+        """Updates the Pebble layer, re-planning when either the services or checks changed.
+
+        The upstream implementation only compares services, which would leave stale checks in
+        place after a change to the health check configuration.  Only the services and checks of
+        this layer are compared, as the container also runs the charm metrics service.
+        """
+        container = self._charm.unit.get_container(self.container_name)
+        new_layer = self.get_layer()
+
+        current_layer = container.get_plan()
+        current_services = {name: current_layer.services.get(name) for name in new_layer.services}
+        current_checks = {name: current_layer.checks.get(name) for name in new_layer.checks}
+        if current_services != new_layer.services or current_checks != new_layer.checks:
+            container.add_layer(self.container_name, new_layer, combine=True)
+            container.replan()
+
+    def get_services_not_active(self) -> List[ServiceInfo]:
+        """Returns the services of this layer which are not active, ignoring other services."""
+        service_names = self.get_layer().services.keys()
+        return [
+            service
+            for service in super().get_services_not_active()
+            if service.name in service_names
+        ]
+
+    def get_status(self) -> StatusBase:
+        """Returns the status of the service, including the state of its Pebble health checks."""
+        status = super().get_status()
+        if not isinstance(status, ActiveStatus):
+            return status
+
+        container = self._charm.unit.get_container(self.container_name)
+        checks_down = [
+            check.name
+            for check in container.get_checks(ALIVE_CHECK_NAME, READY_CHECK_NAME).values()
+            if check.status != CheckStatus.UP
+        ]
+        if checks_down:
+            return WaitingStatus(
+                f"Waiting for Pebble health checks ({', '.join(sorted(checks_down))}) to pass."
+            )
+        return ActiveStatus()
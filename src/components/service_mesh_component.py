@@ -132,6 +132,9 @@ class ServiceMeshComponent(Component):
 
     def remove(self, event):
         """Remove all policies on charm removal."""
+        if self._charm.app.planned_units() > 0:
+            logger.info("Application is not being removed, keeping policies.")
+            return
         self._policy_resource_manager.reconcile(
             policies=[], mesh_type=MeshType.istio, raw_policies=[]
         )
@@ -0,0 +1,454 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+"""Charm-side label matcher injection for the CosTool of the charm libraries."""
+
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ops import CharmBase, Object
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = ".cos-tool-cache.json"
+CACHE_SIZE = 2048
+
+# Labels of a rule which are injected as label matchers into its expression
+TOPOLOGY_LABELS = ["juju_model", "juju_model_uuid", "juju_application", "juju_charm", "juju_unit"]
+
+
+class UnsupportedExpressionError(Exception):
+    """Raised if an expression is outside of what LabelMatcherInjector can transform."""
+
+
+class LabelMatcherInjector:
+    """Injects label matchers into PromQL and LogQL expressions without calling cos-tool.
+
+    Only the subset of both languages used in alert rules and dashboards is understood:
+    selectors, function calls, aggregations with grouping, binary and set operators, range
+    vectors, subqueries, offsets and Grafana variables (such as `$__interval` or `${job}`).
+    Everything else raises `UnsupportedExpressionError`, so that the caller can fall back to
+    cos-tool.
+
+    The expression is otherwise left as written, with the matchers appended to each selector
+    in the order cos-tool emits them: sorted by label, comma separated in PromQL and comma
+    and space separated in LogQL.
+    """
+
+    # Aggregation operators, which may be followed by a grouping clause instead of `(`
+    _AGGREGATIONS = {
+        "sum",
+        "min",
+        "max",
+        "avg",
+        "group",
+        "stddev",
+        "stdvar",
+        "count",
+        "count_values",
+        "bottomk",
+        "topk",
+        "quantile",
+        "limitk",
+        "limit_ratio",
+    }
+    # Keywords followed by a parenthesised list of label names
+    _GROUPING_KEYWORDS = {"by", "without", "on", "ignoring", "group_left", "group_right"}
+    _KEYWORDS = {"and", "or", "unless", "bool", "offset", "atan2", "inf", "nan"}
+
+    _IDENTIFIER_RE = re.compile(r"[a-zA-Z_:][a-zA-Z0-9_:]*")
+    _NUMBER_RE = re.compile(r"0[xX][0-9a-fA-F]+|(?:\d|\.\d)(?:[\w.]|(?<=[eE])[+-])*")
+    _VARIABLE_RE = re.compile(r"\$\{[^}]*\}|\$\w+|\[\[[^\]]*\]\]")
+    _MATCHER_RE = re.compile(r"\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*(=~|!~|!=|=)\s*(?=[\"'`])")
+    _OPERATORS = set("+-*/%^=!<>~,()@ \t\r\n")
+
+    @classmethod
+    def inject(cls, expression: str, matchers: Dict[str, str], query_type: str) -> str:
+        """Return the expression with the matchers added to every selector.
+
+        Args:
+            expression: a PromQL or LogQL expression
+            matchers: label names and the values they should equal
+            query_type: either "promql" or "logql"
+        Returns:
+            the transformed expression
+        Raises:
+            UnsupportedExpressionError: if the expression cannot be handled in-process
+        """
+        if query_type == "promql":
+            return cls._inject_promql(expression, matchers)
+        if query_type == "logql":
+            return cls._inject_logql(expression, matchers)
+        raise UnsupportedExpressionError(f"Unknown query type {query_type}")
+
+    @classmethod
+    def _inject_promql(cls, expr: str, matchers: Dict[str, str]) -> str:
+        out: List[str] = []
+        pos = 0
+        selectors = 0
+        while pos < len(expr):
+            char = expr[pos]
+            if char in "\"'`":
+                end = cls._string_end(expr, pos)
+                out.append(expr[pos:end])
+                pos = end
+            elif char == "#":
+                raise UnsupportedExpressionError("Comments are not supported")
+            elif char == "$" or expr.startswith("[[", pos):
+                match = cls._VARIABLE_RE.match(expr, pos)
+                if not match:
+                    raise UnsupportedExpressionError(f"Malformed variable at {pos}")
+                out.append(match.group())
+                pos = match.end()
+            elif char == "[":
+                # Range or subquery durations, which cannot contain selectors
+                end = cls._closing(expr, pos, "[", "]")
+                out.append(expr[pos:end])
+                pos = end
+            elif char == "{":
+                end = cls._closing(expr, pos, "{", "}")
+                out.append(cls._with_matchers(expr[pos:end], matchers, ","))
+                selectors += 1
+                pos = end
+            elif char.isdigit() or (char == "." and expr[pos:][1:2].isdigit()):
+                match = cls._NUMBER_RE.match(expr, pos)
+                out.append(match.group())  # type: ignore
+                pos = match.end()  # type: ignore
+            elif cls._IDENTIFIER_RE.match(expr, pos):
+                match = cls._IDENTIFIER_RE.match(expr, pos)
+                name = match.group()  # type: ignore
+                pos = match.end()  # type: ignore
+                following = cls._skip_whitespace(expr, pos)
+                next_char = expr[following:][:1]
+                lowered = name.lower()
+                if lowered in cls._GROUPING_KEYWORDS:
+                    out.append(name)
+                    if next_char == "(":
+                        end = cls._closing(expr, following, "(", ")")
+                        out.append(expr[pos:end])
+                        pos = end
+                elif lowered in cls._KEYWORDS or next_char == "(":
+                    # Operators, numbers, functions and aggregations
+                    out.append(name)
+                elif name in cls._AGGREGATIONS and expr.startswith(("by", "without"), following):
+                    out.append(name)
+                elif next_char == "{":
+                    end = cls._closing(expr, following, "{", "}")
+                    out.append(name + cls._with_matchers(expr[following:end], matchers, ","))
+                    selectors += 1
+                    pos = end
+                else:
+                    out.append(name + cls._format_matchers([], matchers, ","))
+                    selectors += 1
+            elif char in cls._OPERATORS:
+                out.append(char)
+                pos += 1
+            else:
+                raise UnsupportedExpressionError(f"Unexpected '{char}' at {pos}")
+        if not selectors:
+            raise UnsupportedExpressionError("No selector found")
+        return "".join(out)
+
+    @classmethod
+    def _inject_logql(cls, expr: str, matchers: Dict[str, str]) -> str:
+        # Stream selectors are the only place braces appear outside of strings and templates
+        out: List[str] = []
+        pos = 0
+        selectors = 0
+        while pos < len(expr):
+            char = expr[pos]
+            if char in "\"'`":
+                end = cls._string_end(expr, pos)
+                out.append(expr[pos:end])
+                pos = end
+            elif char == "[":
+                end = cls._closing(expr, pos, "[", "]")
+                out.append(expr[pos:end])
+                pos = end
+            elif char == "{":
+                end = cls._closing(expr, pos, "{", "}")
+                out.append(cls._with_matchers(expr[pos:end], matchers, ", "))
+                selectors += 1
+                pos = end
+            elif char in "}]":
+                raise UnsupportedExpressionError(f"Unbalanced '{char}' at {pos}")
+            else:
+                out.append(char)
+                pos += 1
+        if not selectors:
+            raise UnsupportedExpressionError("No stream selector found")
+        return "".join(out)
+
+    @classmethod
+    def _with_matchers(cls, braces: str, matchers: Dict[str, str], separator: str) -> str:
+        """Add matchers to a `{...}` block, which must only hold label matchers."""
+        inner = braces[1:-1]
+        labels = []
+        pos = 0
+        while inner[pos:].strip():
+            match = cls._MATCHER_RE.match(inner, pos)
+            if not match:
+                raise UnsupportedExpressionError(f"Unexpected label matchers {braces}")
+            labels.append(match.group(1))
+            pos = cls._skip_whitespace(inner, cls._string_end(inner, match.end()))
+            if inner[pos:][:1] == ",":
+                pos += 1
+            elif inner[pos:].strip():
+                raise UnsupportedExpressionError(f"Unexpected label matchers {braces}")
+        if set(labels) & set(matchers):
+            # Leave it to cos-tool to decide how an existing matcher is overridden
+            raise UnsupportedExpressionError(f"Matcher already set in {braces}")
+        existing = inner.strip().rstrip(",").rstrip()
+        return cls._format_matchers([existing] if existing else [], matchers, separator)
+
+    @staticmethod
+    def _format_matchers(existing: List[str], matchers: Dict[str, str], separator: str) -> str:
+        injected = [f'{name}="{_escape(matchers[name])}"' for name in sorted(matchers)]
+        return "{" + separator.join(existing + injected) + "}"
+
+    @staticmethod
+    def _string_end(expr: str, pos: int) -> int:
+        """Return the position after the string literal starting at `pos`."""
+        quote = expr[pos]
+        index = pos + 1
+        while index < len(expr):
+            if expr[index] == "\\" and quote != "`":
+                index += 2
+                continue
+            if expr[index] == quote:
+                return index + 1
+            index += 1
+        raise UnsupportedExpressionError(f"Unterminated string at {pos}")
+
+    @classmethod
+    def _closing(cls, expr: str, pos: int, opening: str, closing: str) -> int:
+        """Return the position after the bracket closing the one at `pos`, skipping strings."""
+        depth = 0
+        index = pos
+        while index < len(expr):
+            char = expr[index]
+            if char in "\"'`":
+                index = cls._string_end(expr, index)
+                continue
+            if char == opening:
+                depth += 1
+            elif char == closing:
+                depth -= 1
+                if depth == 0:
+                    return index + 1
+            index += 1
+        raise UnsupportedExpressionError(f"Unbalanced '{opening}' at {pos}")
+
+    @staticmethod
+    def _skip_whitespace(expr: str, pos: int) -> int:
+        while pos < len(expr) and expr[pos].isspace():
+            pos += 1
+        return pos
+
+
+class CosToolCache(Object):
+    """Expressions transformed by cos-tool, kept across hooks in the unit state directory.
+
+    The entries are loaded on first use in a dispatch, and written back once when the framework
+    commits, if any was added.  Beyond `size` entries, the least recently used ones are evicted.
+    Entries transformed by another cos-tool binary are dropped when loaded.
+    """
+
+    def __init__(
+        self,
+        charm: CharmBase,
+        path: Optional[Path] = None,
+        size: int = CACHE_SIZE,
+    ):
+        super().__init__(charm, "cos-tool-cache")
+        if path is None:
+            # Juju keeps the unit state directory next to the charm directory
+            state_dir = self.framework.charm_dir.parent / "state"
+            path = state_dir / CACHE_FILE if state_dir.is_dir() else None
+        self._path = path
+        self._size = size
+        self._entries: Optional["OrderedDict[str, str]"] = None
+        self._version: Optional[str] = None
+        self._dirty = False
+
+        self.framework.observe(self.framework.on.commit, self._on_commit)
+
+    def get(self, key: str, version: str) -> Optional[str]:
+        """Returns the cached transformation, or None if it is not cached for this cos-tool."""
+        entries = self._load(version)
+        if key not in entries:
+            return None
+        entries.move_to_end(key)
+        return entries[key]
+
+    def set(self, key: str, version: str, transformed: str):
+        """Caches a transformation, evicting the least recently used ones."""
+        entries = self._load(version)
+        entries[key] = transformed
+        while len(entries) > self._size:
+            entries.popitem(last=False)
+        self._dirty = True
+
+    def _load(self, version: str) -> "OrderedDict[str, str]":
+        if self._entries is not None and self._version == version:
+            return self._entries
+        self._entries = OrderedDict()
+        self._version = version
+        try:
+            if self._path and self._path.exists():
+                data = json.loads(self._path.read_text())
+                if data.get("version") == version:
+                    self._entries.update(data["entries"])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.debug(f"Ignoring the unreadable cos-tool cache: {e}")
+        return self._entries
+
+    def _on_commit(self, _):
+        """Writes the entries back to the unit state directory, if any was added."""
+        if not self._dirty or self._entries is None or not self._path:
+            return
+        try:
+            tmp_path = self._path.with_name(self._path.name + ".tmp")
+            tmp_path.write_text(
+                json.dumps({"version": self._version, "entries": list(self._entries.items())})
+            )
+            os.replace(tmp_path, self._path)
+            self._dirty = False
+        except OSError as e:
+            logger.debug(f"Could not write the cos-tool cache: {e}")
+
+
+class CharmCosTool:
+    """The CosTool of a charm library, injecting label matchers in-process first.
+
+    It replaces the CosTool held by an object of a charm library, such as::
+
+        consumer._tool = CharmCosTool(consumer._tool, "promql", self.cos_tool_cache)
+
+    Label matchers are injected by LabelMatcherInjector whenever it understands the expression,
+    so that they are injected even where no cos-tool binary ships.  The other expressions are
+    transformed by the library's CosTool, through the cache.  Everything else is left to the
+    library's CosTool.  Each time cos-tool runs, `on_run` is called with the name of the library,
+    so that the charm can count the runs.
+    """
+
+    def __init__(
+        self,
+        tool,
+        query_type: str,
+        cache: CosToolCache,
+        on_run: Optional[Callable[[str], None]] = None,
+    ):
+        self._tool = tool
+        self._query_type = query_type
+        self._cache = cache
+        self._on_run = on_run
+        self._library = type(tool).__module__.rsplit(".", 1)[-1]
+
+    def __getattr__(self, name: str):
+        return getattr(self._tool, name)
+
+    def validate_alert_rules(self, rules: dict) -> Tuple[bool, str]:
+        """Validates the rules with cos-tool, if there is one."""
+        self._count_run()
+        return self._tool.validate_alert_rules(rules)
+
+    def validate_scrape_jobs(self, jobs: list) -> bool:
+        """Validates the scrape jobs with cos-tool, if there is one."""
+        self._count_run()
+        return self._tool.validate_scrape_jobs(jobs)
+
+    def apply_label_matchers(self, rules: dict, query_type: Optional[str] = None) -> dict:
+        """Injects the topology labels of each rule of the groups into its expression."""
+        # Rules sharing the same topology are transformed together in one batch
+        batches: Dict[Tuple[Tuple[str, str], ...], List[dict]] = {}
+        for group in rules["groups"]:
+            for rule in group.get("rules", []):
+                labels = rule.get("labels", {})
+                topology = tuple(
+                    (label, labels[label]) for label in TOPOLOGY_LABELS if label in labels
+                )
+                batches.setdefault(topology, []).append(rule)
+
+        for topology, batch in batches.items():
+            expressions = self.inject_label_matchers_batch(
+                [rule["expr"] for rule in batch], dict(topology), query_type
+            )
+            for rule, expression in zip(batch, expressions):
+                rule["expr"] = expression
+        return rules
+
+    def inject_label_matchers_batch(
+        self, expressions: List[str], topology: dict, query_type: Optional[str] = None
+    ) -> List[str]:
+        """Injects label matchers into expressions, returning them in the same order."""
+        transformed: Dict[str, str] = {}
+        for expression in expressions:
+            if expression not in transformed:
+                transformed[expression] = self.inject_label_matchers(
+                    expression, topology, query_type
+                )
+        return [transformed[expression] for expression in expressions]
+
+    def inject_label_matchers(
+        self, expression: str, topology: dict, query_type: Optional[str] = None
+    ) -> str:
+        """Injects label matchers into an expression, in-process or else through the cache."""
+        if not topology:
+            return expression
+        try:
+            return self._inject_in_process(expression, topology, query_type or self._query_type)
+        except UnsupportedExpressionError as e:
+            logger.debug(f"Falling back to cos-tool to inject label matchers: {e}")
+
+        # Only the CosTool of grafana_dashboard takes a query type, which its callers pass
+        args = (query_type,) if query_type else ()
+        path = self._tool.path
+        if not path:
+            return self._tool.inject_label_matchers(expression, topology, *args)
+
+        version = _binary_version(path)
+        key = json.dumps([query_type or self._query_type, sorted(topology.items()), expression])
+        cached = self._cache.get(key, version)
+        if cached is not None:
+            return cached
+
+        self._count_run()
+        transformed = self._tool.inject_label_matchers(expression, topology, *args)
+        self._cache.set(key, version, transformed)
+        return transformed
+
+    def _count_run(self):
+        if self._on_run and self._tool.path:
+            self._on_run(self._library)
+
+    def _inject_in_process(self, expression: str, topology: dict, query_type: str) -> str:
+        return LabelMatcherInjector.inject(expression, topology, query_type)
+
+
+class CharmDashboardCosTool(CharmCosTool):
+    """CharmCosTool for the CosTool of grafana_dashboard.
+
+    Dashboards are shared by the units of an application, so the injected matchers match the
+    `$juju_*` variables of the dashboard as regular expressions, rather than the topology values.
+    """
+
+    def _inject_in_process(self, expression: str, topology: dict, query_type: str) -> str:
+        variables = {key: f"${key}" for key in topology}
+        transformed = LabelMatcherInjector.inject(expression, variables, query_type)
+        return re.sub(r'="\$juju', r'=~"$juju', transformed)
+
+
+def _binary_version(path) -> str:
+    """Identifies a cos-tool binary by its size and modification time."""
+    stat = Path(str(path)).stat()
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def _escape(value: str) -> str:
+    """Escapes a label value for a double-quoted string."""
+    return value.replace("\\", "\\\\").replace('"', '\\"')
@@ -10,5 +10,5 @@ resource "juju_application" "pvcviewer_operator" {
   name      = var.app_name
   resources = var.resources
   trust     = true
-  units     = 1
+  units     = var.units
 }
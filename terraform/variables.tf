@@ -38,3 +38,9 @@ variable "revision" {
   type        = number
   default     = null
 }
+
+variable "units" {
+  description = "Number of units to deploy"
+  type        = number
+  default     = 1
+}
@@ -0,0 +1,164 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+from pathlib import Path
+from unittest.mock import PropertyMock, patch
+
+import pytest
+from charms.grafana_k8s.v0.grafana_dashboard import CosTool as DashboardCosTool
+from charms.loki_k8s.v1.loki_push_api import CosTool as LokiCosTool
+from charms.prometheus_k8s.v0.prometheus_scrape import CosTool as PrometheusCosTool
+from ops.charm import CharmBase
+from ops.testing import Harness
+
+from cos_tool import CharmCosTool, CosToolCache
+
+TOPOLOGY = {"juju_model": "kubeflow", "juju_application": "pvcviewer-operator"}
+
+
+@pytest.fixture
+def dispatch():
+    """Returns a charm for a new dispatch each time it is called."""
+    harnesses = []
+
+    def new_dispatch() -> Harness:
+        harness = Harness(CharmBase, meta="name: pvcviewer-operator")
+        harness.begin()
+        harnesses.append(harness)
+        return harness
+
+    yield new_dispatch
+    for harness in harnesses:
+        harness.cleanup()
+
+
+@pytest.fixture
+def cos_tool_binary(tmp_path) -> Path:
+    binary = tmp_path / "cos-tool-amd64"
+    binary.write_text("")
+    return binary
+
+
+def transformed_by(args, stdin=None) -> str:
+    """Stands for cos-tool transform, tagging the expression passed last."""
+    return f"{args[-1]} # transformed"
+
+
+@pytest.mark.parametrize(
+    "tool_class, query_type",
+    [(PrometheusCosTool, "promql"), (LokiCosTool, "logql")],
+)
+def test_transformations_cached_across_hooks(
+    dispatch, tmp_path, cos_tool_binary, tool_class, query_type
+):
+    cache_path = tmp_path / "cos-tool-cache.json"
+    with patch.object(tool_class, "path", new_callable=PropertyMock) as path, patch.object(
+        tool_class, "_exec", side_effect=transformed_by
+    ) as exec_:
+        path.return_value = cos_tool_binary
+        harness = dispatch()
+        tool = CharmCosTool(tool_class(None), query_type, CosToolCache(harness.charm, cache_path))
+        rules = {
+            "groups": [
+                {"name": "a", "rules": [{"expr": "up # a", "labels": TOPOLOGY}]},
+                {"name": "b", "rules": [{"expr": "up # b", "labels": TOPOLOGY}]},
+            ]
+        }
+        assert tool.inject_label_matchers("up # a", TOPOLOGY) == "up # a # transformed"
+        tool.apply_label_matchers(rules)
+        assert [group["rules"][0]["expr"] for group in rules["groups"]] == [
+            "up # a # transformed",
+            "up # b # transformed",
+        ]
+        assert exec_.call_count == 2
+
+        # The misses are kept in memory until the framework commits
+        assert not cache_path.exists()
+        harness.framework.commit()
+        assert len(json.loads(cache_path.read_text())["entries"]) == 2
+
+        # The next hook reads them back, without running cos-tool
+        harness = dispatch()
+        tool = CharmCosTool(tool_class(None), query_type, CosToolCache(harness.charm, cache_path))
+        assert tool.inject_label_matchers_batch(["up # b", "up # a"], TOPOLOGY) == [
+            "up # b # transformed",
+            "up # a # transformed",
+        ]
+        assert exec_.call_count == 2
+
+
+def test_cache_dropped_for_another_binary(dispatch, tmp_path, cos_tool_binary):
+    cache_path = tmp_path / "cos-tool-cache.json"
+    with patch.object(PrometheusCosTool, "path", new_callable=PropertyMock) as path, patch.object(
+        PrometheusCosTool, "_exec", side_effect=transformed_by
+    ) as exec_:
+        path.return_value = cos_tool_binary
+        harness = dispatch()
+        cache = CosToolCache(harness.charm, cache_path)
+        CharmCosTool(PrometheusCosTool(None), "promql", cache).inject_label_matchers(
+            "up # a", TOPOLOGY
+        )
+        harness.framework.commit()
+
+        cos_tool_binary.write_text("upgraded")
+        cache = CosToolCache(dispatch().charm, cache_path)
+        CharmCosTool(PrometheusCosTool(None), "promql", cache).inject_label_matchers(
+            "up # a", TOPOLOGY
+        )
+        assert exec_.call_count == 2
+
+
+def test_cache_bounded(dispatch, tmp_path, cos_tool_binary):
+    cache_path = tmp_path / "cos-tool-cache.json"
+    with patch.object(PrometheusCosTool, "path", new_callable=PropertyMock) as path, patch.object(
+        PrometheusCosTool, "_exec", side_effect=transformed_by
+    ):
+        path.return_value = cos_tool_binary
+        harness = dispatch()
+        cache = CosToolCache(harness.charm, cache_path, size=2)
+        tool = CharmCosTool(PrometheusCosTool(None), "promql", cache)
+        for expression in ["up # a", "up # b", "up # a", "up # c"]:
+            tool.inject_label_matchers(expression, TOPOLOGY)
+        harness.framework.commit()
+
+    # The least recently used expression is evicted
+    entries = json.loads(cache_path.read_text())["entries"]
+    assert [json.loads(key)[-1] for key, _ in entries] == ["up # a", "up # c"]
+
+
+def test_query_type_passed_to_dashboard_cos_tool(dispatch, tmp_path, cos_tool_binary):
+    with patch.object(DashboardCosTool, "path", new_callable=PropertyMock) as path, patch.object(
+        DashboardCosTool, "_exec", side_effect=transformed_by
+    ) as exec_:
+        path.return_value = cos_tool_binary
+        cache = CosToolCache(dispatch().charm, tmp_path / "cos-tool-cache.json")
+        tool = CharmCosTool(DashboardCosTool(None), "promql", cache)
+
+        # Not understood by the in-process injector, so transformed by cos-tool for each type
+        for query_type in ["promql", "logql", "promql"]:
+            tool.inject_label_matchers("up # a", TOPOLOGY, query_type)
+
+        assert [call.args[0][2] for call in exec_.call_args_list] == ["promql", "logql"]
+
+
+def test_cos_tool_runs_reported(dispatch, tmp_path, cos_tool_binary):
+    runs = []
+    with patch.object(PrometheusCosTool, "path", new_callable=PropertyMock) as path, patch.object(
+        PrometheusCosTool, "_exec", side_effect=transformed_by
+    ):
+        path.return_value = cos_tool_binary
+        cache = CosToolCache(dispatch().charm, tmp_path / "cos-tool-cache.json")
+        tool = CharmCosTool(PrometheusCosTool(None), "promql", cache, on_run=runs.append)
+
+        # Injected in-process, then by cos-tool, then from the cache
+        for expression in ["up", "up # a", "up # a"]:
+            tool.inject_label_matchers(expression, TOPOLOGY)
+        tool.validate_alert_rules({"groups": []})
+
+        # Not reported without cos-tool
+        path.return_value = None
+        tool.inject_label_matchers("up # b", TOPOLOGY)
+        tool.validate_scrape_jobs([])
+
+    assert runs == ["prometheus_scrape", "prometheus_scrape"]
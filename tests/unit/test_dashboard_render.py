@@ -0,0 +1,146 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from charms.grafana_k8s.v0 import grafana_dashboard
+from charms.grafana_k8s.v0.grafana_dashboard import (
+    CharmedDashboard,
+    CosTool,
+    GrafanaDashboardConsumer,
+)
+from cosl import LZMABase64
+from ops.charm import CharmBase
+from ops.testing import Harness
+
+from cos_tool import CharmDashboardCosTool, CosToolCache
+
+DASHBOARDS_PATH = Path(__file__).parents[2] / "src" / "grafana_dashboards"
+
+TOPOLOGY = {
+    "model": "kubeflow",
+    "model_uuid": "0f3e8c9a-5b1d-4c7e-9a2f-6d8b4e1c3a7f",
+    "application": "pvcviewer-operator",
+    "unit": "pvcviewer-operator/0",
+    "charm_name": "pvcviewer-operator",
+}
+
+CONSUMER_METADATA = """
+name: grafana
+requires:
+  grafana-dashboard:
+    interface: grafana_dashboard
+peers:
+  grafana:
+    interface: grafana_peers
+"""
+
+
+class ConsumerCharm(CharmBase):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.dashboard_consumer = GrafanaDashboardConsumer(self)
+
+    @property
+    def peers(self):
+        return self.model.get_relation("grafana")
+
+
+def panel(expr: str) -> dict:
+    """Returns a panel with a single target on the Prometheus datasource."""
+    return {"type": "timeseries", "datasource": "${prometheusds}", "targets": [{"expr": expr}]}
+
+
+def template(**kwargs) -> dict:
+    """Returns the template a provider sends for a dashboard."""
+    return {"juju_topology": TOPOLOGY, "dashboard_alt_uid": "alt-uid", **kwargs}
+
+
+def multi_pass_render(content: str, template: dict, transformer: CosTool) -> str:
+    """Renders a dashboard with one parse and serialization per step, as the consumer did."""
+    dashboard = json.loads(content)
+    if not dashboard.get("uid", None) and "dashboard_alt_uid" in template:
+        dashboard["uid"] = template["dashboard_alt_uid"]
+    content = CharmedDashboard._convert_dashboard_fields(
+        json.dumps(dashboard), template.get("inject_dropdowns", True)
+    )
+    return CharmedDashboard._inject_labels(content, template["juju_topology"], transformer)
+
+
+@pytest.mark.parametrize("path", sorted(DASHBOARDS_PATH.glob("*.json*")), ids=lambda p: p.name)
+@pytest.mark.parametrize("inject_dropdowns", [True, False])
+def test_render_matches_multi_pass_pipeline(path, inject_dropdowns):
+    content = path.read_text()
+    tmpl = template(inject_dropdowns=inject_dropdowns)
+    transformer = CosTool(None)
+
+    rendered = CharmedDashboard._render(content, tmpl, transformer)
+
+    assert json.loads(rendered) == json.loads(multi_pass_render(content, tmpl, transformer))
+
+
+def test_render_templates_and_injects_nested_row_panels(tmp_path):
+    harness = Harness(CharmBase, meta="name: pvcviewer-operator")
+    harness.begin()
+    cache = CosToolCache(harness.charm, tmp_path / "cos-tool-cache.json")
+    transformer = CharmDashboardCosTool(CosTool(None), "promql", cache)
+    content = json.dumps(
+        {
+            "uid": "own-uid",
+            "panels": [
+                panel("up"),
+                {"type": "row", "collapsed": True, "panels": [panel("process_open_fds")]},
+            ],
+            "rows": [{"panels": [{**panel("go_goroutines"), "datasource": "prometheus"}]}],
+        }
+    )
+
+    rendered = json.loads(CharmedDashboard._render(content, template(), transformer))
+
+    row_panel = rendered["panels"][1]["panels"][0]
+    legacy_row_panel = rendered["rows"][0]["panels"][0]
+    assert rendered["uid"] == "own-uid"
+    assert legacy_row_panel["datasource"] == "${prometheusds}"
+    for p in [rendered["panels"][0], row_panel, legacy_row_panel]:
+        assert 'juju_application=~"$juju_application"' in p["targets"][0]["expr"]
+
+
+def test_render_sets_alternative_uid():
+    content = json.dumps({"panels": []})
+
+    rendered = json.loads(CharmedDashboard._render(content, template(), CosTool(None)))
+
+    assert rendered["uid"] == "alt-uid"
+
+
+def test_consumer_renders_again_only_when_render_key_changes(monkeypatch):
+    harness = Harness(ConsumerCharm, meta=CONSUMER_METADATA)
+    harness.set_leader(True)
+    harness.add_relation("grafana", "grafana")
+    harness.begin()
+    rel_id = harness.add_relation("grafana-dashboard", "pvcviewer-operator")
+    content = LZMABase64.compress(json.dumps({"panels": [panel("up")]}))
+    templates = {"file:pvcviewer": template(content=content, charm="pvcviewer-operator")}
+
+    def send_dashboards(uuid: str):
+        harness.update_relation_data(
+            rel_id,
+            "pvcviewer-operator",
+            {"dashboards": json.dumps({"templates": templates, "uuid": uuid})},
+        )
+
+    with patch.object(CharmedDashboard, "_render", wraps=CharmedDashboard._render) as render:
+        send_dashboards("1")
+        send_dashboards("2")
+        assert render.call_count == 1
+
+        # Dashboards rendered by another version of the library are rendered again
+        monkeypatch.setattr(grafana_dashboard, "LIBPATCH", grafana_dashboard.LIBPATCH + 1)
+        send_dashboards("3")
+        assert render.call_count == 2
+
+    assert len(harness.charm.dashboard_consumer.dashboards) == 1
+    harness.cleanup()
@@ -0,0 +1,98 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import copy
+import hashlib
+import json
+import random
+from typing import List
+
+import pytest
+from charms.prometheus_k8s.v0.prometheus_scrape import _dedupe_job_names
+
+NAMES = ["pvcviewer", "pvcviewer-webhook", "juju_kubeflow_pvcviewer", "other"]
+TARGETS = ["*:8080", "*:8443", "10.1.0.1:8080", "10.1.0.2:8080"]
+
+
+# Verbatim copy of _dedupe_job_names from prometheus_scrape LIBPATCH 47, as published
+def reference_dedupe_job_names(jobs: List[dict]):
+    """Deduplicate a list of dicts by appending a hash to the value of the 'job_name' key.
+
+    Additionally, fully de-duplicate any identical jobs.
+
+    Args:
+        jobs: A list of prometheus scrape jobs
+    """
+    jobs_copy = copy.deepcopy(jobs)
+
+    # Convert to a dict with job names as keys
+    # I think this line is O(n^2) but it should be okay given the list sizes
+    jobs_dict = {
+        job["job_name"]: list(filter(lambda x: x["job_name"] == job["job_name"], jobs_copy))
+        for job in jobs_copy
+    }
+
+    # If multiple jobs have the same name, convert the name to "name_<hash-of-job>"
+    for key in jobs_dict:
+        if len(jobs_dict[key]) > 1:
+            for job in jobs_dict[key]:
+                job_json = json.dumps(job)
+                hashed = hashlib.sha256(job_json.encode()).hexdigest()
+                job["job_name"] = "{}_{}".format(job["job_name"], hashed)
+    new_jobs = []
+    for key in jobs_dict:
+        new_jobs.extend(list(jobs_dict[key]))
+
+    # Deduplicate jobs which are equal
+    # Again this in O(n^2) but it should be okay
+    deduped_jobs = []
+    seen = []
+    for job in new_jobs:
+        job_json = json.dumps(job)
+        hashed = hashlib.sha256(job_json.encode()).hexdigest()
+        if hashed in seen:
+            continue
+        seen.append(hashed)
+        deduped_jobs.append(job)
+
+    return deduped_jobs
+
+
+def random_job(rng: random.Random) -> dict:
+    """Returns a scrape job drawn from small pools, so that names and whole jobs repeat."""
+    job = {
+        "job_name": rng.choice(NAMES),
+        "static_configs": [{"targets": rng.sample(TARGETS, rng.randint(1, 2))}],
+    }
+    if rng.random() < 0.5:
+        job["metrics_path"] = rng.choice(["/metrics", "/custom"])
+    if rng.random() < 0.5:
+        # Same content with a different key order, which hashes differently
+        job = dict(reversed(list(job.items())))
+    return job
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_dedupe_job_names_matches_reference(seed):
+    rng = random.Random(seed)
+    jobs = [random_job(rng) for _ in range(rng.randint(0, 30))]
+    original = copy.deepcopy(jobs)
+
+    assert _dedupe_job_names(jobs) == reference_dedupe_job_names(jobs)
+    # The input jobs are left untouched
+    assert jobs == original
+
+
+def test_dedupe_job_names_renames_and_dedupes():
+    job = {"job_name": "pvcviewer", "static_configs": [{"targets": ["*:8080"]}]}
+    other = {"job_name": "pvcviewer", "static_configs": [{"targets": ["*:8443"]}]}
+    unique = {"job_name": "webhook", "static_configs": [{"targets": ["*:443"]}]}
+
+    deduped = _dedupe_job_names([job, unique, other, dict(job)])
+
+    assert [j["job_name"].split("_")[0] for j in deduped] == ["pvcviewer", "pvcviewer", "webhook"]
+    assert len({j["job_name"] for j in deduped}) == 3
+    assert deduped[2] is unique
+    # Named as by earlier versions of the library, so names are kept on upgrade
+    job_hash = hashlib.sha256(json.dumps(job).encode()).hexdigest()
+    assert deduped[0]["job_name"] == f"pvcviewer_{job_hash}"
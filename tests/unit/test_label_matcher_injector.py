@@ -0,0 +1,233 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import os
+import platform
+import shutil
+import subprocess
+from pathlib import Path
+from unittest.mock import PropertyMock, patch
+
+import pytest
+from charms.grafana_k8s.v0.grafana_dashboard import CosTool as DashboardCosTool
+from charms.loki_k8s.v1.loki_push_api import CosTool as LokiCosTool
+from charms.prometheus_k8s.v0.prometheus_scrape import CosTool as PrometheusCosTool
+from ops.charm import CharmBase
+from ops.testing import Harness
+
+from cos_tool import (
+    CharmCosTool,
+    CharmDashboardCosTool,
+    CosToolCache,
+    LabelMatcherInjector,
+    UnsupportedExpressionError,
+)
+
+MATCHERS = {"juju_model": "$juju_model", "juju_application": "$juju_application"}
+INJECTED = 'juju_application="$juju_application",juju_model="$juju_model"'
+INJECTED_LOGQL = 'juju_application="$juju_application", juju_model="$juju_model"'
+
+# Expressions in the form cos-tool prints them back, so that its output can be compared as is
+PROMQL_CORPUS = [
+    ("up", f"up{{{INJECTED}}}"),
+    ('up{job="pvcviewer"}', f'up{{job="pvcviewer",{INJECTED}}}'),
+    (
+        'rate(controller_runtime_reconcile_total{result="error"}[5m])',
+        f'rate(controller_runtime_reconcile_total{{result="error",{INJECTED}}}[5m])',
+    ),
+    (
+        "sum by (controller) (rate(controller_runtime_reconcile_total[$__rate_interval]))",
+        "sum by (controller) "
+        f"(rate(controller_runtime_reconcile_total{{{INJECTED}}}[$__rate_interval]))",
+    ),
+    (
+        "histogram_quantile(0.99, sum by (le) "
+        "(rate(controller_runtime_webhook_latency_seconds_bucket[5m])))",
+        "histogram_quantile(0.99, sum by (le) "
+        f"(rate(controller_runtime_webhook_latency_seconds_bucket{{{INJECTED}}}[5m])))",
+    ),
+    (
+        "kube_pod_info / on (pod) group_left (node) kube_pod_status_ready",
+        f"kube_pod_info{{{INJECTED}}} / on (pod) group_left (node) "
+        f"kube_pod_status_ready{{{INJECTED}}}",
+    ),
+    ("up == bool 0", f"up{{{INJECTED}}} == bool 0"),
+    (
+        'absent(up{job="pvcviewer"}) or vector(1)',
+        f'absent(up{{job="pvcviewer",{INJECTED}}}) or vector(1)',
+    ),
+    (
+        "max_over_time(rate(workqueue_adds_total[5m])[1h:5m] offset 1d)",
+        f"max_over_time(rate(workqueue_adds_total{{{INJECTED}}}[5m])[1h:5m] offset 1d)",
+    ),
+    (
+        "topk(5, sum by (pod) (go_memstats_alloc_bytes))",
+        f"topk(5, sum by (pod) (go_memstats_alloc_bytes{{{INJECTED}}}))",
+    ),
+    (
+        'label_replace(up, "host", "$1", "instance", "(.*):.*")',
+        f'label_replace(up{{{INJECTED}}}, "host", "$1", "instance", "(.*):.*")',
+    ),
+    (
+        "count without (instance) (up) > 1000",
+        f"count without (instance) (up{{{INJECTED}}}) > 1000",
+    ),
+]
+
+LOGQL_CORPUS = [
+    ('{app="pvcviewer"}', f'{{app="pvcviewer", {INJECTED_LOGQL}}}'),
+    (
+        '{app="pvcviewer"} | json | line_format "{{.msg}}"',
+        f'{{app="pvcviewer", {INJECTED_LOGQL}}} | json | line_format "{{{{.msg}}}}"',
+    ),
+    (
+        'sum by (level) (count_over_time({app="pvcviewer"} |~ "a{2}" [$__interval]))',
+        f'sum by (level) (count_over_time({{app="pvcviewer", {INJECTED_LOGQL}}} |~ "a{{2}}" '
+        "[$__interval]))",
+    ),
+]
+
+UNSUPPORTED = [
+    ('up{juju_model="other"}', "promql"),
+    ("up # comment", "promql"),
+    ('up{job="pvcviewer"', "promql"),
+    ("vector(1)", "promql"),
+    ("up | json", "promql"),
+    ('{app="pvcviewer"', "logql"),
+    ("foo", "sql"),
+]
+
+# Located like the charm libraries do, in the charm root, or else on the PATH
+COS_TOOL_NAME = "cos-tool-{}".format(
+    "amd64" if platform.machine() == "x86_64" else platform.machine()
+)
+COS_TOOL = Path(__file__).parents[2] / COS_TOOL_NAME
+if not COS_TOOL.exists() and shutil.which(COS_TOOL_NAME):
+    COS_TOOL = Path(shutil.which(COS_TOOL_NAME))
+
+
+@pytest.fixture
+def cos_tool() -> Path:
+    """The cos-tool binary, required in CI, where it is fetched before the unit tests run."""
+    if not COS_TOOL.exists():
+        message = f"{COS_TOOL_NAME} not found in the charm root or on the PATH"
+        if os.environ.get("CI"):
+            pytest.fail(message)
+        pytest.skip(message)
+    return COS_TOOL
+
+
+@pytest.mark.parametrize("expression, expected", PROMQL_CORPUS)
+def test_inject_promql(expression, expected):
+    assert LabelMatcherInjector.inject(expression, MATCHERS, "promql") == expected
+
+
+@pytest.mark.parametrize("expression, expected", LOGQL_CORPUS)
+def test_inject_logql(expression, expected):
+    assert LabelMatcherInjector.inject(expression, MATCHERS, "logql") == expected
+
+
+@pytest.mark.parametrize("expression, query_type", UNSUPPORTED)
+def test_inject_unsupported(expression, query_type):
+    with pytest.raises(UnsupportedExpressionError):
+        LabelMatcherInjector.inject(expression, MATCHERS, query_type)
+
+
+def transform(cos_tool: Path, expression: str, query_type: str) -> str:
+    """Returns the expression with the label matchers injected by cos-tool."""
+    args = [str(cos_tool.resolve()), "--format", query_type, "transform"]
+    args.extend(f"--label-matcher={key}={value}" for key, value in MATCHERS.items())
+    args.extend(["--", expression])
+    return subprocess.run(args, check=True, stdout=subprocess.PIPE).stdout.decode().strip()
+
+
+@pytest.mark.parametrize("expression, expected", PROMQL_CORPUS)
+def test_inject_promql_matches_cos_tool(cos_tool, expression, expected):
+    assert LabelMatcherInjector.inject(expression, MATCHERS, "promql") == transform(
+        cos_tool, expression, "promql"
+    )
+
+
+@pytest.mark.parametrize("expression, expected", LOGQL_CORPUS)
+def test_inject_logql_matches_cos_tool(cos_tool, expression, expected):
+    assert LabelMatcherInjector.inject(expression, MATCHERS, "logql") == transform(
+        cos_tool, expression, "logql"
+    )
+
+
+@pytest.fixture
+def cache(tmp_path):
+    harness = Harness(CharmBase, meta="name: pvcviewer-operator")
+    harness.begin()
+    yield CosToolCache(harness.charm, tmp_path / "cos-tool-cache.json")
+    harness.cleanup()
+
+
+def test_cos_tool_falls_back_to_binary(cache, tmp_path):
+    tool = CharmDashboardCosTool(DashboardCosTool(None), "promql", cache)
+    with patch.object(DashboardCosTool, "path", new_callable=PropertyMock) as path, patch.object(
+        DashboardCosTool, "_exec", return_value='up{juju_model="$juju_model"}'
+    ) as exec_:
+        path.return_value = tmp_path / "cos-tool-amd64"
+        path.return_value.write_text("")
+
+        # Handled in-process, without calling cos-tool
+        assert tool.inject_label_matchers("up", {"juju_model": "m"}, "promql") == (
+            'up{juju_model=~"$juju_model"}'
+        )
+        exec_.assert_not_called()
+
+        # Not understood in-process, so transformed by cos-tool
+        assert tool.inject_label_matchers("up # comment", {"juju_model": "m"}, "promql") == (
+            'up{juju_model=~"$juju_model"}'
+        )
+        exec_.assert_called_once()
+
+        # Without cos-tool, the expression is left unchanged
+        path.return_value = None
+        assert tool.inject_label_matchers("up # other", {"juju_model": "m"}, "promql") == (
+            "up # other"
+        )
+
+
+@pytest.mark.parametrize(
+    "tool_class, query_type, expression, expected",
+    [
+        (
+            PrometheusCosTool,
+            "promql",
+            'up{job="pvcviewer"} < 1',
+            'up{job="pvcviewer",juju_application="pvcviewer",juju_model="kubeflow"} < 1',
+        ),
+        (
+            LokiCosTool,
+            "logql",
+            'count_over_time({app="pvcviewer"} |= "error" [5m]) > 0',
+            'count_over_time({app="pvcviewer", juju_application="pvcviewer", '
+            'juju_model="kubeflow"} |= "error" [5m]) > 0',
+        ),
+    ],
+)
+def test_rules_injected_without_binary(cache, tool_class, query_type, expression, expected):
+    tool = CharmCosTool(tool_class(None), query_type, cache)
+    rules = {
+        "groups": [
+            {
+                "name": "pvcviewer",
+                "rules": [
+                    {
+                        "expr": expression,
+                        "labels": {"juju_model": "kubeflow", "juju_application": "pvcviewer"},
+                    }
+                ],
+            }
+        ]
+    }
+    with patch.object(tool_class, "path", new_callable=PropertyMock) as path, patch.object(
+        tool_class, "_exec"
+    ) as exec_:
+        path.return_value = None
+        tool.apply_label_matchers(rules)
+
+    assert rules["groups"][0]["rules"][0]["expr"] == expected
+    exec_.assert_not_called()
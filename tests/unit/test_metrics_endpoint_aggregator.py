@@ -0,0 +1,176 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+import time
+from unittest.mock import patch
+
+import pytest
+from charms.prometheus_k8s.v0.prometheus_scrape import MetricsEndpointAggregator
+from ops.charm import CharmBase
+from ops.testing import Harness
+
+METADATA = """
+name: pvcviewer-aggregator
+provides:
+  downstream-prometheus-scrape:
+    interface: prometheus_scrape
+requires:
+  prometheus-target:
+    interface: http
+  prometheus-rules:
+    interface: prometheus-rules
+"""
+
+
+class AggregatorCharm(CharmBase):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.aggregator = MetricsEndpointAggregator(self)
+
+
+@pytest.fixture
+def harness():
+    harness = Harness(AggregatorCharm, meta=METADATA)
+    harness.set_model_info(name="kubeflow", uuid="0f3e8c9a-5b1d-4c7e-9a2f-6d8b4e1c3a7f")
+    harness.set_leader(True)
+    harness.begin()
+    yield harness
+    harness.cleanup()
+
+
+def add_target(harness: Harness, app: str, units: int = 1) -> int:
+    """Relates a scrape target with the given number of units, returning the relation id."""
+    rel_id = harness.add_relation("prometheus-target", app)
+    for i in range(units):
+        harness.add_relation_unit(rel_id, f"{app}/{i}")
+        harness.update_relation_data(
+            rel_id, f"{app}/{i}", {"hostname": f"10.1.{i // 256}.{i % 256}", "port": "9100"}
+        )
+    return rel_id
+
+
+def scrape_jobs(harness: Harness, rel_id: int) -> list:
+    """Returns the scrape jobs sent over a Prometheus relation."""
+    return json.loads(harness.get_relation_data(rel_id, harness.charm.app)["scrape_jobs"])
+
+
+def job_name(app: str) -> str:
+    return f"juju_kubeflow_0f3e8c9_{app}_prometheus_scrape"
+
+
+def test_target_jobs_sent_in_place_to_every_prometheus(harness):
+    prometheus_ids = [harness.add_relation("downstream-prometheus-scrape", f"p{i}") for i in "ab"]
+    node_a = add_target(harness, "node-a")
+    add_target(harness, "node-b")
+
+    # A changed job keeps its place
+    harness.update_relation_data(node_a, "node-a/0", {"port": "9200"})
+
+    for rel_id in prometheus_ids:
+        jobs = scrape_jobs(harness, rel_id)
+        assert [job["job_name"] for job in jobs] == [job_name("node-a"), job_name("node-b")]
+        assert jobs[0]["static_configs"][0]["targets"] == ["10.1.0.0:9200"]
+    raw = harness.get_relation_data(prometheus_ids[0], harness.charm.app)["scrape_jobs"]
+    assert raw == json.dumps(scrape_jobs(harness, prometheus_ids[0]))
+
+
+def test_new_prometheus_unit_gets_indexed_jobs(harness):
+    add_target(harness, "node-a", units=2)
+    rel_id = harness.add_relation("downstream-prometheus-scrape", "prometheus")
+
+    harness.add_relation_unit(rel_id, "prometheus/0")
+
+    jobs = scrape_jobs(harness, rel_id)
+    assert [job["job_name"] for job in jobs] == [job_name("node-a")]
+    assert len(jobs[0]["static_configs"]) == 2
+
+
+def test_departed_units_removed_from_jobs(harness):
+    rel_id = harness.add_relation("downstream-prometheus-scrape", "prometheus")
+    node_a = add_target(harness, "node-a", units=2)
+    node_b = add_target(harness, "node-b")
+
+    harness.remove_relation_unit(node_a, "node-a/0")
+    jobs = scrape_jobs(harness, rel_id)
+    assert [job["job_name"] for job in jobs] == [job_name("node-a"), job_name("node-b")]
+    assert [c["labels"]["juju_unit"] for c in jobs[0]["static_configs"]] == ["node-a/1"]
+
+    harness.remove_relation_unit(node_b, "node-b/0")
+    assert [job["job_name"] for job in scrape_jobs(harness, rel_id)] == [job_name("node-a")]
+
+
+def test_new_leader_rebuilds_stale_jobs(harness):
+    rel_id = harness.add_relation("downstream-prometheus-scrape", "prometheus")
+    node_a = add_target(harness, "node-a", units=2)
+    node_c = add_target(harness, "node-c")
+    harness.charm.aggregator.set_target_job_data(
+        {"nrpe-1": {"hostname": "10.2.0.1", "port": "9100"}}, "nrpe-1"
+    )
+
+    # Relation events are ignored while another unit is the leader
+    harness.set_leader(False)
+    harness.update_relation_data(node_a, "node-a/0", {"port": "9200"})
+    harness.remove_relation_unit(node_a, "node-a/1")
+    harness.remove_relation(node_c)
+    add_target(harness, "node-b")
+    assert len(scrape_jobs(harness, rel_id)) == 3
+
+    harness.set_leader(True)
+
+    jobs = scrape_jobs(harness, rel_id)
+    assert [job["job_name"] for job in jobs] == [
+        job_name("node-a"),
+        job_name("nrpe-1"),
+        job_name("node-b"),
+    ]
+    assert [c["targets"] for c in jobs[0]["static_configs"]] == [["10.1.0.0:9200"]]
+
+
+def test_new_prometheus_gets_jobs_without_rebuild(harness):
+    add_target(harness, "node-a")
+
+    with patch.object(MetricsEndpointAggregator, "_rebuild_job_index") as rebuild:
+        rel_id = harness.add_relation("downstream-prometheus-scrape", "prometheus")
+        harness.add_relation_unit(rel_id, "prometheus/0")
+
+    rebuild.assert_not_called()
+    assert [job["job_name"] for job in scrape_jobs(harness, rel_id)] == [job_name("node-a")]
+
+
+def targets(count: int) -> list:
+    """Returns the app names and targets of scrape targets with one unit each."""
+    return [
+        (f"node-{i}", {f"node-{i}/0": {"hostname": f"10.1.{i // 256}.{i % 256}", "port": "9100"}})
+        for i in range(count)
+    ]
+
+
+def test_targets_joining_in_sequence(harness):
+    """Sends the jobs of 500 scrape targets joining one after the other to two Prometheus."""
+    prometheus_ids = [harness.add_relation("downstream-prometheus-scrape", f"p{i}") for i in "ab"]
+    targets_joining = targets(500)
+
+    for app, target in targets_joining:
+        harness.charm.aggregator.set_target_job_data(target, app)
+
+    for rel_id in prometheus_ids:
+        jobs = scrape_jobs(harness, rel_id)
+        assert [job["job_name"] for job in jobs] == [job_name(app) for app, _ in targets_joining]
+
+
+@pytest.mark.slow
+def test_targets_joining_in_sequence_timed(harness):
+    """Indexes and sends the jobs of 500 targets within a budget.
+
+    Rebuilding and serializing the whole list of jobs for each target, as the published version
+    of the library does, takes over ten seconds for as many targets.
+    """
+    for i in "ab":
+        harness.add_relation("downstream-prometheus-scrape", f"p{i}")
+
+    started = time.perf_counter()
+    for app, target in targets(500):
+        harness.charm.aggregator.set_target_job_data(target, app)
+
+    assert time.perf_counter() - started < 3
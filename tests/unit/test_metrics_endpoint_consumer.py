@@ -0,0 +1,252 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+from unittest.mock import patch
+
+import pytest
+from charms.prometheus_k8s.v0.prometheus_scrape import (
+    COMPRESSED_ENCODING,
+    ENCODINGS_KEY,
+    MetricsEndpointConsumer,
+    _encoded_relation_data,
+)
+from ops.charm import CharmBase
+from ops.testing import Harness
+
+METADATA = """
+name: prometheus-tester
+requires:
+  metrics-endpoint:
+    interface: prometheus_scrape
+"""
+
+SCRAPE_METADATA = {
+    "model": "kubeflow",
+    "model_uuid": "0f3e8c9a-5b1d-4c7e-9a2f-6d8b4e1c3a7f",
+    "application": "pvcviewer-operator",
+    "charm_name": "pvcviewer-operator",
+}
+
+
+class ConsumerCharm(CharmBase):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.metrics_consumer = MetricsEndpointConsumer(self)
+
+
+@pytest.fixture
+def harness() -> Harness:
+    harness = Harness(ConsumerCharm, meta=METADATA)
+    harness.set_leader(True)
+    harness.begin()
+    return harness
+
+
+def add_provider(harness: Harness, app: str, port: int = 8080) -> int:
+    """Relates a metrics provider app with one unit, returning the relation id."""
+    return harness.add_relation(
+        "metrics-endpoint",
+        app,
+        app_data={
+            "scrape_metadata": json.dumps({**SCRAPE_METADATA, "application": app}),
+            "scrape_jobs": json.dumps([{"static_configs": [{"targets": [f"*:{port}"]}]}]),
+        },
+        unit_data={
+            "prometheus_scrape_unit_address": "10.1.0.1",
+            "prometheus_scrape_unit_name": f"{app}/0",
+        },
+    )
+
+
+def test_jobs_recomputed_only_for_changed_relations(harness):
+    consumer = harness.charm.metrics_consumer
+    first = add_provider(harness, "pvcviewer-operator")
+    add_provider(harness, "other-operator")
+
+    with patch.object(
+        MetricsEndpointConsumer,
+        "_static_scrape_config",
+        autospec=True,
+        side_effect=MetricsEndpointConsumer._static_scrape_config,
+    ) as static_scrape_config:
+        jobs = consumer.jobs()
+        assert static_scrape_config.call_count == 2
+
+        # Unchanged relations reuse their jobs
+        assert consumer.jobs() == jobs
+        assert static_scrape_config.call_count == 2
+
+        # Only the relation whose data changed is computed again
+        harness.update_relation_data(
+            first,
+            "pvcviewer-operator",
+            {"scrape_jobs": json.dumps([{"static_configs": [{"targets": ["*:9090"]}]}])},
+        )
+        jobs = consumer.jobs()
+        assert static_scrape_config.call_count == 3
+
+    targets = sorted(target for job in jobs for target in job["static_configs"][0]["targets"])
+    assert targets == ["10.1.0.1:8080", "10.1.0.1:9090"]
+
+
+def test_jobs_cache_drops_departed_relations(harness):
+    consumer = harness.charm.metrics_consumer
+    rel_id = add_provider(harness, "pvcviewer-operator")
+    consumer.jobs()
+    assert list(consumer._stored.relation_jobs.keys()) == [str(rel_id)]
+
+    harness.remove_relation(rel_id)
+
+    assert consumer.jobs() == []
+    assert list(consumer._stored.relation_jobs.keys()) == []
+
+
+def test_relation_results_kept_across_hooks(harness):
+    consumer = harness.charm.metrics_consumer
+    rel_id = add_provider(harness, "pvcviewer-operator")
+    harness.update_relation_data(
+        rel_id, "pvcviewer-operator", {"alert_rules": alert_rules("pvcviewer-operator", ["up"])}
+    )
+    jobs, alerts = consumer.jobs(), consumer.alerts
+
+    harness.framework.commit()
+
+    # The serialized results are saved with the unit's state, for the next hook to reuse
+    snapshot = harness.framework._storage.load_snapshot(
+        f"{consumer.handle.path}/StoredStateData[_stored]"
+    )
+    assert json.loads(snapshot["relation_jobs"][str(rel_id)]["jobs"]) == jobs
+    assert {
+        entry["identifier"]: json.loads(entry["alert_rules"])
+        for entry in snapshot["relation_alerts"].values()
+    } == alerts
+
+
+def test_jobs_returned_as_copies(harness):
+    consumer = harness.charm.metrics_consumer
+    add_provider(harness, "pvcviewer-operator")
+
+    consumer.jobs()[0]["static_configs"][0]["targets"].append("10.1.0.2:8080")
+
+    assert consumer.jobs()[0]["static_configs"][0]["targets"] == ["10.1.0.1:8080"]
+
+
+def alert_rules(app: str, exprs: list) -> str:
+    """Returns the alert_rules a metrics provider app sends, with one rule per expression."""
+    labels = {
+        "juju_model": SCRAPE_METADATA["model"],
+        "juju_model_uuid": SCRAPE_METADATA["model_uuid"],
+        "juju_application": app,
+    }
+    rules = [
+        {"alert": f"Alert{i}", "expr": expr, "labels": labels} for i, expr in enumerate(exprs)
+    ]
+    return json.dumps({"groups": [{"name": f"{app}_alerts", "rules": rules}]})
+
+
+def test_alerts_processed_only_for_changed_relations(harness):
+    consumer = harness.charm.metrics_consumer
+    first = add_provider(harness, "pvcviewer-operator")
+    second = add_provider(harness, "other-operator")
+    harness.update_relation_data(
+        first, "pvcviewer-operator", {"alert_rules": alert_rules("pvcviewer-operator", ["up"])}
+    )
+    harness.update_relation_data(
+        second, "other-operator", {"alert_rules": alert_rules("other-operator", ["up"])}
+    )
+
+    with patch.object(
+        MetricsEndpointConsumer,
+        "_inject_alert_expr_labels",
+        autospec=True,
+        side_effect=MetricsEndpointConsumer._inject_alert_expr_labels,
+    ) as inject:
+        alerts = consumer.alerts
+        digest = consumer.alerts_digest
+        assert len(alerts) == 2
+        assert inject.call_count == 2
+
+        # Unchanged relations reuse their alerts, and the digest stays the same
+        assert consumer.alerts == alerts
+        assert consumer.alerts_digest == digest
+        assert inject.call_count == 2
+
+        harness.update_relation_data(
+            first,
+            "pvcviewer-operator",
+            {"alert_rules": alert_rules("pvcviewer-operator", ["up == 0"])},
+        )
+        alerts = consumer.alerts
+        assert consumer.alerts_digest != digest
+        assert inject.call_count == 3
+
+    exprs = sorted(rules["groups"][0]["rules"][0]["expr"] for rules in alerts.values())
+    assert exprs == ["up", "up == 0"]
+
+
+def test_alerts_returned_as_copies(harness):
+    consumer = harness.charm.metrics_consumer
+    rel_id = add_provider(harness, "pvcviewer-operator")
+    harness.update_relation_data(
+        rel_id, "pvcviewer-operator", {"alert_rules": alert_rules("pvcviewer-operator", ["up"])}
+    )
+
+    for rules in consumer.alerts.values():
+        rules["groups"].clear()
+
+    assert [len(rules["groups"]) for rules in consumer.alerts.values()] == [1]
+
+
+def test_alert_expressions_injected_in_one_batch(harness):
+    consumer = harness.charm.metrics_consumer
+    rules = json.loads(alert_rules("pvcviewer-operator", ["up", "%%juju_topology%%up == 0"]))
+
+    with patch.object(
+        consumer._tool, "inject_label_matchers_batch", side_effect=lambda exprs, _: exprs
+    ) as batch:
+        consumer._inject_alert_expr_labels(rules)
+
+    batch.assert_called_once()
+    assert batch.call_args.args[0] == ["up", "up == 0"]
+    assert batch.call_args.args[1]["juju_application"] == "pvcviewer-operator"
+
+
+def test_consumer_reads_compressed_relation_data(harness):
+    consumer = harness.charm.metrics_consumer
+    rel_id = add_provider(harness, "pvcviewer-operator")
+    app_data = harness.get_relation_data(rel_id, "pvcviewer-operator")
+    harness.update_relation_data(
+        rel_id,
+        "pvcviewer-operator",
+        _encoded_relation_data(
+            {
+                "scrape_jobs": app_data["scrape_jobs"],
+                "alert_rules": alert_rules("pvcviewer-operator", ["up"]),
+            },
+            compress=True,
+        ),
+    )
+
+    assert "scrape_jobs" not in harness.get_relation_data(rel_id, "pvcviewer-operator")
+    assert consumer.jobs()[0]["static_configs"][0]["targets"] == ["10.1.0.1:8080"]
+    assert len(consumer.alerts) == 1
+    # The consumer lists the encodings it reads
+    assert json.loads(harness.get_relation_data(rel_id, harness.charm.app)[ENCODINGS_KEY]) == [
+        COMPRESSED_ENCODING
+    ]
+
+
+def test_consumer_advertises_encodings_on_join_and_upgrade(harness):
+    rel_id = harness.add_relation("metrics-endpoint", "pvcviewer-operator")
+
+    # Joining, before the provider sends any data
+    harness.add_relation_unit(rel_id, "pvcviewer-operator/0")
+    data = harness.get_relation_data(rel_id, harness.charm.app)
+    assert json.loads(data[ENCODINGS_KEY]) == [COMPRESSED_ENCODING]
+
+    # Relations established by an earlier version of the library
+    harness.update_relation_data(rel_id, harness.charm.app.name, {ENCODINGS_KEY: ""})
+    harness.charm.on.upgrade_charm.emit()
+    data = harness.get_relation_data(rel_id, harness.charm.app)
+    assert json.loads(data[ENCODINGS_KEY]) == [COMPRESSED_ENCODING]
@@ -0,0 +1,91 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from charms.prometheus_k8s.v0 import prometheus_scrape
+from charms.prometheus_k8s.v0.prometheus_scrape import (
+    COMPRESSED_ENCODING,
+    ENCODINGS_KEY,
+    MetricsEndpointProvider,
+)
+from ops.charm import CharmBase
+from ops.testing import Harness
+
+METADATA = """
+name: pvcviewer-tester
+provides:
+  metrics-endpoint:
+    interface: prometheus_scrape
+"""
+
+
+class ProviderCharm(CharmBase):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.metrics_provider = MetricsEndpointProvider(self, compress_relation_data=True)
+
+
+@pytest.fixture
+def slow_resolver(monkeypatch):
+    """Replaces the FQDN lookup with a stub which blocks until the test ends."""
+    release = threading.Event()
+    calls = []
+
+    def getfqdn():
+        calls.append(time.monotonic())
+        release.wait(10)
+        return "pvcviewer-tester-0.example.com"
+
+    monkeypatch.setattr(prometheus_scrape, "_fqdn", None)
+    monkeypatch.setattr(prometheus_scrape, "FQDN_LOOKUP_TIMEOUT", 0.2)
+    monkeypatch.setattr(prometheus_scrape.socket, "getfqdn", getfqdn)
+    monkeypatch.setattr(prometheus_scrape.socket, "gethostname", lambda: "pvcviewer-tester-0")
+    yield calls
+    release.set()
+
+
+def test_provider_compresses_only_for_supporting_consumers():
+    harness = Harness(ProviderCharm, meta=METADATA)
+    harness.set_leader(True)
+    harness.begin()
+    rel_id = harness.add_relation("metrics-endpoint", "prometheus")
+    harness.charm.metrics_provider.set_scrape_job_spec()
+
+    data = harness.get_relation_data(rel_id, harness.charm.app)
+    assert "scrape_jobs" in data and "scrape_jobs_z" not in data
+
+    harness.update_relation_data(
+        rel_id, "prometheus", {ENCODINGS_KEY: json.dumps([COMPRESSED_ENCODING])}
+    )
+
+    data = harness.get_relation_data(rel_id, harness.charm.app)
+    assert "scrape_jobs" not in data and "alert_rules" not in data
+    assert "scrape_jobs_z" in data and "alert_rules_z" in data
+
+
+def test_unit_address_resolved_once_with_slow_resolver(slow_resolver):
+    harness = Harness(ProviderCharm, meta=METADATA)
+    rel_ids = [harness.add_relation("metrics-endpoint", f"prometheus-{i}") for i in range(3)]
+    harness.begin()
+    model = harness.charm.model
+
+    start = time.monotonic()
+    with patch.object(
+        MetricsEndpointProvider, "_is_valid_unit_address", return_value=False
+    ), patch.object(model, "get_binding", wraps=model.get_binding) as get_binding:
+        harness.charm.metrics_provider.set_scrape_job_spec()
+        harness.charm.metrics_provider.set_scrape_job_spec()
+    elapsed = time.monotonic() - start
+
+    # The lookup gave up after the timeout, once for all relations and calls
+    assert elapsed < 2
+    assert len(slow_resolver) == 1
+    get_binding.assert_called_once_with("metrics-endpoint")
+    for rel_id in rel_ids:
+        unit_data = harness.get_relation_data(rel_id, harness.charm.unit)
+        assert unit_data["prometheus_scrape_unit_address"] == "pvcviewer-tester-0"
@@ -1,18 +1,40 @@
 # Copyright 2024 Canonical Ltd.
 # See LICENSE file for licensing details.
 
-from unittest.mock import MagicMock, Mock, patch
+import json
+from base64 import b64decode
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, Mock, PropertyMock, patch
 
 import pytest
-from ops.model import ActiveStatus
+import yaml
+from cosl.rules import AlertRules
+from lightkube.models.core_v1 import Container, PodSpec, ResourceRequirements
+from lightkube.resources.core_v1 import Pod
+from lightkube.types import PatchType
+from ops.model import ActiveStatus, BlockedStatus, WaitingStatus
+from ops.pebble import CheckInfo, CheckLevel, CheckStatus
 from ops.testing import Harness
 
+from certs import gen_certs
 from charm import PvcViewer
+from charm_metrics import MAX_SERIES_PER_FAMILY
+from components.kubernetes_component import _find_field_paths
+
+PEER_RELATION_NAME = "pvcviewer-peers"
+CERTS_FOLDER = "/tmp/k8s-webhook-server/serving-certs"
+SLO_ALERT_RULES_NAME = "KubeflowPvcviewerOperatorSLOs.rules"
+ALERT_RULES_DIR = "prometheus-alert-rules"
+CHARM_METRICS_PATH = "/tmp/charm-metrics/metrics.txt"
+PYTHON_PATH = "/usr/bin/python3"
 
 
 @pytest.fixture
-def harness() -> Harness:
+def harness(tmp_path, monkeypatch) -> Harness:
+    # Gather the alert rules outside of the charm source tree
+    monkeypatch.setattr("charm.ALERT_RULES_DIR", str(tmp_path / ALERT_RULES_DIR))
     harness = Harness(PvcViewer)
+    harness.add_relation(PEER_RELATION_NAME, "pvcviewer-operator")
     return harness
 
 
@@ -51,6 +73,7 @@ def mocked_service_mesh_component(mocker):
 
 def test_metrics(
     harness,
+    tmp_path,
     mocked_lightkube_client,
     mocked_kubernetes_service_patch,
     mocked_service_mesh_component,
@@ -60,10 +83,76 @@ def test_metrics(
         harness.begin()
         mock_metrics.assert_called_once_with(
             charm=harness.charm,
+            alert_rules_path=str(tmp_path / ALERT_RULES_DIR),
             jobs=[{"static_configs": [{"targets": ["*:8080"]}]}],
         )
 
 
+def test_alert_rules_rendered_only_when_files_change(
+    harness,
+    tmp_path,
+    mocked_lightkube_client,
+    mocked_kubernetes_service_patch,
+    mocked_service_mesh_component,
+):
+    """Test the alert rules are rendered again, and resent, only when their files change."""
+    rules_dir = tmp_path / "prometheus_alert_rules"
+    rules_dir.mkdir()
+    rule_file = rules_dir / "unit_unavailable.rule"
+    rule_file.write_text(
+        "alert: UnitUnavailable\nexpr: up < 1\nfor: 0m\nlabels:\n  severity: critical\n"
+    )
+    harness.set_leader(True)
+    harness.begin()
+    provider = harness.charm.prometheus_provider
+    provider._alert_rules_path = str(rules_dir)
+    rel_id = harness.add_relation("metrics-endpoint", "prometheus-k8s")
+
+    with patch(
+        "charms.prometheus_k8s.v0.prometheus_scrape.AlertRules", wraps=AlertRules
+    ) as alert_rules:
+        provider.set_scrape_job_spec()
+        provider.set_scrape_job_spec()
+        assert alert_rules.call_count == 1
+
+        rule_file.write_text(rule_file.read_text().replace("up < 1", "up == 0"))
+        provider.set_scrape_job_spec()
+        assert alert_rules.call_count == 2
+
+    groups = json.loads(harness.get_relation_data(rel_id, harness.charm.app)["alert_rules"])
+    assert "== 0" in groups["groups"][0]["rules"][0]["expr"]
+
+
+def test_relation_data_written_only_when_changed(
+    harness,
+    mocked_lightkube_client,
+    mocked_kubernetes_service_patch,
+    mocked_service_mesh_component,
+):
+    """Test the metrics and dashboard providers do not rewrite unchanged relation data."""
+    harness.set_leader(True)
+    harness.begin()
+    harness.add_relation("metrics-endpoint", "prometheus-k8s")
+    dashboard_rel_id = harness.add_relation("grafana-dashboard", "grafana-k8s")
+    harness.charm.prometheus_provider.set_scrape_job_spec()
+    dashboards = harness.get_relation_data(dashboard_rel_id, harness.charm.app)["dashboards"]
+
+    with patch.object(
+        harness._backend, "update_relation_data", wraps=harness._backend.update_relation_data
+    ) as update_relation_data:
+        harness.charm.prometheus_provider.set_scrape_job_spec()
+        harness.charm.dashboard_provider._update_all_dashboards_from_dir()
+        update_relation_data.assert_not_called()
+
+        # An explicit update still resends the dashboards
+        harness.charm.dashboard_provider.update_dashboards()
+        update_relation_data.assert_called_once()
+
+    assert harness.get_relation_data(dashboard_rel_id, harness.charm.app)["dashboards"] != (
+        dashboards
+    )
+
+
 def test_grafana_dashboard(
     harness,
     mocked_lightkube_client,
@@ -94,11 +183,11 @@ def test_not_leader(
     mocked_kubernetes_service_patch,
     mocked_service_mesh_component,
 ):
-    """Test when we are not the leader."""
+    """Test when we are not the leader and the leader has not shared certificates yet."""
     harness.begin_with_initial_hooks()
-    # Assert that we are not Active, and that the leadership-gate is the cause.
+    # Assert that we are not Active, and that the missing certificates are the cause.
     assert not isinstance(harness.charm.model.unit.status, ActiveStatus)
-    assert harness.charm.model.unit.status.message.startswith("[leadership-gate]")
+    assert harness.charm.model.unit.status.message.startswith("[webhook-certificates]")
 
 
 def test_kubernetes_created_method(
@@ -113,11 +202,8 @@ def test_kubernetes_created_method(
     harness.set_leader(True)
     harness.begin()
 
-    # Need to mock the leadership-gate to be active, and the kubernetes auth component so that it
-    # sees the expected resources when calling _get_missing_kubernetes_resources
-
-    harness.charm.leadership_gate.get_status = MagicMock(return_value=ActiveStatus())
-
+    # Need to mock the kubernetes auth component so that it sees the expected resources when
+    # calling _get_missing_kubernetes_resources
     harness.charm.kubernetes_resources.component._get_missing_kubernetes_resources = MagicMock(
         return_value=[]
     )
@@ -130,6 +216,73 @@ def test_kubernetes_created_method(
     assert isinstance(harness.charm.kubernetes_resources.status, ActiveStatus)
 
 
+def test_kubernetes_ca_bundle_patched_alone(
+    harness,
+    mocked_lightkube_client,
+    mocked_kubernetes_service_patch,
+    mocked_service_mesh_component,
+):
+    """Test that a change of the CA bundle alone is patched instead of re-applying everything."""
+    # Arrange
+    harness.set_leader(True)
+    harness.begin()
+    harness.charm.kubernetes_resources.component._get_missing_kubernetes_resources = MagicMock(
+        return_value=[]
+    )
+    harness.charm.on.install.emit()
+    mocked_lightkube_client.apply.reset_mock()
+
+    # Act - nothing changed
+    harness.charm.on.update_status.emit()
+
+    # Assert
+    mocked_lightkube_client.apply.assert_not_called()
+    mocked_lightkube_client.patch.assert_not_called()
+
+    # Act - the CA bundle changed
+    with patch(
+        "components.certificates_component.WebhookCertificatesComponent.ca_bundle",
+        new_callable=PropertyMock,
+        return_value="bmV3LWNh",
+    ):
+        harness.charm.on.update_status.emit()
+
+    # Assert
+    mocked_lightkube_client.apply.assert_not_called()
+    patched = {call.args[1]: call.kwargs for call in mocked_lightkube_client.patch.call_args_list}
+    assert patched["pvcviewers.kubeflow.org"]["obj"] == [
+        {
+            "op": "add",
+            "path": "/spec/conversion/webhook/clientConfig/caBundle",
+            "value": "bmV3LWNh",
+        }
+    ]
+    for name in [
+        "pvcviewer-mutating-webhook-configuration",
+        "pvcviewer-validating-webhook-configuration",
+    ]:
+        assert patched[name]["patch_type"] == PatchType.JSON
+        assert patched[name]["obj"][0]["path"] == "/webhooks/0/clientConfig/caBundle"
+
+
+def test_ca_bundle_paths_found_in_rendered_manifests():
+    """Test the caBundle fields are located wherever the manifests put them."""
+    manifest = {
+        "kind": "ValidatingWebhookConfiguration",
+        "metadata": {"name": "webhooks"},
+        "webhooks": [
+            {"name": "first", "clientConfig": {"service": {"name": "svc"}}},
+            {"name": "second", "clientConfig": {"caBundle": "Y2E="}},
+            {"name": "third", "clientConfig": {"caBundle": "Y2E="}},
+        ],
+    }
+
+    assert list(_find_field_paths(manifest, "caBundle")) == [
+        "/webhooks/1/clientConfig/caBundle",
+        "/webhooks/2/clientConfig/caBundle",
+    ]
+
+
 def test_pebble_services_running(
     harness,
     mocked_lightkube_client,
@@ -138,14 +291,11 @@ def test_pebble_services_running(
 ):
     """Test that if the Kubernetes Component is Active, the pebble services successfully start."""
     # Arrange
+    harness.set_leader(True)
     harness.begin()
     harness.set_can_connect("pvcviewer-operator", True)
 
-    # Mock:
-    # * leadership_gate to have get_status=>Active
-    # * object_storage_relation to return mock data, making the item go active
-    # * kubernetes_resources to have get_status=>Active
-    harness.charm.leadership_gate.get_status = MagicMock(return_value=ActiveStatus())
+    # Mock kubernetes_resources to have get_status=>Active
     harness.charm.kubernetes_resources.get_status = MagicMock(return_value=ActiveStatus())
 
     # Act
@@ -157,22 +307,247 @@ def test_pebble_services_running(
     assert service.is_running()
 
 
+def test_pebble_services_ignore_charm_metrics_service(
+    harness,
+    mocked_lightkube_client,
+    mocked_kubernetes_service_patch,
+    mocked_service_mesh_component,
+):
+    """Test the charm metrics service in the workload container is left out of its status."""
+    # Arrange
+    harness.set_leader(True)
+    harness.begin()
+    harness.set_can_connect("pvcviewer-operator", True)
+    harness.charm.kubernetes_resources.get_status = MagicMock(return_value=ActiveStatus())
+    container = harness.charm.unit.get_container("pvcviewer-operator")
+    container.push(PYTHON_PATH, "", make_dirs=True)
+    harness.charm.on.install.emit()
+    harness.framework.commit()
+
+    # Act
+    container.stop("charm-metrics")
+    with patch.object(container, "replan") as replan:
+        harness.charm.on.update_status.emit()
+
+    # Assert
+    component = harness.charm.pebble_service_container.component
+    assert component.get_services_not_active() == []
+    replan.assert_not_called()
+
+
 def test_get_certs(
     harness,
     mocked_lightkube_client,
     mocked_kubernetes_service_patch,
     mocked_service_mesh_component,
 ):
-    """Test certs generated on init."""
+    """Test certs are generated by the leader and shared through an application secret."""
+    # Arrange
+    harness.set_leader(True)
+    harness.begin()
+
+    # Act
+    harness.charm.on.install.emit()
+
+    # Assert
+    app_data = harness.model.get_relation(PEER_RELATION_NAME).data[harness.charm.app]
+    secret = harness.model.get_secret(id=app_data["certs-secret-id"])
+    assert app_data["certs-secret-revision"] == str(secret.get_info().revision)
+    for attr in ["cert", "ca", "key"]:
+        # Certs should be available to every unit, but only through the secret
+        assert attr not in app_data
+        assert getattr(harness.charm.certificates.component, attr)
+
+
+def test_certs_moved_from_peer_relation_to_secret(
+    harness,
+    mocked_lightkube_client,
+    mocked_kubernetes_service_patch,
+    mocked_service_mesh_component,
+):
+    """Test certs shared through the peer databag are kept when moving them into a secret."""
+    # Arrange
+    certs = gen_certs("pvcviewer-operator", "kubeflow", "pvcviewer-operator")
+    relation_id = harness.model.get_relation(PEER_RELATION_NAME).id
+    harness.update_relation_data(relation_id, "pvcviewer-operator", certs)
+    harness.set_leader(True)
+    harness.begin()
+
+    # Act
+    harness.charm.on.install.emit()
+
+    # Assert
+    app_data = harness.model.get_relation(PEER_RELATION_NAME).data[harness.charm.app]
+    assert "certs-secret-id" in app_data
+    for attr, value in certs.items():
+        assert attr not in app_data
+        assert getattr(harness.charm.certificates.component, attr) == value
+
+
+def add_certs_secret(harness, certs: dict, revision: int = 1):
+    """Publishes certs the way the leader does, in a secret referenced from the peer relation."""
+    secret_id = harness.add_model_secret(
+        "pvcviewer-operator",
+        {"cert": certs["cert"], "key": certs["key"], "ca-cert": certs["ca"]},
+    )
+    relation_id = harness.model.get_relation(PEER_RELATION_NAME).id
+    harness.update_relation_data(
+        relation_id,
+        "pvcviewer-operator",
+        {
+            "certs-secret-id": secret_id,
+            "certs-secret-revision": str(revision),
+            "certs-not-after": "2099-01-01T00:00:00+00:00",
+        },
+    )
+    return secret_id
+
+
+def test_non_leader_uses_shared_certs(
+    harness,
+    mocked_lightkube_client,
+    mocked_kubernetes_service_patch,
+    mocked_service_mesh_component,
+):
+    """Test that a non-leader unit runs the workload with the certs published by the leader."""
+    # Arrange
+    add_certs_secret(harness, {"cert": "shared-cert", "key": "shared-key", "ca": "shared-ca"})
+    harness.begin()
+    harness.set_can_connect("pvcviewer-operator", True)
+
     # Act
+    harness.charm.on.install.emit()
+
+    # Assert
+    container = harness.charm.unit.get_container("pvcviewer-operator")
+    assert container.get_service("pvcviewer-operator").is_running()
+    assert container.pull(f"{CERTS_FOLDER}/tls.crt").read() == "shared-cert"
+    assert container.pull(f"{CERTS_FOLDER}/tls.key").read() == "shared-key"
+    assert container.pull(f"{CERTS_FOLDER}/tls.ca").read() == "shared-ca"
+    # Only the leader manages the cluster-scoped resources
+    mocked_lightkube_client.apply.assert_not_called()
+
+
+def test_certs_pushed_only_on_revision_change(
+    harness,
+    mocked_lightkube_client,
+    mocked_kubernetes_service_patch,
+    mocked_service_mesh_component,
+):
+    """Test that cert files are pushed again only when the secret revision changes."""
+    # Arrange
+    secret_id = add_certs_secret(harness, {"cert": "cert-1", "key": "key-1", "ca": "ca-1"})
+    harness.set_leader(True)
     harness.begin()
+    harness.set_can_connect("pvcviewer-operator", True)
+    harness.charm.kubernetes_resources.get_status = MagicMock(return_value=ActiveStatus())
+    harness.charm.on.install.emit()
+    container = harness.charm.unit.get_container("pvcviewer-operator")
+    container.push = MagicMock(wraps=container.push)
+
+    # Act - nothing changed
+    harness.charm.on.config_changed.emit()
+
+    # Assert
+    container.push.assert_not_called()
+
+    # Act - the leader published a new revision
+    secret = harness.model.get_secret(id=secret_id)
+    secret.set_content({"cert": "cert-2", "key": "key-2", "ca-cert": "ca-2"})
+    relation_id = harness.model.get_relation(PEER_RELATION_NAME).id
+    harness.update_relation_data(relation_id, "pvcviewer-operator", {"certs-secret-revision": "2"})
+    harness.charm.on.config_changed.emit()
 
     # Assert
-    cert_attributes = ["cert", "ca", "key"]
+    assert container.push.call_count == 3
+    assert container.pull(f"{CERTS_FOLDER}/tls.crt").read() == "cert-2"
 
-    # Certs should be available
-    for attr in cert_attributes:
-        assert hasattr(harness.charm._stored, attr)
+
+def test_certs_rotation(
+    harness,
+    mocked_lightkube_client,
+    mocked_kubernetes_service_patch,
+    mocked_service_mesh_component,
+):
+    """Test certs close to expiry are rotated while the webhooks trust both the old and new CA."""
+    # Arrange
+    harness.set_leader(True)
+    harness.begin()
+    harness.set_can_connect("pvcviewer-operator", True)
+    harness.charm.kubernetes_resources.get_status = MagicMock(return_value=ActiveStatus())
+    harness.charm.on.install.emit()
+    certificates = harness.charm.certificates.component
+    container = harness.charm.unit.get_container("pvcviewer-operator")
+    old_cert, old_ca = certificates.cert, certificates.ca
+    relation_id = harness.model.get_relation(PEER_RELATION_NAME).id
+    harness.update_relation_data(
+        relation_id, "pvcviewer-operator", {"certs-not-after": "2000-01-01T00:00:00+00:00"}
+    )
+
+    # Act - rotation starts, with both CAs trusted but the old certificate still served
+    harness.charm.on.update_status.emit()
+
+    # Assert
+    context = harness.charm._get_kubernetes_resources_context()
+    ca_bundle = b64decode(context["cert"].strip("'")).decode()
+    assert old_ca in ca_bundle and ca_bundle != old_ca
+    assert certificates.cert == old_cert
+    assert container.pull(f"{CERTS_FOLDER}/tls.crt").read() == old_cert.strip()
+
+    # Act - the CA bundle has been applied, so the new certificate is served
+    harness.charm.on.update_status.emit()
+
+    # Assert
+    new_cert, new_ca = certificates.cert, certificates.ca
+    assert new_cert != old_cert
+    assert new_ca != old_ca and new_ca in ca_bundle
+    assert container.pull(f"{CERTS_FOLDER}/tls.crt").read() == new_cert.strip()
+    assert certificates.expires_at > datetime.now(timezone.utc)
+    secret_id = harness.get_relation_data(relation_id, "pvcviewer-operator")["certs-secret-id"]
+    secret = harness.model.get_secret(id=secret_id)
+    assert certificates.revision == secret.get_info().revision
+
+    # Act - every unit serves the new certificate, so the old CA is no longer trusted
+    harness.charm.on.update_status.emit()
+
+    # Assert
+    context = harness.charm._get_kubernetes_resources_context()
+    assert b64decode(context["cert"].strip("'")).decode() == new_ca
+    assert certificates.cert == new_cert
+
+
+@pytest.mark.parametrize(
+    "planned_units,expected_removed",
+    [
+        (1, False),  # scale down, other units keep using the resources
+        (0, True),  # application removal
+    ],
+)
+def test_remove_keeps_resources_on_scale_down(
+    harness,
+    mocked_lightkube_client,
+    mocked_kubernetes_service_patch,
+    planned_units,
+    expected_removed,
+):
+    """Test that shared resources are only removed together with the application."""
+    # Arrange
+    harness.set_leader(True)
+    harness.set_planned_units(planned_units)
+    harness.begin()
+    mocked_krh = MagicMock()
+    harness.charm.kubernetes_resources.component._get_kubernetes_resource_handler = MagicMock(
+        return_value=mocked_krh
+    )
+    mocked_policy_manager = MagicMock()
+    harness.charm.service_mesh.component._policy_resource_manager = mocked_policy_manager
+
+    # Act
+    harness.charm.on.remove.emit()
+
+    # Assert
+    assert mocked_krh.delete.called is expected_removed
+    assert mocked_policy_manager.reconcile.called is expected_removed
 
 
 @pytest.mark.parametrize(
@@ -197,7 +572,6 @@ def test_service_mesh_component_modes(
     harness.begin()
 
     # Mock components to be active
-    harness.charm.leadership_gate.get_status = MagicMock(return_value=ActiveStatus())
     harness.charm.kubernetes_resources.get_status = MagicMock(return_value=ActiveStatus())
 
     if has_relation:
@@ -250,7 +624,6 @@ def test_pebble_layer_environment(
     harness.set_can_connect("pvcviewer-operator", True)
 
     # Mock components
-    harness.charm.leadership_gate.get_status = MagicMock(return_value=ActiveStatus())
     harness.charm.kubernetes_resources.get_status = MagicMock(return_value=ActiveStatus())
 
     # Mock mesh mode
@@ -390,3 +763,341 @@ def test_gateway_metadata_relation_broken_returns_to_sidecar_mode(
     assert harness.charm.service_mesh.component.is_ambient_mesh_enabled() is False
     assert harness.charm.service_mesh.component.get_gateway_name() == "kubeflow-gateway"
     assert harness.charm.service_mesh.component.get_gateway_namespace() == "kubeflow"
+
+
+def test_pebble_layer_health_checks(
+    harness,
+    mocked_lightkube_client,
+    mocked_kubernetes_service_patch,
+    mocked_service_mesh_component,
+):
+    """Test that the pebble layer probes the controller and restarts it on liveness failure."""
+    # Arrange
+    harness.update_config({"health-check-period": "30s", "health-check-threshold": 5})
+    harness.set_leader(True)
+    harness.begin()
+    harness.set_can_connect("pvcviewer-operator", True)
+    harness.charm.kubernetes_resources.get_status = MagicMock(return_value=ActiveStatus())
+
+    # Act
+    harness.charm.on.install.emit()
+
+    # Assert
+    plan = harness.charm.unit.get_container("pvcviewer-operator").get_plan()
+    alive = plan.checks["pvcviewer-alive"]
+    ready = plan.checks["pvcviewer-ready"]
+    assert alive.level == CheckLevel.ALIVE
+    assert alive.http == {"url": "http://localhost:8081/healthz"}
+    assert ready.level == CheckLevel.READY
+    assert ready.http == {"url": "http://localhost:8081/readyz"}
+    for check in (alive, ready):
+        assert check.period == "30s"
+        assert check.threshold == 5
+    service = plan.services["pvcviewer-operator"]
+    assert service.on_check_failure == {"pvcviewer-alive": "restart"}
+
+
+@pytest.mark.parametrize(
+    "check_status,expected_status",
+    [
+        (CheckStatus.UP, ActiveStatus),
+        (CheckStatus.DOWN, WaitingStatus),
+    ],
+)
+def test_pebble_health_checks_status(
+    harness,
+    mocked_lightkube_client,
+    mocked_kubernetes_service_patch,
+    mocked_service_mesh_component,
+    check_status,
+    expected_status,
+):
+    """Test that the state of the Pebble health checks is reflected in the component status."""
+    # Arrange
+    harness.set_leader(True)
+    harness.begin()
+    harness.set_can_connect("pvcviewer-operator", True)
+    harness.charm.kubernetes_resources.get_status = MagicMock(return_value=ActiveStatus())
+    harness.charm.on.install.emit()
+
+    container = harness.charm.unit.get_container("pvcviewer-operator")
+    container.get_checks = MagicMock(
+        return_value={
+            name: CheckInfo(name=name, level=None, status=check_status)
+            for name in ["pvcviewer-alive", "pvcviewer-ready"]
+        }
+    )
+
+    # Act
+    status = harness.charm.pebble_service_container.component.get_status()
+
+    # Assert
+    assert isinstance(status, expected_status)
+
+
+def test_slo_alert_rules_rendered_from_config(
+    harness,
+    tmp_path,
+    mocked_lightkube_client,
+    mocked_kubernetes_service_patch,
+    mocked_service_mesh_component,
+):
+    """Test the SLO alert rules are rendered from the config, and resent only when changed."""
+    harness.begin()
+    rules_path = tmp_path / ALERT_RULES_DIR / SLO_ALERT_RULES_NAME
+
+    with patch.object(harness.charm.prometheus_provider, "set_scrape_job_spec") as set_spec:
+        harness.charm.on.config_changed.emit()
+        rules = yaml.safe_load(rules_path.read_text())["groups"][0]["rules"]
+        assert set_spec.call_count == 1
+        assert len(rules) == 8
+        assert 'le="0.5"' in rules[0]["expr"]
+        assert "> 0.144" in rules[0]["expr"]
+        # Sent along with the static rules, copied next to them
+        assert (tmp_path / ALERT_RULES_DIR / "KubeflowPvcviewerOperatorServices.rules").exists()
+
+        # Rendering the same rules again does not resend them
+        harness.charm.on.config_changed.emit()
+        assert set_spec.call_count == 1
+
+        harness.update_config(
+            {"webhook-latency-slo-seconds": 1.0, "workqueue-depth-alert-threshold": 500}
+        )
+        rules = yaml.safe_load(rules_path.read_text())["groups"][0]["rules"]
+        assert set_spec.call_count == 2
+        assert 'le="1"' in rules[0]["expr"]
+        assert rules[4]["expr"].startswith("workqueue_depth > 500 ")
+
+    assert isinstance(harness.charm.slo_alert_rules.status, ActiveStatus)
+
+
+def test_slo_alert_rules_invalid_config(
+    harness,
+    tmp_path,
+    mocked_lightkube_client,
+    mocked_kubernetes_service_patch,
+    mocked_service_mesh_component,
+):
+    """Test invalid SLO thresholds block the component and remove the rendered rules."""
+    harness.begin()
+    rules_path = tmp_path / ALERT_RULES_DIR / SLO_ALERT_RULES_NAME
+    harness.charm.on.config_changed.emit()
+    assert rules_path.exists()
+
+    with patch.object(harness.charm.prometheus_provider, "set_scrape_job_spec") as set_spec:
+        harness.update_config(
+            {"webhook-latency-slo-seconds": 0.3, "reconcile-error-slo-objective": 1.0}
+        )
+        assert set_spec.call_count == 1
+
+    assert not rules_path.exists()
+    assert (tmp_path / ALERT_RULES_DIR / "KubeflowPvcviewerOperatorServices.rules").exists()
+    status = harness.charm.slo_alert_rules.status
+    assert isinstance(status, BlockedStatus)
+    assert "webhook-latency-slo-seconds must be one of" in status.message
+    assert "reconcile-error-slo-objective must be between 0 and 1" in status.message
+
+
+@pytest.mark.parametrize(
+    "resources, threshold",
+    [
+        # 90% of the container limit
+        (ResourceRequirements(limits={"memory": "1Gi"}), 966367641),
+        # 90% of memory-alert-limit-bytes, without a limit
+        (ResourceRequirements(requests={"memory": "1Gi"}), 483183820),
+    ],
+)
+def test_slo_memory_alert_uses_container_limit(
+    harness,
+    tmp_path,
+    mocked_lightkube_client,
+    mocked_kubernetes_service_patch,
+    mocked_service_mesh_component,
+    resources,
+    threshold,
+):
+    """Test the memory alert threshold follows the memory limit of the workload container."""
+    pod = Pod(
+        spec=PodSpec(
+            containers=[
+                Container(name="charm"),
+                Container(name="pvcviewer-operator", resources=resources),
+            ]
+        )
+    )
+    mocked_lightkube_client.get.side_effect = lambda res, *args, **kwargs: (
+        pod if res is Pod else MagicMock()
+    )
+    harness.begin()
+
+    harness.charm.on.config_changed.emit()
+
+    rules_path = tmp_path / ALERT_RULES_DIR / SLO_ALERT_RULES_NAME
+    rules = yaml.safe_load(rules_path.read_text())["groups"][0]["rules"]
+    memory_rule = next(rule for rule in rules if rule["alert"] == "PvcviewerMemoryNearLimit")
+    assert memory_rule["expr"] == f"process_resident_memory_bytes > {threshold}"
+
+
+def test_alert_rules_kept_in_unit_state_dir(
+    tmp_path,
+    monkeypatch,
+    mocked_lightkube_client,
+    mocked_kubernetes_service_patch,
+    mocked_service_mesh_component,
+):
+    """Test the alert rules are gathered out of the charm directory, which upgrades replace."""
+    monkeypatch.setattr("charm.PvcViewer.charm_dir", tmp_path / "charm")
+    (tmp_path / "state").mkdir()
+    harness = Harness(PvcViewer)
+
+    harness.begin()
+
+    assert harness.charm.prometheus_provider._alert_rules_path == str(
+        tmp_path / "state" / ALERT_RULES_DIR
+    )
+    harness.cleanup()
+
+
+def test_charm_metrics_written_on_commit(
+    harness,
+    monkeypatch,
+    mocked_lightkube_client,
+    mocked_kubernetes_service_patch,
+    mocked_service_mesh_component,
+):
+    """Test the charm's own metrics are accumulated across dispatches and served by Pebble."""
+    # Arrange
+    monkeypatch.setenv("JUJU_DISPATCH_PATH", "hooks/install")
+    harness.set_leader(True)
+    harness.set_can_connect("pvcviewer-operator", True)
+    harness.begin()
+    harness.charm.kubernetes_resources.component._get_missing_kubernetes_resources = MagicMock(
+        return_value=[]
+    )
+    container = harness.charm.unit.get_container("pvcviewer-operator")
+    container.push(PYTHON_PATH, "", make_dirs=True)
+
+    # Act
+    harness.charm.on.install.emit()
+    harness.framework.commit()
+
+    # Assert
+    metrics = container.pull(CHARM_METRICS_PATH).read()
+    samples = dict(line.rsplit(" ", 1) for line in metrics.splitlines() if line[0] != "#")
+    assert samples['pvcviewer_charm_hook_duration_seconds_count{hook="install"}'] == "1.0"
+    assert (
+        samples[
+            "pvcviewer_charm_component_reconcile_duration_seconds_count"
+            '{component="kubernetes:auth-and-crds"}'
+        ]
+        == "1.0"
+    )
+    assert (
+        samples['pvcviewer_charm_kubernetes_api_requests_total{method="apply",result="success"}']
+        == "13.0"
+    )
+    expiry = float(samples["pvcviewer_charm_webhook_certificate_expiry_timestamp_seconds"])
+    assert expiry == harness.charm.certificates.component.expires_at.timestamp()
+    service = container.get_plan().services["charm-metrics"]
+    assert service.command == (
+        "/usr/bin/python3 -m http.server 8082 --directory /tmp/charm-metrics"
+    )
+    assert container.get_service("charm-metrics").is_running()
+
+    # Act - a later dispatch
+    monkeypatch.setenv("JUJU_DISPATCH_PATH", "hooks/update-status")
+    harness.framework.commit()
+
+    # Assert
+    metrics = container.pull(CHARM_METRICS_PATH).read()
+    assert 'pvcviewer_charm_hook_duration_seconds_count{hook="install"} 1.0' in metrics
+    assert 'pvcviewer_charm_hook_duration_seconds_count{hook="update-status"} 1.0' in metrics
+    assert "# TYPE pvcviewer_charm_kubernetes_api_requests_total counter" in metrics
+
+
+def test_charm_metrics_scraped_only_while_served(
+    harness,
+    mocked_lightkube_client,
+    mocked_kubernetes_service_patch,
+    mocked_service_mesh_component,
+):
+    """Test the charm's scrape job is only published while python3 serves its metrics."""
+    # Arrange
+    harness.set_leader(True)
+    harness.set_can_connect("pvcviewer-operator", True)
+    rel_id = harness.add_relation("metrics-endpoint", "prometheus-k8s")
+    harness.add_relation_unit(rel_id, "prometheus-k8s/0")
+    harness.begin()
+    container = harness.charm.unit.get_container("pvcviewer-operator")
+
+    def job_names():
+        jobs = json.loads(harness.get_relation_data(rel_id, harness.charm.app)["scrape_jobs"])
+        return [job.get("job_name") for job in jobs]
+
+    # Act - without python3 in the workload image
+    harness.charm.on.config_changed.emit()
+    harness.framework.commit()
+
+    # Assert
+    assert "charm-metrics" not in container.get_plan().services
+    assert "charm" not in job_names()
+
+    # Act - once python3 is found
+    container.push(PYTHON_PATH, "", make_dirs=True)
+    harness.framework.commit()
+
+    # Assert
+    assert container.get_service("charm-metrics").is_running()
+    assert "charm" in job_names()
+
+
+def test_charm_metrics_series_bounded(
+    harness,
+    mocked_lightkube_client,
+    mocked_kubernetes_service_patch,
+    mocked_service_mesh_component,
+):
+    """Test the totals keep a bounded number of label sets per family."""
+    harness.begin()
+    metrics = harness.charm.charm_metrics
+
+    for i in range(2 * MAX_SERIES_PER_FAMILY):
+        metrics.observe_duration("pvcviewer_charm_hook_duration_seconds", 0.1, hook=f"hook-{i}")
+    harness.framework.commit()
+
+    series = metrics._stored.samples["pvcviewer_charm_hook_duration_seconds"]
+    assert len(series) == MAX_SERIES_PER_FAMILY
+    # The _sum and _count samples of a label set are kept or dropped together
+    assert all(len(values) == 2 for values in series.values())
+
+
+def test_charm_metrics_kubernetes_list_timed_until_exhausted(
+    harness,
+    mocked_lightkube_client,
+    mocked_kubernetes_service_patch,
+    mocked_service_mesh_component,
+):
+    """Test generator calls of the Kubernetes client are recorded once iterated, errors too."""
+
+    # Arrange
+    def iter_resources(*args, **kwargs):
+        yield from ["a", "b"]
+
+    harness.begin()
+    client = harness.charm.charm_metrics.instrument_client(mocked_lightkube_client)
+    mocked_lightkube_client.list.side_effect = iter_resources
+    mocked_lightkube_client.get.side_effect = ValueError("not found")
+    recorded = harness.charm.charm_metrics._recorded
+
+    # Act
+    resources = client.list("Pod")
+    not_recorded = dict(recorded)
+    assert list(resources) == ["a", "b"]
+    with pytest.raises(ValueError):
+        client.get("Pod", "missing")
+
+    # Assert
+    requests_total = "pvcviewer_charm_kubernetes_api_requests_total"
+    assert not_recorded == {}
+    assert recorded[(requests_total, '{method="list",result="success"}', requests_total)] == 1
+    assert recorded[(requests_total, '{method="get",result="error"}', requests_total)] == 1
@@ -0,0 +1,137 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import re
+import timeit
+
+import pytest
+from charms.prometheus_k8s.v0.prometheus_scrape import PrometheusConfig
+from cosl import JujuTopology
+
+TOPOLOGY = JujuTopology(
+    model="kubeflow",
+    model_uuid="0f3e8c9a-5b1d-4c7e-9a2f-6d8b4e1c3a7f",
+    application="pvcviewer-operator",
+    charm_name="pvcviewer-operator",
+)
+
+
+def scrape_jobs(count: int) -> list:
+    """Returns jobs with a wildcard and a fully qualified target each."""
+    return [
+        {
+            "job_name": f"job-{i}",
+            "metrics_path": "/metrics",
+            "static_configs": [{"targets": ["*:8080", f"10.1.0.{i}:9090"]}],
+        }
+        for i in range(count)
+    ]
+
+
+def hosts(count: int) -> dict:
+    """Returns the hosts of a relation with the given number of units."""
+    return {f"pvcviewer-operator/{i}": (f"10.0.{i // 256}.{i % 256}", "") for i in range(count)}
+
+
+def upstream_expand(scrape_jobs, hosts, topology):
+    """The expansion of the published LIBPATCH 47, as a reference for the timing check."""
+    modified_scrape_jobs = []
+    for job in scrape_jobs:
+        static_configs = job.get("static_configs")
+        if not static_configs:
+            continue
+        non_wildcard_static_configs = []
+        for static_config in static_configs:
+            targets = static_config.get("targets")
+            if not targets:
+                continue
+            non_wildcard_targets = []
+            wildcard_targets = []
+            for target in targets:
+                match = re.compile(r"\*(?:(:\d+))?").match(target)
+                if match:
+                    wildcard_targets.append(target)
+                else:
+                    non_wildcard_targets.append(target)
+            if non_wildcard_targets:
+                non_wildcard_static_config = static_config.copy()
+                non_wildcard_static_config["targets"] = non_wildcard_targets
+                non_wildcard_static_config["labels"] = {
+                    **topology.label_matcher_dict,
+                    **non_wildcard_static_config.get("labels", {}),
+                }
+                non_wildcard_static_configs.append(non_wildcard_static_config)
+            if wildcard_targets:
+                for unit_name, (unit_hostname, unit_path) in hosts.items():
+                    modified_job = job.copy()
+                    modified_job["static_configs"] = [static_config.copy()]
+                    modified_static_config = modified_job["static_configs"][0]
+                    modified_static_config["targets"] = [
+                        target.replace("*", unit_hostname) for target in wildcard_targets
+                    ]
+                    unit_num = unit_name.split("/")[-1]
+                    job_name = modified_job.get("job_name", "unnamed-job") + "-" + unit_num
+                    modified_job["job_name"] = job_name
+                    modified_job["metrics_path"] = unit_path + (
+                        job.get("metrics_path") or "/metrics"
+                    )
+                    modified_static_config["labels"] = {
+                        **topology.label_matcher_dict,
+                        **{"juju_unit": unit_name},
+                        **modified_static_config.get("labels", {}),
+                    }
+                    modified_job["relabel_configs"] = modified_job.get("relabel_configs", []) + [
+                        PrometheusConfig.topology_relabel_config_wildcard
+                    ]
+                    modified_scrape_jobs.append(modified_job)
+        if non_wildcard_static_configs:
+            modified_job = job.copy()
+            modified_job["static_configs"] = non_wildcard_static_configs
+            modified_job["metrics_path"] = modified_job.get("metrics_path") or "/metrics"
+            modified_job["relabel_configs"] = modified_job.get("relabel_configs", []) + [
+                PrometheusConfig.topology_relabel_config
+            ]
+            modified_scrape_jobs.append(modified_job)
+    return modified_scrape_jobs
+
+
+def test_expand_wildcard_targets():
+    jobs = PrometheusConfig.expand_wildcard_targets_into_individual_jobs(
+        scrape_jobs(1), hosts(2), TOPOLOGY
+    )
+
+    assert [job["job_name"] for job in jobs] == ["job-0-0", "job-0-1", "job-0"]
+    assert jobs[1]["static_configs"] == [
+        {
+            "targets": ["10.0.0.1:8080"],
+            "labels": {**TOPOLOGY.label_matcher_dict, "juju_unit": "pvcviewer-operator/1"},
+        }
+    ]
+    assert jobs[1]["relabel_configs"] == [PrometheusConfig.topology_relabel_config_wildcard]
+    assert jobs[2]["static_configs"] == [
+        {"targets": ["10.1.0.0:9090"], "labels": TOPOLOGY.label_matcher_dict}
+    ]
+    assert jobs[2]["relabel_configs"] == [PrometheusConfig.topology_relabel_config]
+
+
+def test_expand_wildcard_targets_over_many_units():
+    """Expands 10 jobs over 1000 units."""
+    jobs, units = scrape_jobs(10), hosts(1000)
+
+    expanded = PrometheusConfig.expand_wildcard_targets_into_individual_jobs(jobs, units, TOPOLOGY)
+
+    # A job per unit and wildcard job, and a job per job for the fully qualified targets
+    assert len(expanded) == 10 * 1000 + 10
+
+
+@pytest.mark.slow
+def test_expand_wildcard_targets_faster_than_upstream():
+    """Expanding 10 jobs over 1000 units takes at most half the time of the published version."""
+    jobs, units = scrape_jobs(10), hosts(1000)
+    expand = PrometheusConfig.expand_wildcard_targets_into_individual_jobs
+    assert expand(jobs, units, TOPOLOGY) == upstream_expand(jobs, units, TOPOLOGY)
+
+    def best_time(expand) -> float:
+        return min(timeit.repeat(lambda: expand(jobs, units, TOPOLOGY), number=1, repeat=5))
+
+    assert best_time(expand) < best_time(upstream_expand) / 2